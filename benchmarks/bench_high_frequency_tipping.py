@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the array based HighFrequencyTipping engine against the
+while-loop walk it replaced.
+
+Run from the repository root with:
+    python benchmarks/bench_high_frequency_tipping.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import RainDataChecks as rdc
+from generators import raw_tips
+
+def loop_high_frequency_tipping(rain_data):
+    "The previous implementation, walking the sub 5 s sequence after each lambda sub k jump"
+    InterTipTimes = rain_data.index.to_series().diff() / pd.Timedelta('1s')
+    InterTipTimes = np.floor(InterTipTimes)
+    HighFrequencyTips = np.zeros(len(InterTipTimes), dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        LambdaSubK = np.log(InterTipTimes / InterTipTimes.shift(1)).abs()
+    SubThresholdInterTipTimesBoolean = InterTipTimes < 5
+    for index in np.flatnonzero(LambdaSubK > 5):
+        NoOfSubThresholdTripTimes = 0
+        while index + NoOfSubThresholdTripTimes < len(SubThresholdInterTipTimesBoolean) and \
+                SubThresholdInterTipTimesBoolean.iloc[index + NoOfSubThresholdTripTimes]:
+            NoOfSubThresholdTripTimes = NoOfSubThresholdTripTimes + 1
+        HighFrequencyTips[index:index + NoOfSubThresholdTripTimes] = True
+    return HighFrequencyTips
+
+def main(sizes=(10**5, 10**6, 10**7)):
+    print(f"{'tips':>10} {'loop (s)':>10} {'array (s)':>10} {'speed up':>9}")
+    for n_tips in sizes:
+        rain_data = raw_tips(n_tips)
+
+        start = time.perf_counter()
+        Expected = loop_high_frequency_tipping(rain_data)
+        LoopTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        Result = rdc.HighFrequencyTipping(rain_data)
+        ArrayTime = time.perf_counter() - start
+
+        assert np.array_equal(Result.HighFrequencyTips.to_numpy(), Expected)
+        print(f"{n_tips:>10} {LoopTime:>10.3f} {ArrayTime:>10.3f} {LoopTime / ArrayTime:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the cold start of a worker: the time to import each module, and to
+import and run a light check, in a fresh interpreter. It also reports whether
+scipy was imported, which only the checks that need it should do.
+
+Run from the repository root with:
+    python benchmarks/bench_import_time.py
+"""
+
+import os
+import subprocess
+import sys
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+STATEMENTS = {
+    'numpy + pandas': 'import numpy, pandas',
+    'RainDataChecks': 'import RainDataChecks',
+    'BatchChecks': 'import BatchChecks',
+    'CheckRegistry': 'import CheckRegistry',
+    'impossibles from the registry': "import CheckRegistry, pandas; "
+                                     "CheckRegistry.run_checks('light', rain_data=pandas.DataFrame({'Rainfall': [0.0, 0.2]}, "
+                                     "index=pandas.date_range('2000', periods=2, freq='h')))",
+    }
+
+TIMER = """
+import sys, time
+sys.path.insert(0, {source!r})
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start, 'scipy' in sys.modules)
+"""
+
+def cold_start(statement, repeats=5):
+    "The fastest time to run a statement in a fresh interpreter, and whether it imported scipy"
+    Times = []
+    for _ in range(repeats):
+        Output = subprocess.run([sys.executable, '-c', TIMER.format(source=SOURCE, statement=statement)],
+                                capture_output=True, text=True, check=True).stdout.split()
+        Times.append(float(Output[0]))
+    return min(Times), Output[1] == 'True'
+
+def main():
+    print(f"{'statement':>30} {'time (s)':>9} {'scipy':>6}")
+    for name, statement in STATEMENTS.items():
+        Seconds, Scipy = cold_start(statement)
+        print(f"{name:>30} {Seconds:>9.3f} {str(Scipy):>6}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of impossibles on float and object columns, against the previous
+per-element implementation.
+
+Run from the repository root with:
+    python benchmarks/bench_impossibles.py
+"""
+
+import numbers
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import RainDataChecks as rdc
+from generators import regular_rain, object_rain
+
+def loop_impossibles(rain_data):
+    "The previous implementation, without its precision test"
+    NotANumber = ~np.array([isinstance(item, numbers.Number) for item in rain_data.values[:, 0]])
+    Sub_zeros = rain_data.apply(pd.to_numeric, errors='coerce') < 0
+    return Sub_zeros.Rainfall.to_numpy() | NotANumber
+
+def main(n_rows=10**7):
+    print(f"{'input':>8} {'previous (s)':>13} {'current (s)':>12} {'with precision (s)':>19}")
+    for as_object in (False, True):
+        rain_data = object_rain(n_rows) if as_object else regular_rain(n_rows)
+
+        start = time.perf_counter()
+        Expected = loop_impossibles(rain_data)
+        PreviousTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        Result = rdc.impossibles(rain_data)
+        CurrentTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rdc.impossibles(rain_data, minimum_precision=0.2)
+        PrecisionTime = time.perf_counter() - start
+
+        assert np.array_equal(Result.Impossible.to_numpy(), Expected)
+        print(f"{'object' if as_object else 'float':>8} {PreviousTime:>13.3f} {CurrentTime:>12.3f} {PrecisionTime:>19.3f}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10**7)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded synthetic rainfall generators for the benchmarks.
+
+Every generator takes a seed, so the same call always gives the same data.
+"""
+
+import numpy as np
+import pandas as pd
+
+def raw_tips(n_tips, seed=0, burst_rate=0.001):
+    """Raw tip times with bursts of sub 5 s tips injected
+
+    Inter-tip times are 30 s to half an hour, and after roughly one tip in
+    1/burst_rate a burst of 5 to 30 rapid tips is injected. The tips start in
+    1700 so that 10^7 of them fit in the range of pandas time stamps.
+    """
+    rng = np.random.default_rng(seed)
+    InterTipTimes = rng.integers(30, 1800, n_tips).astype('int64')
+    BurstStarts = np.flatnonzero(rng.random(n_tips) < burst_rate)
+    for Start in BurstStarts:
+        InterTipTimes[Start:Start + rng.integers(5, 30)] = rng.integers(0, 5)
+    Index = pd.DatetimeIndex(np.datetime64('1700-01-01') + np.cumsum(InterTipTimes).astype('timedelta64[s]'), name='DateTime')
+    return pd.DataFrame({'Rainfall': 0.2}, index=Index)
+
+def regular_rain(n_rows, freq='h', seed=0, wet_fraction=0.1, dry_spells=True, repeats=True, resolution=0.2):
+    """Rain on a regular time grid, rounded to the gauge resolution
+
+    Optionally with long dry spells (about one per 2000 rows, of up to 60 days)
+    and runs of repeated wet values injected.
+    """
+    rng = np.random.default_rng(seed)
+    Wet = rng.random(n_rows) < wet_fraction
+    Rainfall = np.round(rng.gamma(0.5, 4, n_rows) * Wet / resolution) * resolution
+    Index = pd.date_range('1900-01-01', periods=n_rows, freq=freq, name='DateTime')
+    StepsPerDay = max(1, int(pd.Timedelta('1d') / pd.Timedelta(Index.freq)))
+    if dry_spells:
+        for Start in np.flatnonzero(rng.random(n_rows) < 1 / 2000):
+            Rainfall[Start:Start + rng.integers(5, 60) * StepsPerDay] = 0
+    if repeats:
+        for Start in np.flatnonzero(rng.random(n_rows) < 1 / 5000):
+            Rainfall[Start:Start + rng.integers(3, 20)] = rng.integers(1, 20) * resolution
+    return pd.DataFrame({'Rainfall': Rainfall}, index=Index)
+
+def object_rain(n_rows, seed=0):
+    "Regular rain in an object column, with a few negative values and strings"
+    rng = np.random.default_rng(seed)
+    Rainfall = regular_rain(n_rows, seed=seed)
+    Values = Rainfall.Rainfall.to_numpy().astype(object)
+    Values[rng.random(n_rows) < 0.0001] = -1
+    Values[rng.random(n_rows) < 0.0001] = 'missing'
+    return pd.DataFrame({'Rainfall': Values}, index=Rainfall.index)
+
+def network(n_stations, n_rows, freq='h', seed=0, correlation=0.8, missing=0.01):
+    """A correlated multi-station network and its station coordinates
+
+    Each station mixes a shared regional rain signal with its own, in proportion to
+    its correlation, and has gaps of missing data.
+
+    Returns a wide DataFrame with a column per station, and a DataFrame of
+    planar coordinates (in metres) indexed by station.
+    """
+    rng = np.random.default_rng(seed)
+    Index = pd.date_range('1990-01-01', periods=n_rows, freq=freq, name='DateTime')
+    Regional = rng.gamma(0.5, 4, n_rows) * (rng.random(n_rows) < 0.1)
+    Stations = {}
+    for station in range(n_stations):
+        Local = rng.gamma(0.5, 4, n_rows) * (rng.random(n_rows) < 0.1)
+        Rainfall = np.round((correlation * Regional + (1 - correlation) * Local) / 0.2) * 0.2
+        Rainfall[rng.random(n_rows) < missing] = np.nan
+        Stations[f'Station{station}'] = Rainfall
+    Coordinates = pd.DataFrame(rng.random((n_stations, 2)) * 200000, index=list(Stations), columns=['Easting', 'Northing'])
+    return pd.DataFrame(Stations, index=Index), Coordinates
+
+def daily_flow(rain_data, seed=0):
+    "A daily 'Streamflow' series responding to the daily rain"
+    rng = np.random.default_rng(seed)
+    Daily = rain_data.iloc[:, 0].resample('d').sum()
+    Flow = 10 + 3 * Daily.rolling(2, min_periods=1).mean() + rng.random(len(Daily))
+    return Flow.to_frame(name='Streamflow')
+
+def daily_temperature(rain_data, seed=0):
+    "A daily 'TMax' series with a seasonal cycle that dips below zero in winter"
+    rng = np.random.default_rng(seed)
+    Index = pd.date_range(rain_data.index[0].normalize(), rain_data.index[-1], freq='d', name='DateTime')
+    TMax = 12 + 12 * np.sin(2 * np.pi * Index.dayofyear / 365) + rng.normal(0, 3, len(Index))
+    return pd.DataFrame({'TMax': TMax}, index=Index)
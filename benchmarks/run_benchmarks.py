@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Times every public check on seeded synthetic data at several sizes, and records
+the peak memory allocated (with tracemalloc) by each.
+
+Results are written as JSON to benchmarks/results/<label>.json, where the label
+defaults to the current git commit, so two commits can be compared with --compare.
+
+Run from the repository root with:
+    python benchmarks/run_benchmarks.py [--sizes 10000 100000] [--checks DrySpells ...]
+    python benchmarks/run_benchmarks.py --compare results/abc1234.json results/def5678.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import NetworkChecks
+import ParallelChecks
+import RainDataChecks as rdc
+import generators
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), 'results')
+
+def _pair(n_rows):
+    "Test and reference single column DataFrames from a correlated network"
+    Network, _ = generators.network(2, n_rows)
+    return (Network[['Station0']].rename(columns={'Station0': 'Rainfall'}),
+            Network[['Station1']].rename(columns={'Station1': 'Rainfall'}))
+
+def _neighbours(n_rows):
+    "A test single column DataFrame and a wide DataFrame of references from a correlated network"
+    Network, _ = generators.network(9, n_rows)
+    return Network[['Station0']].rename(columns={'Station0': 'Rainfall'}), Network.iloc[:, 1:]
+
+def _segmented_without_halos(check, rain_data, segments=8):
+    "run_segmented on a record without any runs to resolve, asserting that no segment is extended past its two lead-in rows"
+    for First, Last, start, stop in ParallelChecks._segments(check, rain_data, segments, {}):
+        assert start - First <= 2 and Last == stop, (First, Last, start, stop)
+    return ParallelChecks.run_segmented(check, rain_data, segments=segments)
+
+def _manual_daily_pair(n_rows):
+    "A daily gauge read at 9 am and an hourly reference"
+    Test, Reference = _pair(n_rows)
+    Daily = Test.resample('1d', offset='9h', closed='right', label='right').sum()
+    return Daily, Reference
+
+#Each case is a name, a function making the arguments for a given size, and the check to run on them
+CASES = [
+    ('rain_outliers', lambda n: (generators.regular_rain(n),), rdc.rain_outliers),
+    ('impossibles', lambda n: (generators.regular_rain(n),), rdc.impossibles),
+    ('impossibles[object]', lambda n: (generators.object_rain(n),), rdc.impossibles),
+    ('DateTimeIssues', lambda n: (generators.regular_rain(n),), rdc.DateTimeIssues),
+    ('HighFrequencyTipping', lambda n: (generators.raw_tips(n),), rdc.HighFrequencyTipping),
+    ('DrySpells', lambda n: (generators.regular_rain(n),), rdc.DrySpells),
+    ('run_segmented[DrySpells]', lambda n: ('DrySpells', generators.regular_rain(n)), ParallelChecks.run_segmented),
+    ('run_segmented[HighFrequencyTipping]', lambda n: ('HighFrequencyTipping', generators.raw_tips(n)), ParallelChecks.run_segmented),
+    ('run_segmented[no-burst tips]', lambda n: ('HighFrequencyTipping', generators.raw_tips(n, burst_rate=0)),
+     _segmented_without_halos),
+    ('RepeatedValues', lambda n: (generators.regular_rain(n),), rdc.RepeatedValues),
+    ('Homogeneity', lambda n: (generators.regular_rain(n),), rdc.Homogeneity),
+    ('SubFreezingRain', lambda n: (lambda rain: (rain, generators.daily_temperature(rain)))(generators.regular_rain(n)), rdc.SubFreezingRain),
+    ('RelatedFlowEvents', lambda n: (lambda rain: (rain, generators.daily_flow(rain)))(generators.regular_rain(n)), rdc.RelatedFlowEvents),
+    ('affinity', _pair, rdc.affinity),
+    ('spearman', _pair, rdc.spearman),
+    ('neighborhoodDivergence', _pair, rdc.neighborhoodDivergence),
+    ('DrySpellDivergence', _pair, rdc.DrySpellDivergence),
+    ('neighborhoodConsensus[8 references]', _neighbours, rdc.neighborhoodConsensus),
+    ('TimeStepAllignment', _manual_daily_pair, rdc.TimeStepAllignment),
+    ('StationPair.all_checks', _pair, lambda test, reference: rdc.StationPair(test, reference).all_checks()),
+    ('affinity_matrix[20 stations]', lambda n: (generators.network(20, n // 20)[0],), NetworkChecks.affinity_matrix),
+    ('rank_references[20 stations]', lambda n: generators.network(20, n // 20), NetworkChecks.rank_references),
+    ]
+
+def time_case(check, args, repeats):
+    "The fastest of several runs, in seconds, and the peak memory allocated in one more run, in bytes"
+    Times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        check(*args)
+        Times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    check(*args)
+    _, Peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(Times), Peak
+
+def git_commit():
+    "The short hash of the current commit, or None outside a git repository"
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, checks=None, repeats=3):
+    "Runs the benchmarks, printing each result as it is made, and returns them all"
+    Results = []
+    for name, make_args, check in CASES:
+        if checks and name not in checks:
+            continue
+        for size in sizes:
+            args = make_args(size)
+            try:
+                Seconds, PeakBytes = time_case(check, args, repeats)
+            except Exception as error:
+                print(f"{name:>36} {size:>10} failed: {type(error).__name__}: {error}")
+                Results.append({'check': name, 'size': size, 'error': f"{type(error).__name__}: {error}"})
+                continue
+            print(f"{name:>36} {size:>10} {Seconds:>10.4f} s {PeakBytes / 2**20:>10.1f} MiB")
+            Results.append({'check': name, 'size': size, 'seconds': Seconds, 'peak_bytes': PeakBytes})
+    return Results
+
+def compare(old_path, new_path, threshold=1.1):
+    "Prints the ratio of new to old time and memory for every benchmark in both files"
+    with open(old_path) as file:
+        Old = {(result['check'], result['size']): result for result in json.load(file)['results']}
+    with open(new_path) as file:
+        New = {(result['check'], result['size']): result for result in json.load(file)['results']}
+    print(f"{'check':>36} {'size':>10} {'time':>8} {'memory':>8}")
+    for key in sorted(set(Old) & set(New)):
+        if 'seconds' not in Old[key] or 'seconds' not in New[key]:
+            continue
+        TimeRatio = New[key]['seconds'] / Old[key]['seconds']
+        MemoryRatio = New[key]['peak_bytes'] / max(Old[key]['peak_bytes'], 1)
+        Flag = '  slower' if TimeRatio > threshold else ''
+        Flag += '  bigger' if MemoryRatio > threshold else ''
+        print(f"{key[0]:>36} {key[1]:>10} {TimeRatio:>7.2f}x {MemoryRatio:>7.2f}x{Flag}")
+
+def main():
+    Parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    Parser.add_argument('--sizes', type=int, nargs='+', default=[10**4, 10**5, 10**6])
+    Parser.add_argument('--checks', nargs='+', help='only run these checks')
+    Parser.add_argument('--repeats', type=int, default=3)
+    Parser.add_argument('--label', help='the results file name, by default the git commit')
+    Parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files')
+    Arguments = Parser.parse_args()
+
+    if Arguments.compare:
+        compare(*Arguments.compare)
+        return
+
+    Results = run(Arguments.sizes, Arguments.checks, Arguments.repeats)
+    Commit = git_commit()
+    Label = Arguments.label or Commit or time.strftime('%Y%m%dT%H%M%S')
+    os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+    Path = os.path.join(RESULTS_DIRECTORY, f'{Label}.json')
+    with open(Path, 'w') as file:
+        json.dump({'commit': Commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                   'numpy': np.__version__, 'pandas': pd.__version__, 'results': Results}, file, indent=1)
+    print(f"Results written to {Path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,809 @@
+# -*- coding: utf-8 -*-
+"""
+The array-level core of the rainfall checks.
+
+Each check takes its time stamps and values as arrays and returns NumPy arrays,
+so data already held as NumPy or Arrow arrays is checked without building
+DataFrames, copying indices or merging. Time stamps are int64 nanoseconds since
+the epoch, or any datetime64 array, Arrow timestamp array or pandas index,
+which are viewed rather than copied where their memory allows. The pandas
+checks in RainDataChecks are thin wrappers around these functions.
+
+The pairwise checks align the test and reference on their common time stamps
+with a binary search, so both must be sorted and unique.
+"""
+
+import decimal
+import math
+
+import numpy as np
+import pandas as pd
+
+import Pettitt
+from TimeBase import analyse
+from RunLengths import run_length_encode, per_observation
+
+def _as_numpy(data) -> np.ndarray:
+    "A NumPy array of an array, Arrow array or pandas object, sharing its memory where possible"
+    if isinstance(data, np.ndarray):
+        return data
+    if type(data).__module__.split('.')[0] == 'pyarrow':
+        #Arrow arrays without nulls are viewed, and a chunked array is only copied if it has several chunks
+        Chunks = data.chunks if hasattr(data, 'chunks') else [data]
+        if len(Chunks) == 1:
+            return Chunks[0].to_numpy(zero_copy_only=False)
+        return np.concatenate([chunk.to_numpy(zero_copy_only=False) for chunk in Chunks])
+    if hasattr(data, 'to_numpy'):
+        return data.to_numpy()
+    return np.asarray(data)
+
+def as_times(timestamps) -> np.ndarray:
+    """int64 nanoseconds since the epoch, from int64 or datetime64 arrays, Arrow timestamps or a pandas index
+
+    datetime64[ns] and int64 memory is viewed rather than copied. Timezone aware
+    pandas and Arrow times give UTC.
+    """
+    if hasattr(timestamps, 'asi8'):
+        return timestamps.asi8
+    if hasattr(getattr(timestamps, 'array', None), 'asi8'):
+        return timestamps.array.asi8
+    Times = _as_numpy(timestamps)
+    if Times.dtype.kind == 'M':
+        if Times.dtype != np.dtype('datetime64[ns]'):
+            Times = Times.astype('datetime64[ns]')
+        return Times.view(np.int64)
+    return np.asarray(Times, dtype=np.int64)
+
+def as_values(values, dtype=None) -> np.ndarray:
+    "A NumPy array of values from a NumPy or Arrow array or a pandas object, viewed rather than copied where possible"
+    return np.asarray(_as_numpy(values), dtype=dtype)
+
+def _sorted_unique(times: np.ndarray, name: str) -> np.ndarray:
+    "Raises a ValueError unless the time stamps are sorted and unique"
+    if len(times) > 1 and not (np.diff(times) > 0).all():
+        raise ValueError(f"The {name} time stamps must be sorted and unique")
+    return times
+
+def _outlier_threshold(values: np.ndarray) -> float:
+    "The ninety-ninth percentile of the values above 0.2"
+    return np.quantile(values[values > 0.2], 0.99)
+
+def outlier_index(values, ninety_ninth: float = None) -> np.ndarray:
+    """The ratio of each value to the ninety-ninth percentile of the values above 0.2, to one decimal place
+
+    The percentile is of the values given unless ``ninety_ninth`` is, and the index is
+    nan for fewer than 100 values.
+    """
+    Values = as_values(values)
+    if ninety_ninth is None:
+        if len(Values) < 100:
+            return np.full(Values.shape, np.nan)
+        ninety_ninth = _outlier_threshold(Values)
+    return np.round(Values / ninety_ninth, 1)
+
+def _decimal_places(value: float) -> int:
+    "The number of decimal places in the shortest representation of a number"
+    return max(0, -decimal.Decimal(repr(float(value))).as_tuple().exponent)
+
+def impossible(values, minimum_precision: float = float('nan')) -> np.ndarray:
+    """True for values that are not numbers (but not nan), are negative, or are not a multiple of the minimum precision
+
+    Values that pd.to_numeric can't convert are not numbers. Numeric arrays skip the
+    type test, and the precision test is done exactly on values scaled to integers
+    (e.g. tenths of a mm). Infinite values are never a multiple of the precision.
+    """
+    Values = as_values(values)
+
+    #Test for non-numbers, but don't include nan's. A numeric array can't have any.
+    if Values.dtype.kind in 'biuf':
+        NotANumber = np.zeros(len(Values), dtype=bool)
+        Values = Values.astype(float, copy=False)
+    else:
+        Missing = pd.isna(Values)
+        Values = pd.to_numeric(Values, errors='coerce').astype(float)
+        NotANumber = np.isnan(Values) & ~Missing
+
+    #Test for numeric values less than 0
+    with np.errstate(invalid='ignore'):
+        ImpossibleData = NotANumber | (Values < 0)
+
+    #Test for numeric values that are not multiples of the minimum precision.
+    #Values are scaled to int64 counts of the precision's last decimal place, so the test is exact.
+    if not(math.isnan(minimum_precision)) and (minimum_precision > 0):
+        Scale = 10 ** _decimal_places(minimum_precision)
+        PrecisionUnits = int(round(minimum_precision * Scale))
+        ImpossibleData |= np.isinf(Values)
+        Finite = np.isfinite(Values)
+        Scaled = Values[Finite] * Scale
+        Units = np.round(Scaled).astype(np.int64)
+        False_precision = (np.abs(Scaled - Units) > 1e-6) | (Units % PrecisionUnits != 0)
+        ImpossibleData[Finite] |= False_precision
+
+    return ImpossibleData
+
+def duplicate_times(timestamps) -> np.ndarray:
+    "True for every time stamp that occurs more than once"
+    Times = as_times(timestamps)
+    Steps = np.diff(Times)
+    if (Steps >= 0).all():
+        #Sorted time stamps are duplicated where they equal a neighbour
+        Same = Steps == 0
+        Duplicated = np.zeros(len(Times), dtype=bool)
+        Duplicated[1:] |= Same
+        Duplicated[:-1] |= Same
+        return Duplicated
+    _, Inverse, Counts = np.unique(Times, return_inverse=True, return_counts=True)
+    return Counts[Inverse] > 1
+
+def _inter_tip_seconds(times: np.ndarray) -> np.ndarray:
+    """Whole seconds between consecutive int64 time stamps, with nan for the first."""
+    InterTipTimes = np.full(len(times), np.nan)
+    if len(times) > 1:
+        InterTipTimes[1:] = np.floor_divide(np.diff(times), 10**9)
+    return InterTipTimes
+
+def _high_frequency_tips(inter_tip_times: np.ndarray, inter_tip_threshold: float = 5,
+                         lambda_threshold: float = 5, min_burst_length: int = 1) -> np.ndarray:
+    """Flags bursts of rapid tips that follow a sudden change in tip rate.
+
+    A burst is the run of consecutive inter-tip times below ``inter_tip_threshold``
+    that starts at an observation whose lambda sub k statistic exceeds
+    ``lambda_threshold`` and continues to the end of that run. All bursts are
+    found in one pass by giving each sub-threshold run an ID and counting the
+    jumps seen so far within it.
+
+    Parameters
+    ----------
+    inter_tip_times : np.ndarray
+        Inter-tip times in seconds, nan where unknown.
+    inter_tip_threshold : float, optional
+        Inter-tip times (s) below this are considered rapid. The default is 5.
+    lambda_threshold : float, optional
+        Lambda sub k values above this mark a sudden change in tip rate. The default is 5.
+    min_burst_length : int, optional
+        The minimum number of rapid tips needed for a burst to be flagged. The default is 1.
+
+    Returns
+    -------
+    np.ndarray
+        A boolean array, True for tips within a burst.
+
+    """
+    inter_tip_times = np.asarray(inter_tip_times, dtype=float)
+    n = len(inter_tip_times)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+
+    #Calculate the lambda sub k statistic. This is a measure of the rate of change of inter-tip times
+    LambdaSubK = np.full(n, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        LambdaSubK[1:] = np.abs(np.log(inter_tip_times[1:] / inter_tip_times[:-1]))
+    RapidTipRateChanges = LambdaSubK > lambda_threshold
+
+    SubThreshold = inter_tip_times < inter_tip_threshold
+    if not SubThreshold.any():
+        return np.zeros(n, dtype=bool)
+
+    #Give every run of sub-threshold inter-tip times its own ID
+    RunStarts = SubThreshold & ~np.concatenate(([False], SubThreshold[:-1]))
+    RunIDs = np.cumsum(RunStarts) - 1
+
+    #Count the rate changes seen so far, and the count just before each run began,
+    #so that a tip is in a burst if a rate change has occurred earlier in its run
+    JumpCounts = np.cumsum(RapidTipRateChanges & SubThreshold)
+    CountsBeforeRun = (JumpCounts - (RapidTipRateChanges & SubThreshold))[RunStarts]
+    InBurst = SubThreshold & (JumpCounts > CountsBeforeRun[np.maximum(RunIDs, 0)])
+
+    #Drop any burst that is shorter than the minimum burst length
+    if min_burst_length > 1:
+        BurstLengths = np.bincount(RunIDs[InBurst], minlength=len(CountsBeforeRun))
+        InBurst &= BurstLengths[np.maximum(RunIDs, 0)] >= min_burst_length
+
+    return InBurst
+
+def high_frequency_tips(timestamps, inter_tip_threshold: float = 5, lambda_threshold: float = 5,
+                        min_burst_length: int = 1) -> np.ndarray:
+    "True for the tips of bursts of rapid tipping, from the tip times; see ``_high_frequency_tips()``"
+    return _high_frequency_tips(_inter_tip_seconds(as_times(timestamps)), inter_tip_threshold = inter_tip_threshold,
+                                lambda_threshold = lambda_threshold, min_burst_length = min_burst_length)
+
+def dry_spell_day_lengths(timestamps, values) -> np.ndarray:
+    "The length in whole days of the dry spell each zero value is within, and 0 for other values"
+    Times = as_times(timestamps)
+
+    #Run-length-encode whether each observation is dry
+    Runs = run_length_encode(as_values(values) == 0)
+
+    #Get the length in whole days from the start to the end date time of each run
+    RunTimeLength = np.floor_divide(Times[Runs.ends] - Times[Runs.starts], 86400 * 10**9)
+
+    #Give every dry observation the day length of its run, and all non-zero rainfalls 0
+    return per_observation(Runs, np.where(Runs.values, RunTimeLength, 0)).astype(float)
+
+def repeated_values(values) -> np.ndarray:
+    "The number of consecutive times each positive value is repeated, and 0 for zero, negative and nan values"
+    Runs = run_length_encode(as_values(values))
+    with np.errstate(invalid='ignore'):
+        WetRuns = Runs.values > 0
+    return per_observation(Runs, np.where(WetRuns, Runs.lengths, 0)).astype(float)
+
+def _year_starts(base) -> tuple:
+    "The calendar years of a regular time base and the position each starts at, followed by its length"
+    First = np.datetime64(base.start, 'ns').astype('datetime64[Y]')
+    Last = np.datetime64(base.start + (base.length - 1) * base.step, 'ns').astype('datetime64[Y]')
+    Years = np.arange(First, Last + 1)
+    Starts = base.first_positions_at_or_after(Years[1:].astype('datetime64[ns]').view(np.int64))
+    return Years, np.concatenate(([0], Starts, [base.length]))
+
+def homogeneous(timestamps, values, alpha: float = 0.05, permutations: int = 0, seed = None,
+                base = None) -> np.ndarray:
+    """False for the years before the most recent homogeneous section of the annual totals
+
+    Years are those of the time stamps as given, so local years need local times. Years
+    with fewer than 96 % of their observations are left out of the Pettitt test. The
+    result is nan for fewer than 100 observations.
+
+    Parameters
+    ----------
+    base : TimeBase, optional
+        The ``analyse()`` of the time stamps, if already made.
+
+    """
+    Times = as_times(timestamps)
+    Values = as_values(values, dtype=float)
+    if len(Times) < 100:
+        return np.full(len(Times), np.nan)
+    Homogeneous = np.ones(len(Times), dtype=bool)
+    Observed = ~np.isnan(Values)
+    ObservedValues = np.where(Observed, Values, 0)
+
+    #Total each year with at least 96 % of a year (i.e. 11 and a half months) of observations at the typical time step,
+    #rather than that of the first two observations, which may be a gap or a duplicate
+    Base = analyse(Times) if base is None else base
+    Step = Base.step if Base.regular else _time_step(Times)
+    MinCount = int(0.96 * 365 * 86400 / (max(Step, 1) / 1e9))
+    if Base.regular:
+        #On a regular grid each year is the rows between its start positions
+        _, YearStarts = _year_starts(Base)
+        Totals = np.add.reduceat(ObservedValues, YearStarts[:-1])
+        Counts = np.add.reduceat(Observed, YearStarts[:-1])
+    else:
+        YearOfRow = Times.view('datetime64[ns]').astype('datetime64[Y]').view(np.int64)
+        YearOfRow = YearOfRow - YearOfRow.min()
+        Totals = np.bincount(YearOfRow, weights=ObservedValues)
+        Counts = np.bincount(YearOfRow[Observed], minlength=len(Totals))
+    AnnualTotals = np.where(Counts >= MinCount, Totals, np.nan)
+
+    #Check for homogeneity if there are more than 3 years of data
+    if np.count_nonzero(~np.isnan(AnnualTotals)) > 3:
+        #Find the start of the most recent homogeneous section, and flag everything in the years before it
+        Start = Pettitt.homogeneous_start(AnnualTotals, alpha=alpha, min_years=3,
+                                          permutations=permutations, seed=seed)[0]
+        if Start > 0 and Base.regular:
+            Homogeneous[:YearStarts[Start]] = False
+        elif Start > 0:
+            Homogeneous[YearOfRow < Start] = False
+    return Homogeneous
+
+def _matching_rows(times: np.ndarray, other_times: np.ndarray) -> tuple:
+    "The position in other_times of the time stamp identical to each time stamp, and whether there is one"
+    if len(other_times) == 0:
+        return np.zeros(len(times), dtype=np.intp), np.zeros(len(times), dtype=bool)
+    #Series on the same time stamps, such as rain and temperature from one station, need no search
+    if len(other_times) == len(times) and np.array_equal(other_times, times):
+        return np.arange(len(times)), np.ones(len(times), dtype=bool)
+    Order = None
+    if not (np.diff(other_times) >= 0).all():
+        Order = np.argsort(other_times, kind='stable')
+        other_times = other_times[Order]
+    Rows = np.minimum(np.searchsorted(other_times, times), len(other_times) - 1)
+    Matched = other_times[Rows] == times
+    return (Rows if Order is None else Order[Rows]), Matched
+
+def freezing_rain(timestamps, rainfall, temperature_timestamps, tmax, base = None) -> np.ndarray:
+    """True where it rained and the maximum temperature at the same time stamp was below zero
+
+    Each rain time stamp is matched to an identical temperature time stamp, which
+    should be unique. If ``base``, the ``analyse()`` of the temperature time stamps, is
+    a regular grid the match is the rain time stamp's offset on it, without a search.
+    Timezone aware time stamps can only be matched with timezone aware ones, and naive
+    with naive.
+    """
+    if (getattr(timestamps, 'tz', None) is None) != (getattr(temperature_timestamps, 'tz', None) is None):
+        raise TypeError("Cannot match tz-naive and tz-aware time stamps")
+    Times = as_times(timestamps)
+    if base is not None and base.regular:
+        Rows = base.positions(Times)
+        Matched = Rows >= 0
+    else:
+        Rows, Matched = _matching_rows(Times, as_times(temperature_timestamps))
+    TMax = as_values(tmax, dtype=float)
+    if len(TMax) == 0:
+        return Matched
+    with np.errstate(invalid='ignore'):
+        return Matched & (as_values(rainfall, dtype=float) > 0) & (TMax[Rows] < 0)
+
+def _peak_prominences(flow) -> tuple:
+    "The positions of the peaks of a daily flow series and their prominences"
+    from scipy.signal import find_peaks
+    Flow = as_values(flow, dtype=float)
+    Peaks, Properties = find_peaks(Flow, height = 0, prominence=np.nanmean(Flow) * 0.1, wlen = 3)
+    return Peaks, Properties['prominences']
+
+def flow_peaks(flow, ninety_fifth: float = None) -> tuple:
+    """The positions of the peaks of a daily flow series, and their prominence relative to the 95th percentile
+
+    Peaks are higher than the inter-peak low by at least 10 % of the mean flow. This definition
+    should identify most peaks without getting the tiny variations. The prominence of each peak
+    is the vertical difference between the peak and the lowest point within 'wlen' of the peak,
+    or to the next peak that is higher than the current peak, if that is less than 'wlen'.
+    The percentile is of these prominences unless ``ninety_fifth`` is given.
+    """
+    Peaks, Prominences = _peak_prominences(flow)
+
+    #Find the ratio of each peak's prominence to the 95th perentile
+    NinetyFifthPP = np.quantile(Prominences,0.95) if ninety_fifth is None else ninety_fifth
+    return Peaks, np.round(Prominences / NinetyFifthPP,3)
+
+def _binomial_p_value(successes: int, trials: int, p: float) -> float:
+    "The two-sided binomial test p-value"
+    import scipy.stats as st
+    if hasattr(st, 'binomtest'):
+        return st.binomtest(successes, trials, p).pvalue
+    return st.binom_test(x=successes, n=trials, p=p)
+
+def _fill_limited(values: np.ndarray, forward_limit: int, backward_limit: int) -> np.ndarray:
+    "Fills nan's from the value before them for up to forward_limit steps, then from the value after them for up to backward_limit, and the rest with 0"
+    values = values.copy()
+    Positions = np.arange(len(values))
+    Valid = ~np.isnan(values)
+    if forward_limit > 0:
+        Last = np.maximum.accumulate(np.where(Valid, Positions, -1))
+        Fill = ~Valid & (Last >= 0) & (Positions - Last <= forward_limit)
+        values[Fill] = values[Last[Fill]]
+        Valid |= Fill
+    Next = np.minimum.accumulate(np.where(Valid, Positions, len(values))[::-1])[::-1]
+    Fill = ~Valid & (Next < len(values)) & (Next - Positions <= backward_limit)
+    values[Fill] = values[Next[Fill]]
+    return np.where(np.isnan(values), 0, values)
+
+def _round_half_even(values: np.ndarray, unit: int) -> np.ndarray:
+    "Rounds int64 durations to the nearest multiple of unit, with halves to the even multiple as pandas' round()"
+    Quotient, Remainder = np.divmod(values, unit)
+    Up = (2 * Remainder > unit) | ((2 * Remainder == unit) & (Quotient % 2 == 1))
+    return (Quotient + Up) * unit
+
+def _rain_events(times: np.ndarray, event_gap = '12h') -> np.ndarray:
+    """The positions where each event of high rain time stamps starts
+
+    The gap from the previous high rain time step is rounded to the nearest event_gap,
+    and a new event starts wherever the rounded gap changes. The first two time steps
+    each start an event, as the first has no gap to compare. So the first hour of a
+    storm after a long gap is an event of its own, and the rest of the storm, whose gaps
+    round to 0, is another.
+    """
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64)
+    Gaps = _round_half_even(np.diff(times), pd.Timedelta(event_gap).value)
+    NewEvent = np.concatenate(([True, True], Gaps[1:] != Gaps[:-1]))[:len(times)]
+    return np.flatnonzero(NewEvent)
+
+def related_flow_events(timestamps, rainfall, peak_timestamps, peak_prominence, event_gap = '12h',
+                        base = None, ninety_ninth: float = None) -> np.ndarray:
+    """The relative prominence of a flow peak on the same day or the day after each time step
+
+    The prominence is only given if high rain events are associated with flow peaks, and
+    is nan otherwise. High rain (above the 99th percentile) is split into events on the gaps
+    between its time steps rounded to event_gap (see ``_rain_events()``), and the proportion
+    of events with a flow peak is compared with the proportion of all time steps with one
+    by a binomial test.
+
+    Parameters
+    ----------
+    peak_timestamps, peak_prominence : np.ndarray
+        The flow peaks, e.g. from ``flow_peaks()``, on the rain's time scale.
+    base : TimeBase, optional
+        The ``analyse()`` of the rain time stamps, if already made.
+    ninety_ninth : float, optional
+        The high rain threshold, e.g. from a QuantileSketch. The default is the 99th
+        percentile of the non-zero rainfall.
+
+    """
+    Times = as_times(timestamps)
+    Rainfall = as_values(rainfall, dtype=float)
+
+    #Only apply test if there is more than two days of data
+    if Times.max() - Times.min() < pd.Timedelta('2 days').value:
+        return np.full(len(Times), np.nan)
+
+    #Put the flow peaks on the rain time stamps. Fill each peak so that the whole day has its relative prominence,
+    #and backfill for 24 hours to associate with possible rain, accounting for time-to-concentration
+    PeakTimes, Prominence = as_times(peak_timestamps), as_values(peak_prominence, dtype=float)
+    PeakProminence = np.full(len(Times), np.nan)
+    Base = analyse(Times) if base is None else base
+    if Base.regular:
+        #On a regular grid each peak's position is its offset from the start
+        Positions = Base.positions(PeakTimes)
+        PeakProminence[Positions[Positions >= 0]] = Prominence[Positions >= 0]
+        FillLength = int(86400 // (Base.step / 1e9))
+    else:
+        Rows, Matched = _matching_rows(Times, PeakTimes)
+        PeakProminence[Matched] = Prominence[Rows[Matched]]
+        #The typical time step, rather than that of the first two time stamps, which may be a gap or a duplicate
+        FillLength = int(86400 // (_time_step(Times) / 1e9))
+    PeakProminence = _fill_limited(PeakProminence, FillLength - 1, FillLength)
+
+    #Determine if high rainfall events are associated with peak flow events
+    #Find the rain greater than the 99th percentile of non-zero rain
+    if ninety_ninth is None:
+        NonZeroRainData = Rainfall[Rainfall > 0]
+        ninety_ninth = np.quantile(NonZeroRainData,0.99)
+    with np.errstate(invalid='ignore'):
+        HighRain = np.flatnonzero(Rainfall > ninety_ninth)
+
+    #Separate the high rain into events, and get the maximum flow peak prominence of each event
+    if len(HighRain) == 0:
+        return np.full(len(Times), np.nan)
+    EventStarts = _rain_events(Times[HighRain], event_gap)
+    EventPeakProminence = np.maximum.reduceat(PeakProminence[HighRain], EventStarts)
+
+    #Likelihood of a flow peak event at any time
+    PeakLikelihood = np.count_nonzero(PeakProminence) / len(PeakProminence)
+
+    #Test whether the likelihood of flow events during high rainfall events is different from the likelihood flow events at any time.
+    #Use a binomial test.
+    #The null hypothesis is that the likelihoods match. So if the result is less than 0.01, this means there is a small likelihood that they are the same, so they can be considered different.
+    #If the result is > 0.01 then they're considered the same, and so flow events are not going to be helpful in confirming high rainfall events.
+    ProbabilityThatFlowEventsDuringHighRainEventsMatchesRandom = _binomial_p_value(np.count_nonzero(EventPeakProminence),
+                                                                                   len(EventPeakProminence), PeakLikelihood)
+
+    #If the flow peaks are not statistically related to rain events, reset the Peak_provenance to NA
+    if ProbabilityThatFlowEventsDuringHighRainEventsMatchesRandom > 0.01:
+        PeakProminence[:] = np.nan
+
+    return PeakProminence
+
+def _inner_rows(test_times: np.ndarray, reference_times: np.ndarray) -> tuple:
+    "The positions in sorted and unique test and reference time stamps of the time stamps common to both"
+    if len(reference_times) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    ReferenceRows = np.minimum(np.searchsorted(reference_times, test_times), len(reference_times) - 1)
+    Common = reference_times[ReferenceRows] == test_times
+    return np.flatnonzero(Common), ReferenceRows[Common]
+
+def _inner(test_timestamps, test_values, reference_timestamps, reference_values) -> tuple:
+    "The test positions, test values and reference values at the time stamps common to both"
+    TestRows, ReferenceRows = _inner_rows(_sorted_unique(as_times(test_timestamps), 'test'),
+                                          _sorted_unique(as_times(reference_timestamps), 'reference'))
+    return (TestRows, as_values(test_values, dtype=float)[TestRows],
+            as_values(reference_values, dtype=float)[ReferenceRows])
+
+def _affinity(test_wet: np.ndarray, reference_wet: np.ndarray) -> float:
+    "The proportion of time steps wet at both or dry at both, or 0 unless there are some of each"
+    #Count the both wets and the both drys
+    BothWet = np.count_nonzero(test_wet & reference_wet)
+    BothDry = np.count_nonzero(~test_wet & ~reference_wet)
+    if BothWet > 0 and BothDry > 0:
+        return (BothDry + BothWet) / len(test_wet)
+    return 0
+
+def affinity(test_timestamps, test_values, reference_timestamps, reference_values) -> float:
+    "The affinity index of Lewis et al. (2018) over the common time stamps, taking nan as dry"
+    _, Test, Reference = _inner(test_timestamps, test_values, reference_timestamps, reference_values)
+    with np.errstate(invalid='ignore'):
+        return _affinity(Test > 0, Reference > 0)
+
+def _spearman(ranks: np.ndarray) -> float:
+    "The Spearman rank correlation coefficient of the ranks of two series (columns)"
+    if len(ranks) < 2:
+        return np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.corrcoef(ranks[:, 0], ranks[:, 1])[0, 1]
+
+def spearman(test_timestamps, test_values, reference_timestamps, reference_values) -> float:
+    "The Spearman rank correlation coefficient over the common time stamps without nan at either site"
+    import scipy.stats as st
+    _, Test, Reference = _inner(test_timestamps, test_values, reference_timestamps, reference_values)
+    Complete = ~np.isnan(Test) & ~np.isnan(Reference)
+    return _spearman(st.rankdata(np.column_stack([Test[Complete], Reference[Complete]]), axis=0))
+
+def _divergence(differences: np.ndarray, fifth: float = None, ninety_fifth: float = None) -> tuple:
+    "The low and high divergence of test minus reference differences, from the given thresholds or their own"
+    #Find the ratio of each difference to the 95th percentile of the positive differences, if there are any
+    HighOutlierData = np.zeros(len(differences))
+    if ninety_fifth is None and (differences > 0).any():
+        ninety_fifth = np.quantile(differences[differences > 0], 0.95)
+    if ninety_fifth is not None:
+        HighOutlierData = np.maximum(np.round(differences / ninety_fifth, 1), 0)
+
+    #Find the ratio of each difference to the 5th percentile of the negative differences, if there are any
+    LowOutlierData = np.zeros(len(differences))
+    if fifth is None and (differences < 0).any():
+        fifth = np.quantile(differences[differences < 0], 0.05)
+    if fifth is not None:
+        LowOutlierData = np.maximum(np.round(differences / fifth, 1), 0)
+    return LowOutlierData, HighOutlierData
+
+def _complete_differences(test_timestamps, test_values, reference_timestamps, reference_values) -> tuple:
+    "The test positions of the common time stamps without nan at either site, and the test minus reference values there"
+    TestRows, Test, Reference = _inner(test_timestamps, test_values, reference_timestamps, reference_values)
+    Complete = ~np.isnan(Test) & ~np.isnan(Reference)
+    return TestRows[Complete], Test[Complete] - Reference[Complete]
+
+def neighborhood_divergence(test_timestamps, test_values, reference_timestamps, reference_values,
+                            fifth: float = None, ninety_fifth: float = None) -> tuple:
+    """The low and high divergence of the test from the reference, on the test time stamps
+
+    Returns the 'LowOutlierData' and 'HighOutlierData' arrays, which are nan where
+    either site has no value. The thresholds are the 5th percentile of the negative
+    and the 95th percentile of the positive differences, unless ``fifth`` and
+    ``ninety_fifth`` are given.
+    """
+    Rows, Differences = _complete_differences(test_timestamps, test_values, reference_timestamps, reference_values)
+    Low, High = np.full(len(test_values), np.nan), np.full(len(test_values), np.nan)
+    Low[Rows], High[Rows] = _divergence(Differences, fifth, ninety_fifth)
+    return Low, High
+
+def _align_references(test_times: np.ndarray, references) -> np.ndarray:
+    "The values of each reference (rows) at sorted and unique test time stamps, nan where it has none"
+    References = []
+    for timestamps, values in references:
+        Times = _sorted_unique(as_times(timestamps), 'reference')
+        References.append((Times, as_values(values, dtype=float).reshape(len(Times), -1)))
+    Aligned = np.full((sum(values.shape[1] for _, values in References), len(test_times)), np.nan)
+    Row = 0
+    #References sharing time stamps (the columns of one array) are aligned with a single search, or none on the test's
+    for times, values in References:
+        Rows = slice(Row, Row + values.shape[1])
+        if len(times) == len(test_times) and np.array_equal(times, test_times):
+            Aligned[Rows] = values.T
+        else:
+            TestRows, ReferenceRows = _inner_rows(test_times, times)
+            Aligned[Rows, TestRows] = values[ReferenceRows].T
+        Row += values.shape[1]
+    return Aligned
+
+def _row_quantiles(ordered: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """The q quantile of the run of values in each row of row-sorted values, nan for an empty run
+
+    A row's run is the counts values from its start. The quantile interpolates linearly
+    between the order statistics as np.quantile does.
+    """
+    if ordered.shape[1] == 0:
+        return np.full(len(ordered), np.nan)
+    Index = (counts - 1) * q
+    Below = np.floor(Index)
+    Gamma = Index - Below
+    Rows = np.arange(len(ordered))
+    Last = ordered.shape[1] - 1
+    Lower = ordered[Rows, np.clip(starts + Below.astype(np.intp), 0, Last)]
+    Upper = ordered[Rows, np.clip(starts + np.minimum(Below + 1, counts - 1).astype(np.intp), 0, Last)]
+    Difference = Upper - Lower
+    Quantiles = np.where(Gamma >= 0.5, Upper - Difference * (1 - Gamma), Lower + Difference * Gamma)
+    return np.where(counts > 0, Quantiles, np.nan)
+
+def neighborhood_divergences(test_timestamps, test_values, references, fifth = None, ninety_fifth = None) -> tuple:
+    """The low and high divergence of the test from each of several references, on the test time stamps
+
+    ``references`` is a list of (timestamps, values) pairs, and the values may have a
+    column per reference sharing the time stamps. The references are aligned into one
+    reference by time array of differences, and the thresholds of every reference are
+    found from a single sort of it. Returns 'LowOutlierData' and 'HighOutlierData'
+    arrays with a column per reference, each the same as ``neighborhood_divergence()``
+    against that reference. ``fifth`` and ``ninety_fifth`` are arrays of the thresholds
+    of each reference, with nan for those to be found from the data.
+    """
+    TestTimes = _sorted_unique(as_times(test_timestamps), 'test')
+    Differences = as_values(test_values, dtype=float) - _align_references(TestTimes, references)
+    Missing = np.isnan(Differences)
+    Negatives = np.count_nonzero(Differences < 0, axis=1)
+    Positives = np.count_nonzero(Differences > 0, axis=1)
+    #nan sorts last, so each reference's negative differences come first and its positive ones just before the nan's
+    Ordered = np.sort(Differences, axis=1)
+    Thresholds = []
+    for given, q, starts, counts in ((fifth, 0.05, np.zeros(len(Negatives), dtype=np.intp), Negatives),
+                                     (ninety_fifth, 0.95, np.count_nonzero(~Missing, axis=1) - Positives, Positives)):
+        Threshold = _row_quantiles(Ordered, starts, counts, q)
+        if given is not None:
+            Given = np.asarray(given, dtype=float)
+            Threshold = np.where(np.isnan(Given), Threshold, Given)
+        Thresholds.append(Threshold.reshape(-1, 1))
+
+    #A reference with no differences beyond zero on one side has no divergence on that side
+    Divergences = []
+    for threshold in Thresholds:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Divergence = np.where(np.isnan(threshold), 0, np.maximum(np.round(Differences / threshold, 1), 0))
+        Divergence[Missing] = np.nan
+        Divergences.append(Divergence.T)
+    return tuple(Divergences)
+
+def divergence_consensus(low: np.ndarray, high: np.ndarray, flag_ratio: float = 1.0) -> dict:
+    """The consensus of the divergences from several references (columns) at each time step
+
+    Returns a dict of arrays: the number of references with a value ('Neighbours'), the
+    median low and high divergence over them ('MedianLowOutlierData' and
+    'MedianHighOutlierData', nan without any), and the number of references whose
+    divergence is above ``flag_ratio`` ('LowFlagCount' and 'HighFlagCount').
+    """
+    Neighbours = np.count_nonzero(~np.isnan(high), axis=1)
+    Starts = np.zeros(len(Neighbours), dtype=np.intp)
+    Consensus = {'Neighbours': Neighbours}
+    for name, divergence in (('Low', low), ('High', high)):
+        Consensus[f'Median{name}OutlierData'] = _row_quantiles(np.sort(divergence, axis=1), Starts, Neighbours, 0.5)
+    for name, divergence in (('Low', low), ('High', high)):
+        with np.errstate(invalid='ignore'):
+            Consensus[f'{name}FlagCount'] = np.count_nonzero(divergence > flag_ratio, axis=1)
+    return Consensus
+
+def _time_step(times: np.ndarray) -> float:
+    "The typical (median) time step, in nanoseconds, of an array of int64 time stamps"
+    return float(np.median(np.diff(times))) if len(times) > 1 else float('nan')
+
+def _window_min_observations(window, step: float, completeness: float = 1.0) -> int:
+    "The number of observations that make a window complete, for data at the given time step"
+    if np.isnan(step) or step <= 0:
+        return 1
+    return max(1, int(round(completeness * pd.Timedelta(window).value / step)))
+
+def _dry_counts(test: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    "Cumulative counts of the dry test, dry reference, observed test and observed reference time steps, from 0"
+    Counts = np.zeros((len(test) + 1, 4))
+    Counts[1:] = np.cumsum(np.stack([test == 0, reference == 0, ~np.isnan(test), ~np.isnan(reference)], axis=1), axis=0)
+    return Counts
+
+def _dry_proportion_differences(times: np.ndarray, test: np.ndarray, reference: np.ndarray,
+                                windows, min_observations, counts: np.ndarray = None, step: int = None) -> dict:
+    """Differences in the proportion of dry observations over trailing windows
+
+    The dry and observation counts of both series over every window are taken from
+    one cumulative sum of the four count series. A window (t - window, t] is complete
+    if each series has at least its minimum number of observations in it, and
+    incomplete windows give nan.
+
+    Parameters
+    ----------
+    times : np.ndarray
+        The int64 time stamps of the aligned series, in order.
+    test, reference : np.ndarray
+        The aligned test and reference values, with nan where there is no observation.
+    windows : list
+        The window lengths, e.g. ['15d'].
+    min_observations : list
+        The minimum number of observations in a complete window, for each window. Each is
+        either one number for both series, or a (test, reference) pair.
+    counts : np.ndarray, optional
+        The ``_dry_counts()`` of the test and reference, if already made. The test and
+        reference are then not used.
+    step : int, optional
+        The step (ns) of a regular time grid, on which each window's first position is
+        found by arithmetic rather than a search of the times.
+
+    Returns
+    -------
+    dict
+        The dry proportion difference array for each window.
+
+    """
+    Counts = _dry_counts(test, reference) if counts is None else counts
+    Differences = {}
+    for window, minimum in zip(windows, min_observations):
+        TestMinimum, ReferenceMinimum = np.broadcast_to(minimum, 2)
+        if step is None:
+            WindowStarts = np.searchsorted(times, times - pd.Timedelta(window).value, side='right')
+        else:
+            #The window (t - window, t] holds the last ceil(window / step) positions
+            WindowStarts = np.maximum(np.arange(len(times)) - -(-pd.Timedelta(window).value // step) + 1, 0)
+        WindowCounts = Counts[1:] - Counts[WindowStarts]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            Difference = WindowCounts[:, 0] / WindowCounts[:, 2] - WindowCounts[:, 1] / WindowCounts[:, 3]
+        Difference[(WindowCounts[:, 2] < TestMinimum) | (WindowCounts[:, 3] < ReferenceMinimum)] = np.nan
+        Differences[window] = Difference
+    return Differences
+
+def _dry_proportion_outlier_index(differences: np.ndarray, ninety_fifth: float = None) -> np.ndarray:
+    "The ratio of dry proportion differences to the 95th percentile of the positive differences"
+    if ninety_fifth is None:
+        with np.errstate(invalid='ignore'):
+            Positive = differences[differences >= 0]
+        ninety_fifth = np.quantile(Positive, 0.95) if len(Positive) > 0 else 1
+    DryProportionOutlierIndex = np.round(differences / ninety_fifth, 1)
+    with np.errstate(invalid='ignore'):
+        DryProportionOutlierIndex[DryProportionOutlierIndex <= 0] = 0
+    return DryProportionOutlierIndex
+
+def _outer(test_times: np.ndarray, test: np.ndarray, reference_times: np.ndarray, reference: np.ndarray) -> tuple:
+    "The union of sorted and unique test and reference time stamps, and both series on it, over the period both have data"
+    TestObserved, ReferenceObserved = np.flatnonzero(~np.isnan(test)), np.flatnonzero(~np.isnan(reference))
+    if len(TestObserved) == 0 or len(ReferenceObserved) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    First = max(test_times[TestObserved[0]], reference_times[ReferenceObserved[0]])
+    Last = min(test_times[TestObserved[-1]], reference_times[ReferenceObserved[-1]])
+    Times = np.union1d(test_times, reference_times)
+    Times = Times[(Times >= First) & (Times <= Last)]
+    Aligned = []
+    for times, values in ((test_times, test), (reference_times, reference)):
+        InPeriod = (times >= First) & (times <= Last)
+        Values = np.full(len(Times), np.nan)
+        Values[np.searchsorted(Times, times[InPeriod])] = values[InPeriod]
+        Aligned.append(Values)
+    return Times, Aligned[0], Aligned[1]
+
+def _outer_dry_proportion_differences(test_timestamps, test_values, reference_timestamps, reference_values,
+                                      windows, completeness: float = 1.0) -> tuple:
+    """The outer time stamps over the period both sites have data, and the dry proportion differences on them for each window
+
+    The observations in a complete window are set by each site's own time step, as the
+    outer time stamps of sites on offset grids (e.g. on the hour and half hour) are closer.
+    """
+    TestTimes = _sorted_unique(as_times(test_timestamps), 'test')
+    ReferenceTimes = _sorted_unique(as_times(reference_timestamps), 'reference')
+    Times, Test, Reference = _outer(TestTimes, as_values(test_values, dtype=float),
+                                    ReferenceTimes, as_values(reference_values, dtype=float))
+    Base = analyse(Times)
+    Step = Base.step if Base.regular else None
+    Steps = analyse(TestTimes).step, analyse(ReferenceTimes).step
+    MinObservations = [tuple(_window_min_observations(window, step, completeness) for step in Steps)
+                       for window in windows]
+    return Times, _dry_proportion_differences(Times, Test, Reference, windows, MinObservations, step=Step)
+
+def dry_spell_divergence(test_timestamps, test_values, reference_timestamps, reference_values,
+                         windows = '15d', completeness: float = 1.0, ninety_fifth = None) -> tuple:
+    """The dry proportion outlier index of the test against the reference, over trailing windows
+
+    Returns the union of the time stamps over the period both sites have data, and the
+    'DryProportionOutlierIndex' array on it for a single window, or a dict of the array
+    for each window of a list. The threshold is the 95th percentile of the positive
+    differences, unless ``ninety_fifth`` is given (as a dict by window for a list).
+    """
+    Windows = [windows] if isinstance(windows, str) else list(windows)
+    Times, Differences = _outer_dry_proportion_differences(test_timestamps, test_values, reference_timestamps,
+                                                           reference_values, Windows, completeness)
+    if not isinstance(ninety_fifth, dict):
+        ninety_fifth = {window: ninety_fifth for window in Windows}
+    Indices = {window: _dry_proportion_outlier_index(Differences[window], ninety_fifth.get(window)) for window in Windows}
+    return Times, Indices[windows] if isinstance(windows, str) else Indices
+
+def _interval_sums(test_times: np.ndarray, observation_times: np.ndarray, reference_times: np.ndarray,
+                   reference_values: np.ndarray) -> np.ndarray:
+    "The reference values (rows) summed into the first test observation at or after them, nan if any is missing"
+    #Repeated time stamps would give empty intervals, which reduceat fills with the next value rather than a sum
+    _sorted_unique(test_times, 'test')
+    _sorted_unique(reference_times, 'reference')
+
+    #Put the reference values on the union of the test and reference time stamps, with nan where the reference has none
+    UnionTimes = np.union1d(test_times, reference_times)
+    Values = np.full((len(UnionTimes),) + reference_values.shape[1:], np.nan)
+    Values[np.searchsorted(UnionTimes, reference_times)] = reference_values
+
+    #Assign each time stamp to the first test observation at or after it, dropping any after the last observation.
+    #Every test observation time is in the union, so each interval starts right after the previous observation.
+    Intervals = np.searchsorted(observation_times, UnionTimes, side='left')
+    Values = Values[Intervals < len(observation_times)]
+    IntervalStarts = np.searchsorted(UnionTimes, observation_times, side='left')
+    IntervalStarts = np.concatenate(([0], IntervalStarts[:-1] + 1))
+
+    #Sum each interval, letting nan's propagate
+    return np.add.reduceat(Values, IntervalStarts, axis=0) if len(IntervalStarts) > 0 else Values[:0]
+
+def _valid_span(values: np.ndarray) -> slice:
+    "The rows from the first to the last with a value, or every row if none has one"
+    Valid = ~np.isnan(values)
+    Rows = np.flatnonzero(Valid.reshape(len(values), -1).any(axis=1))
+    return slice(Rows[0], Rows[-1] + 1) if len(Rows) > 0 else slice(None)
+
+def time_step_alignment(test_timestamps, test_values, reference_timestamps, reference_values) -> tuple:
+    """The reference values summed to the test observation times
+
+    Each reference value is summed into the first test observation (a time stamp with a
+    test value) at or after it, and a sum is nan if the reference is missing for any time
+    stamp within the interval. The reference values may have a column per reference.
+    Both sets of time stamps must be sorted and unique. Returns the observation times and
+    the sums, from the first to the last sum with a value.
+    """
+    TestTimes = as_times(test_timestamps)
+    ObservationTimes = TestTimes[~np.isnan(as_values(test_values, dtype=float))]
+    Sums = _interval_sums(TestTimes, ObservationTimes, as_times(reference_timestamps),
+                          as_values(reference_values, dtype=float))
+    Span = _valid_span(Sums)
+    return ObservationTimes[Span], Sums[Span]
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Run single-series rainfall checks over many stations at once.
+
+Stations are split into chunks and each chunk is run as one task on a process
+or thread pool. A failure in one check for one station is recorded and the
+rest of the batch carries on.
+"""
+
+import concurrent.futures
+import os
+from typing import NamedTuple
+
+import pandas as pd
+
+import CheckRegistry
+import Instrumentation
+
+class BatchResult(NamedTuple):
+    "The combined result of a batch run"
+    flags: pd.DataFrame
+    failures: pd.DataFrame
+
+def _check_name(check) -> str:
+    "The name used to report a check"
+    if isinstance(check, str):
+        return check
+    return getattr(check, '__name__', None) or getattr(getattr(check, 'func', None), '__name__', repr(check))
+
+def _resolve_check(check):
+    "Look up a check by name in the check registry, or return it if it is already callable"
+    if isinstance(check, str):
+        return CheckRegistry.get_check(check)
+    return check
+
+def _station_frame(series) -> pd.DataFrame:
+    "Put a station's data in the single 'Rainfall' column form the checks expect"
+    if isinstance(series, pd.DataFrame):
+        series = series.iloc[:, 0]
+    #rename_axis gives a new index, so the caller's index keeps its name
+    return series.rename_axis('DateTime').to_frame(name='Rainfall')
+
+def _as_frame(result, check_name: str) -> pd.DataFrame:
+    "Checks return either a DataFrame or a named Series; make it a DataFrame"
+    if isinstance(result, pd.Series):
+        return result.to_frame(name=result.name if result.name is not None else check_name)
+    return result
+
+def _run_chunk(chunk, checks):
+    """Runs every check on every station of a chunk
+
+    Returns a list of (station, check name, result, error) tuples, where exactly one
+    of result and error is None.
+    """
+    Results = []
+    for station, series in chunk:
+        rain_data = _station_frame(series)
+        for check in checks:
+            check_name = _check_name(check)
+            try:
+                with Instrumentation.station(station):
+                    Result = _resolve_check(check)(rain_data)
+                Results.append((station, check_name, _as_frame(Result, check_name), None))
+            except Exception as error:
+                Results.append((station, check_name, None, f"{type(error).__name__}: {error}"))
+    return Results
+
+def _run_profiled_chunk(chunk, checks, memory):
+    "Runs a chunk in a worker process, returning its results and the profiling events it made"
+    #A forked worker inherits the parent's sinks, which would write every event a second time
+    Instrumentation.disable()
+    with Instrumentation.profiling(memory=memory) as sink:
+        Results = _run_chunk(chunk, checks)
+    return Results, sink.events
+
+def _make_executor(executor, max_workers):
+    "Creates the pool for the requested executor type"
+    if executor == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    if executor == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    raise ValueError(f"executor must be 'process', 'thread' or 'serial', not {executor!r}")
+
+def run_batch(station_data, checks, executor: str = 'process', max_workers: int = None,
+              chunk_size: int = None) -> BatchResult:
+    """Runs a list of single-series checks over many stations
+
+    Parameters
+    ----------
+    station_data : dict or pd.DataFrame
+        Either a dict of station name to rainfall time series (a Series or single
+        column DataFrame), or a wide DataFrame with one column per station.
+    checks : list
+        The checks to run. Each is either the name of a registered check
+        (e.g. 'rain_outliers') or a callable taking a single station DataFrame, such
+        as a functools.partial of a check with its parameters set. Callables must be
+        picklable to be run on a process pool.
+    executor : str, optional
+        'process' for a ProcessPoolExecutor, 'thread' for a ThreadPoolExecutor or
+        'serial' to run in the calling process. The default is 'process'.
+    max_workers : int, optional
+        The number of workers in the pool. The default is the number of CPUs.
+    chunk_size : int, optional
+        The number of stations in each task. The default gives each worker about
+        four chunks.
+
+    Returns
+    -------
+    BatchResult
+        ``flags`` is a DataFrame with the (station, output column) as a column MultiIndex,
+        and ``failures`` is a DataFrame with a row of 'Station', 'Check' and 'Error' for
+        each check that raised an exception.
+
+    """
+    if isinstance(station_data, pd.DataFrame):
+        Stations = [(station, station_data[station]) for station in station_data.columns]
+    else:
+        Stations = list(station_data.items())
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(Stations) // (4 * max_workers)))
+    Chunks = [Stations[i:i + chunk_size] for i in range(0, len(Stations), chunk_size)]
+
+    Results = []
+    if executor == 'serial':
+        for chunk in Chunks:
+            Results.extend(_run_chunk(chunk, checks))
+    else:
+        #Worker processes send their events back with their results, to be emitted once by the parent's sinks
+        Profiled = executor == 'process' and Instrumentation.enabled()
+        with _make_executor(executor, max_workers) as pool:
+            if Profiled:
+                Futures = {pool.submit(_run_profiled_chunk, chunk, checks, Instrumentation.memory_traced()): chunk
+                           for chunk in Chunks}
+            else:
+                Futures = {pool.submit(_run_chunk, chunk, checks): chunk for chunk in Chunks}
+            for future in concurrent.futures.as_completed(Futures):
+                try:
+                    if Profiled:
+                        ChunkResults, Events = future.result()
+                        for event in Events:
+                            Instrumentation.emit(event)
+                    else:
+                        ChunkResults = future.result()
+                    Results.extend(ChunkResults)
+                except Exception as error:
+                    #The whole task failed (e.g. a worker died), so report every check of every station in it
+                    for station, _ in Futures[future]:
+                        for check in checks:
+                            Results.append((station, _check_name(check), None, f"{type(error).__name__}: {error}"))
+
+    #Combine the results into one DataFrame, keeping the order the stations were given in
+    StationOrder = {station: i for i, (station, _) in enumerate(Stations)}
+    Results.sort(key=lambda item: StationOrder[item[0]])
+    StationFlags = {}
+    for station, _, result, _ in Results:
+        if result is not None:
+            StationFlags.setdefault(station, []).append(result)
+    if StationFlags:
+        Flags = pd.concat({station: pd.concat(frames, axis=1) for station, frames in StationFlags.items()}, axis=1)
+    else:
+        Flags = pd.DataFrame()
+
+    Failures = pd.DataFrame([(station, check_name, error) for station, check_name, _, error in Results if error is not None],
+                            columns=['Station', 'Check', 'Error'])
+
+    return BatchResult(Flags, Failures)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+A registry of the checks, declaring what each needs before it is imported.
+
+Each check's inputs, required columns, minimum length and heavy dependencies
+are listed in REGISTRY. A check's module is only imported when the check is
+first looked up, and its heavy dependencies when it first runs, so a worker
+that only runs ``impossibles`` never imports scipy. Named subsets of checks are listed in
+SUBSETS, and ``run_checks()`` runs a subset or list of checks on the inputs
+given.
+"""
+
+import importlib
+from typing import NamedTuple
+
+class CheckSpec(NamedTuple):
+    "What a check needs to run"
+    module: str
+    inputs: tuple
+    required_columns: dict = {}
+    min_length: int = 0
+    dependencies: tuple = ()
+
+#The inputs are named as run_checks() takes them. rain_data is also the test data of the pairwise checks.
+REGISTRY = {
+    'rain_outliers': CheckSpec('RainDataChecks', ('rain_data',)),
+    'impossibles': CheckSpec('RainDataChecks', ('rain_data',)),
+    'DateTimeIssues': CheckSpec('RainDataChecks', ('rain_data',)),
+    'HighFrequencyTipping': CheckSpec('RainDataChecks', ('rain_data',)),
+    'DrySpells': CheckSpec('RainDataChecks', ('rain_data',)),
+    'RepeatedValues': CheckSpec('RainDataChecks', ('rain_data',)),
+    'Homogeneity': CheckSpec('RainDataChecks', ('rain_data',)),
+    'SubFreezingRain': CheckSpec('RainDataChecks', ('rain_data', 'temperature_data'),
+                                 {'rain_data': ('Rainfall',), 'temperature_data': ('TMax',)}),
+    'RelatedFlowEvents': CheckSpec('RainDataChecks', ('rain_data', 'streamflow_data'),
+                                   {'streamflow_data': ('Streamflow',)}, dependencies=('scipy.signal', 'scipy.stats')),
+    'affinity': CheckSpec('RainDataChecks', ('rain_data', 'reference_data')),
+    'spearman': CheckSpec('RainDataChecks', ('rain_data', 'reference_data'), dependencies=('scipy.stats',)),
+    'neighborhoodDivergence': CheckSpec('RainDataChecks', ('rain_data', 'reference_data')),
+    'DrySpellDivergence': CheckSpec('RainDataChecks', ('rain_data', 'reference_data')),
+    'neighborhoodConsensus': CheckSpec('RainDataChecks', ('rain_data', 'reference_data')),
+    'TimeStepAllignment': CheckSpec('RainDataChecks', ('rain_data', 'reference_data')),
+    'affinity_matrix': CheckSpec('NetworkChecks', ('network',)),
+    'spearman_matrix': CheckSpec('NetworkChecks', ('network',)),
+    'rank_references': CheckSpec('NetworkChecks', ('network', 'coordinates'), dependencies=('scipy.spatial',)),
+    }
+
+SUBSETS = {
+    'light': ('impossibles', 'DateTimeIssues', 'DrySpells', 'RepeatedValues'),
+    'single': ('rain_outliers', 'impossibles', 'DateTimeIssues', 'DrySpells', 'RepeatedValues', 'Homogeneity'),
+    'tips': ('impossibles', 'DateTimeIssues', 'HighFrequencyTipping'),
+    'pair': ('affinity', 'spearman', 'neighborhoodDivergence', 'DrySpellDivergence'),
+    'network': ('affinity_matrix', 'spearman_matrix', 'rank_references'),
+    }
+
+def get_check(name: str):
+    "The check function, importing its module when first asked for"
+    if name not in REGISTRY:
+        raise KeyError(f"'{name}' is not a registered check")
+    return getattr(importlib.import_module(REGISTRY[name].module), name)
+
+def check_names(checks) -> list:
+    "The check names of a subset name, or of a list of check and subset names"
+    if isinstance(checks, str):
+        checks = [checks]
+    Names = []
+    for check in checks:
+        for name in SUBSETS.get(check, (check,)):
+            if name not in Names:
+                Names.append(name)
+    return Names
+
+def problems(name: str, **inputs) -> list:
+    "The reasons a check can't run on the given inputs, which is empty if it can"
+    Spec = REGISTRY[name]
+    Problems = [f"needs {input_name}" for input_name in Spec.inputs if inputs.get(input_name) is None]
+    for input_name, columns in Spec.required_columns.items():
+        data = inputs.get(input_name)
+        if data is not None:
+            Problems += [f"{input_name} needs a '{column}' column" for column in columns
+                         if column not in getattr(data, 'columns', [])]
+    rain_data = inputs.get(Spec.inputs[0])
+    if rain_data is not None and len(rain_data) < Spec.min_length:
+        Problems.append(f"{Spec.inputs[0]} has {len(rain_data)} rows, fewer than {Spec.min_length}")
+    return Problems
+
+def run_checks(checks, params: dict = None, errors: str = 'raise', **inputs) -> dict:
+    """Runs a subset of the registered checks
+
+    Parameters
+    ----------
+    checks : str or list
+        A subset name from SUBSETS, or a list of check and subset names.
+    params : dict, optional
+        Keyword arguments for each check, by check name.
+    errors : str, optional
+        What to do with a check whose inputs are missing, too short or lack a required
+        column: 'raise' a ValueError before any check runs, or 'skip' the check. The
+        default is 'raise'.
+    **inputs
+        The data, named as in the registry: rain_data, temperature_data,
+        streamflow_data, reference_data, network or coordinates.
+
+    Returns
+    -------
+    dict
+        The result of each check that was run, by check name.
+
+    """
+    if errors not in ('raise', 'skip'):
+        raise ValueError(f"errors must be 'raise' or 'skip', not {errors!r}")
+    params = params or {}
+    Names = check_names(checks)
+    Problems = {name: problems(name, **inputs) for name in Names}
+    Problems = {name: problem for name, problem in Problems.items() if problem}
+    if Problems and errors == 'raise':
+        raise ValueError('; '.join(f"{name} {', '.join(problem)}" for name, problem in Problems.items()))
+    Results = {}
+    for name in Names:
+        if name not in Problems:
+            Results[name] = get_check(name)(*[inputs[input_name] for input_name in REGISTRY[name].inputs],
+                                            **params.get(name, {}))
+    return Results
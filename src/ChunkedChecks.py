@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core rainfall checks for records too long to hold in memory.
+
+A record is streamed from a Parquet file or memory-mapped NumPy files in blocks
+of rows, and the flags are written out block by block, so peak memory depends on
+the block size rather than the length of the record.
+
+The context each check needs across block edges is carried forward: the open
+dry and repeated value runs and the previous inter-tip time (through the
+IncrementalChecks state), and the last window (e.g. 15 days) of observations
+for DrySpellDivergence. Checks that depend on the whole record (the percentile
+thresholds, and the final length of runs that cross a block edge) take a first
+pass over the record before the pass that writes the flags.
+"""
+
+import numpy as np
+import pandas as pd
+
+import ArrayChecks
+import IncrementalChecks
+from QuantileSketch import QuantileSketch
+
+def iter_blocks(source, block_size: int = 1_000_000):
+    """Reads a time series in blocks of rows
+
+    Parameters
+    ----------
+    source : str, tuple or pd.DataFrame
+        A Parquet file path, with the date times in a 'DateTime' column (or the
+        index) and one column of values per series. Or a tuple of paths to two
+        .npy files, the first with int64 nanosecond time stamps and the second with
+        the values (one column per series), which are memory-mapped. A DataFrame is
+        also accepted and is read in blocks.
+    block_size : int, optional
+        The number of rows in each block. The default is 1,000,000.
+
+    Yields
+    ------
+    pd.DataFrame
+        Successive blocks of the time series, indexed by 'DateTime'.
+
+    """
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source.index), block_size):
+            yield source.iloc[start:start + block_size]
+    elif isinstance(source, tuple):
+        Times = np.load(source[0], mmap_mode='r')
+        Values = np.load(source[1], mmap_mode='r')
+        if Values.ndim == 1:
+            Values = Values.reshape(-1, 1)
+        Columns = ['Rainfall'] if Values.shape[1] == 1 else ['Test', 'Reference'][:Values.shape[1]]
+        for start in range(0, len(Times), block_size):
+            Index = pd.DatetimeIndex(np.asarray(Times[start:start + block_size]).astype('datetime64[ns]'), name='DateTime')
+            yield pd.DataFrame(np.asarray(Values[start:start + block_size]), columns=Columns, index=Index)
+    else:
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=block_size):
+            Block = batch.to_pandas()
+            if 'DateTime' in Block.columns:
+                Block = Block.set_index('DateTime')
+            yield Block
+
+class _BlockWriter:
+    "Writes blocks of flags to a Parquet or csv file, passes them to a function, or collects them"
+    def __init__(self, output):
+        self.output = output
+        self.blocks = []
+        self.parquet_writer = None
+        self.written = False
+
+    def write(self, flags: pd.DataFrame):
+        if self.output is None:
+            self.blocks.append(flags)
+        elif callable(self.output):
+            self.output(flags)
+        elif str(self.output).endswith('.csv'):
+            flags.to_csv(self.output, mode='a' if self.written else 'w', header=not self.written)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            Table = pa.Table.from_pandas(flags)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.output, Table.schema)
+            self.parquet_writer.write_table(Table)
+        self.written = True
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        if self.output is None:
+            return pd.concat(self.blocks) if self.blocks else None
+        return self.output
+
+class _ValueCounts:
+    """Counts of each distinct value, for exact percentiles of data with few distinct values
+
+    Rainfall at a fixed resolution has few distinct values, but the time steps and dry
+    proportion differences of some records have many. Once there are more than
+    max_values distinct values the counts are replaced by a QuantileSketch, so memory
+    stays bounded, and the percentiles become approximate: the rank error is at most
+    about 2π√(q(1-q))/compression, e.g. 0.3 % of the ranks at the 99th percentile with
+    the default compression.
+    """
+    def __init__(self, max_values: int = 100_000, compression: float = 200):
+        self.max_values = max_values
+        self.compression = compression
+        self.values = np.zeros(0)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sketch = None
+
+    def add(self, values):
+        if self.sketch is not None:
+            self.sketch.add(values)
+            return
+        Values, Inverse = np.unique(np.concatenate((self.values, values)), return_inverse=True)
+        Counts = np.bincount(Inverse, weights=np.concatenate((self.counts, np.ones(len(values), dtype=np.int64))))
+        self.values, self.counts = Values, Counts.astype(np.int64)
+        if len(self.values) > self.max_values:
+            self.sketch = QuantileSketch.from_counts(self.values, self.counts, self.compression)
+            self.values, self.counts = np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    def total(self) -> int:
+        if self.sketch is not None:
+            return int(self.sketch.count)
+        return int(self.counts.sum())
+
+    def quantile(self, q: float) -> float:
+        "The same linearly interpolated quantile as np.quantile, without holding every value"
+        if self.sketch is not None:
+            return self.sketch.quantile(q)
+        Position = (self.total() - 1) * q
+        Below = int(np.floor(Position))
+        Ends = np.cumsum(self.counts)
+        Lower = self.values[np.searchsorted(Ends, Below, side='right')]
+        Upper = self.values[np.searchsorted(Ends, min(Below + 1, self.total() - 1), side='right')]
+        Fraction = Position - Below
+        Difference = Upper - Lower
+        if Fraction >= 0.5:
+            return Upper - Difference * (1 - Fraction)
+        return Lower + Difference * Fraction
+
+def _revisions_by_block(revisions, block_firsts, block_lasts) -> list:
+    """The final revision of each run crossing a block edge, listed for every block the run covers
+
+    A run crossing several block edges is revised at each, from its start to the end of
+    the block before, so its last revision covers the whole run with its final value.
+    Each block then only gets the few runs that cover it, however many blocks there are.
+    """
+    Final = {}
+    for block_revisions in revisions:
+        for check, start, end, value in block_revisions:
+            Final[(check, start)] = (end, value)
+    Firsts, Lasts = pd.DatetimeIndex(block_firsts), pd.DatetimeIndex(block_lasts)
+    ByBlock = [[] for _ in block_firsts]
+    for (check, start), (end, value) in Final.items():
+        for block in range(Lasts.searchsorted(start), Firsts.searchsorted(end, side='right')):
+            ByBlock[block].append((check, start, end, value))
+    return ByBlock
+
+def _apply_revisions(flags: pd.DataFrame, revisions) -> pd.DataFrame:
+    "Sets the revised values of runs that continued past the end of this block"
+    for check, start, end, value in revisions:
+        flags.loc[(flags.index >= start) & (flags.index <= end), check] = value
+    return flags
+
+def chunked_single_checks(source, output=None, block_size: int = 1_000_000,
+                          inter_tip_threshold: float = 5, lambda_threshold: float = 5,
+                          min_burst_length: int = 1):
+    """Runs the run based single-series checks over a record in blocks
+
+    Produces the same 'DrySpellDayLengths', 'RepeatedValues', 'HighFrequencyTips' and
+    'Outlier' values as DrySpells, RepeatedValues, HighFrequencyTipping and
+    rain_outliers run over the whole record.
+
+    Parameters
+    ----------
+    source : str, tuple or pd.DataFrame
+        The rainfall record, see ``iter_blocks()``.
+    output : str or callable, optional
+        A .parquet or .csv path to write the flags to, or a function to pass each
+        block of flags to. The default is to return all the flags as a DataFrame.
+    block_size : int, optional
+        The number of rows in each block. The default is 1,000,000.
+    inter_tip_threshold, lambda_threshold, min_burst_length : optional
+        The HighFrequencyTipping parameters.
+
+    Returns
+    -------
+    pd.DataFrame or str
+        The flags, or the output path.
+
+    """
+    #First pass, to find the outlier threshold and the final length of runs that cross block edges
+    State = IncrementalChecks.StationState(inter_tip_threshold=inter_tip_threshold,
+                                           lambda_threshold=lambda_threshold,
+                                           min_burst_length=min_burst_length)
+    BlockStates = []
+    Revisions = []
+    BlockFirsts, BlockLasts = [], []
+    WetValues = _ValueCounts()
+    for block in iter_blocks(source, block_size):
+        BlockStates.append(State)
+        BlockFirsts.append(block.index[0])
+        BlockLasts.append(block.index[-1])
+        Result = IncrementalChecks.update(State, block)
+        State = Result.state
+        Revisions.append(list(Result.revisions.itertuples(index=False, name=None)))
+        Values = block.values[:, 0].astype(float)
+        WetValues.add(Values[Values > 0.2])
+
+    OutlierThreshold = WetValues.quantile(0.99) if State.n_obs >= 100 else None
+
+    #Second pass, writing the flags with any later revisions applied
+    BlockRevisions = _revisions_by_block(Revisions, BlockFirsts, BlockLasts)
+    Writer = _BlockWriter(output)
+    for block_number, block in enumerate(iter_blocks(source, block_size)):
+        BlockState = BlockStates[block_number]._replace(outlier_threshold=OutlierThreshold)
+        Flags = IncrementalChecks.update(BlockState, block).flags
+        Writer.write(_apply_revisions(Flags, BlockRevisions[block_number]))
+    return Writer.close()
+
+def _iter_overlapping_blocks(source, block_size, first_idx, last_idx, window):
+    "Yields each block of the overlap period along with the preceding window"
+    Halo = None
+    for block in iter_blocks(source, block_size):
+        block = block.loc[first_idx:last_idx]
+        if len(block.index) == 0:
+            continue
+        Combined = block if Halo is None else pd.concat([Halo, block])
+        yield Combined, len(block.index)
+        Halo = Combined[Combined.index > Combined.index[-1] - pd.Timedelta(window)]
+
+def _block_differences(combined: pd.DataFrame, block_length: int, window, min_observations) -> np.ndarray:
+    "The dry proportion differences for the block at the end of a block and its halo"
+    return ArrayChecks._dry_proportion_differences(combined.index.asi8, combined.Test.to_numpy(dtype=float),
+                                                   combined.Reference.to_numpy(dtype=float),
+                                                   [window], [min_observations])[window][-block_length:]
+
+def chunked_dry_spell_divergence(source, output=None, block_size: int = 1_000_000,
+                                 window = '15d', completeness: float = 1.0):
+    """Runs DrySpellDivergence over a pair of aligned records in blocks
+
+    Parameters
+    ----------
+    source : str, tuple or pd.DataFrame
+        The test and reference records aligned on one time index, as 'Test' and
+        'Reference' columns, see ``iter_blocks()``.
+    output : str or callable, optional
+        A .parquet or .csv path to write the index to, or a function to pass each
+        block to. The default is to return the whole index as a DataFrame.
+    block_size : int, optional
+        The number of rows in each block. The default is 1,000,000.
+    window, completeness : optional
+        The DrySpellDivergence window length and completeness.
+
+    Returns
+    -------
+    pd.DataFrame or str
+        The 'DryProportionOutlierIndex', or the output path.
+
+    """
+    #First pass for the period both sites have data
+    first_idx = {}
+    last_idx = {}
+    for block in iter_blocks(source, block_size):
+        for column in ['Test', 'Reference']:
+            if block[column].first_valid_index() is not None:
+                first_idx.setdefault(column, block[column].first_valid_index())
+                last_idx[column] = block[column].last_valid_index()
+    if len(first_idx) < 2:
+        return _BlockWriter(output).close()
+    first_idx = max(first_idx.values())
+    last_idx = min(last_idx.values())
+
+    #Second pass for the typical time step over that period, which sets the observations in a complete window
+    TimeSteps = _ValueCounts()
+    for combined, block_length in _iter_overlapping_blocks(source, block_size, first_idx, last_idx, window):
+        TimeSteps.add(np.diff(combined.index.asi8[-(block_length + 1):]).astype(float))
+    Step = TimeSteps.quantile(0.5) if TimeSteps.total() > 0 else float('nan')
+    MinObservations = ArrayChecks._window_min_observations(window, Step, completeness)
+
+    #Third pass for the 95th percentile of the positive dry proportion differences
+    PositiveDifferences = _ValueCounts()
+    for combined, block_length in _iter_overlapping_blocks(source, block_size, first_idx, last_idx, window):
+        Differences = _block_differences(combined, block_length, window, MinObservations)
+        PositiveDifferences.add(Differences[Differences >= 0])
+    DryProportionDiffereneNinetyFifth = PositiveDifferences.quantile(0.95) if PositiveDifferences.total() > 0 else 1
+
+    #Fourth pass to write the index
+    Writer = _BlockWriter(output)
+    for combined, block_length in _iter_overlapping_blocks(source, block_size, first_idx, last_idx, window):
+        Differences = _block_differences(combined, block_length, window, MinObservations)
+        DryProportionOutlierIndex = ArrayChecks._dry_proportion_outlier_index(Differences, DryProportionDiffereneNinetyFifth)
+        Writer.write(pd.DataFrame({'DryProportionOutlierIndex': DryProportionOutlierIndex}, index=combined.index[-block_length:]))
+    return Writer.close()
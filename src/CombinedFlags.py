@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+A compact combined output for many checks of one station.
+
+Each check returns its own DataFrame with a full copy of the time index. Here
+the boolean flags of every check are packed into the bits of one uint16 (or
+uint32) array, and the continuous indices are stored as float32 or unsigned
+integer arrays, all sharing a single index. Check outputs are added one at a time, so
+only one check's DataFrame is held at once.
+
+Every bit marks a problem. Flags that are True for good rows, like Homogeneity's
+'Homogeneous', are stored inverted under the names in INVERTED_FLAGS.
+
+Missing values keep their own bits rather than widening the arrays: a flag
+that wasn't tested (e.g. Homogeneity of a record too short to test) sets its
+'NotTested' bit, and a missing integer output its 'Missing' bit.
+"""
+
+import numpy as np
+import pandas as pd
+
+import CheckRegistry
+
+#The bit of each boolean check output. Other boolean outputs are given the bits after these.
+FLAG_BITS = {
+    'Impossible': 0,
+    'DuplicateDateTimes': 1,
+    'HighFrequencyTips': 2,
+    'FreezingRain': 3,
+    'Inhomogeneous': 4,
+    'BeforeChangePoint': 5,
+    'InhomogeneousNotTested': 6,
+    'BeforeChangePointNotTested': 7,
+    }
+
+#Check outputs that are True for good rows, and the name of their inverse, which is stored instead
+INVERTED_FLAGS = {
+    'Homogeneous': 'Inhomogeneous',
+    'ChangePoint': 'BeforeChangePoint',
+    }
+
+#The storage type of each continuous check output. Others are stored as float32.
+#Unsigned integer outputs are widened if their values don't fit.
+COMPACT_DTYPES = {
+    'Outlier': np.float32,
+    'DrySpellDayLengths': np.uint32,
+    'RepeatedValues': np.uint32,
+    'Peak_prominence': np.float32,
+    'LowOutlierData': np.float32,
+    'HighOutlierData': np.float32,
+    'DryProportionOutlierIndex': np.float32,
+    'Neighbours': np.uint16,
+    'MedianLowOutlierData': np.float32,
+    'MedianHighOutlierData': np.float32,
+    'LowFlagCount': np.uint16,
+    'HighFlagCount': np.uint16,
+    }
+
+DEFAULT_CHECKS = ('impossibles', 'DateTimeIssues', 'rain_outliers', 'DrySpells', 'RepeatedValues')
+
+def _compact(values: np.ndarray, dtype) -> np.ndarray:
+    """Stores values as the given type, with 0 in place of nan for unsigned integers
+
+    Unsigned integers too large for the type are stored as the next wider type that
+    holds them, as the mask widens, rather than clipped.
+    """
+    values = np.asarray(values, dtype=float)
+    if np.issubdtype(dtype, np.unsignedinteger):
+        values = np.maximum(np.round(np.nan_to_num(values)), 0)
+        Largest = values.max(initial=0)
+        for dtype in (dtype, np.uint32, np.uint64):
+            if Largest <= np.iinfo(dtype).max:
+                break
+        return np.minimum(values, np.iinfo(dtype).max).astype(dtype)
+    return values.astype(dtype)
+
+class CombinedFlags:
+    """The outputs of many checks of one station, on a single shared index
+
+    Parameters
+    ----------
+    index : pd.DatetimeIndex
+        The time stamps of the station's rainfall data.
+
+    Attributes
+    ----------
+    mask : np.ndarray
+        A uint16 (or uint32 once more than 16 bits are used) bitmask of the boolean flags.
+    bits : dict
+        The bit of each boolean flag that has been added.
+    values : dict
+        The compact array of each continuous output that has been added.
+
+    """
+    def __init__(self, index: pd.DatetimeIndex):
+        self.index = index
+        self.mask = np.zeros(len(index), dtype=np.uint16)
+        self.bits = {}
+        self.values = {}
+
+    def _aligned(self, column: pd.Series) -> np.ndarray:
+        "A check output column's values on the shared index"
+        if not column.index.equals(self.index):
+            column = column.reindex(self.index)
+        return column.to_numpy()
+
+    def _bit(self, name: str) -> int:
+        "The bit for a flag, allocating the next free one to flags not in FLAG_BITS"
+        if name in self.bits:
+            return self.bits[name]
+        Bit = FLAG_BITS.get(name, max([len(FLAG_BITS) - 1] + list(self.bits.values())) + 1)
+        if Bit >= 32:
+            raise ValueError(f"No bit left for the '{name}' flag, only 32 flags can be combined")
+        if Bit >= 16 and self.mask.dtype == np.uint16:
+            self.mask = self.mask.astype(np.uint32)
+        return Bit
+
+    def _set(self, name: str, rows: np.ndarray):
+        "Sets a flag's bit on the given rows and clears it on the others"
+        Bit = self._bit(name)
+        self.mask &= ~self.mask.dtype.type(1 << Bit)
+        self.mask[rows] |= self.mask.dtype.type(1 << Bit)
+        self.bits[name] = Bit
+
+    def _set_missing(self, name: str, missing: np.ndarray):
+        "Sets the bit of the rows missing from an output, only using a bit once some are missing"
+        if missing.any() or name in self.bits:
+            self._set(name, missing)
+
+    def add(self, result):
+        """Adds a check's output
+
+        Boolean columns, and the columns named in FLAG_BITS, set their bit where they are
+        True, and their 'NotTested' bit where they are nan. The columns named in
+        INVERTED_FLAGS set the bit of their inverse where they are False. Other columns
+        are stored as the type given in COMPACT_DTYPES, or float32. Integer types set the
+        column's 'Missing' bit where it is nan, and store 0 there.
+        """
+        if isinstance(result, pd.Series):
+            result = result.to_frame(name=result.name)
+        for name in result.columns:
+            Values = self._aligned(result[name])
+            if Values.dtype == bool or name in FLAG_BITS or name in INVERTED_FLAGS:
+                Missing = pd.isna(Values)
+                Flagged = Values == True
+                if name in INVERTED_FLAGS:
+                    name, Flagged = INVERTED_FLAGS[name], ~Flagged & ~Missing
+                self._set(name, Flagged)
+                self._set_missing(f'{name}NotTested', Missing)
+            else:
+                Dtype = COMPACT_DTYPES.get(name, np.float32)
+                if np.issubdtype(Dtype, np.unsignedinteger):
+                    self._set_missing(f'{name}Missing', pd.isna(Values))
+                self.values[name] = _compact(Values, Dtype)
+        return self
+
+    def flag(self, name: str) -> np.ndarray:
+        "A boolean array of one flag"
+        return (self.mask & self.mask.dtype.type(1 << self.bits[name])) != 0
+
+    def _bits_of(self, names) -> int:
+        "The mask with the bits of the named flags set"
+        names = [names] if isinstance(names, str) else names
+        return self.mask.dtype.type(sum(1 << self.bits[name] for name in names))
+
+    def select(self, all_of=(), any_of=(), none_of=()) -> np.ndarray:
+        """A boolean array of the rows with a combination of flags
+
+        Parameters
+        ----------
+        all_of, any_of, none_of : str or list, optional
+            The flags that must all be set, at least one of which must be set, and none of
+            which may be set.
+
+        """
+        Selected = np.ones(len(self.mask), dtype=bool)
+        if all_of:
+            Bits = self._bits_of(all_of)
+            Selected &= (self.mask & Bits) == Bits
+        if any_of:
+            Selected &= (self.mask & self._bits_of(any_of)) != 0
+        if none_of:
+            Selected &= (self.mask & self._bits_of(none_of)) == 0
+        return Selected
+
+    def decode(self, names=None) -> dict:
+        "A boolean array of each named flag, by default all of them"
+        return {name: self.flag(name) for name in (self.bits if names is None else names)}
+
+    def to_frame(self, rows=None) -> pd.DataFrame:
+        """The combined outputs as a DataFrame, with a boolean column per flag
+
+        Parameters
+        ----------
+        rows : np.ndarray, optional
+            A boolean array, e.g. from ``select()``, or positions of the rows to include.
+            The default is every row.
+
+        """
+        rows = slice(None) if rows is None else rows
+        Columns = {name: self.flag(name)[rows] for name in self.bits}
+        Columns.update({name: values[rows] for name, values in self.values.items()})
+        return pd.DataFrame(Columns, index=self.index[rows])
+
+    @property
+    def nbytes(self) -> int:
+        "The memory held by the mask and the continuous outputs, not counting the index"
+        return self.mask.nbytes + sum(values.nbytes for values in self.values.values())
+
+def run_combined(rain_data: pd.DataFrame, checks=DEFAULT_CHECKS) -> CombinedFlags:
+    """Runs checks on a station's rainfall, combining their outputs as they are made
+
+    Parameters
+    ----------
+    rain_data : pd.DataFrame
+        A time series of rainfall amounts.
+    checks : list, optional
+        The checks to run. Each is either the name of a check in the CheckRegistry or a
+        callable taking the rainfall DataFrame, such as a functools.partial of
+        ``SubFreezingRain`` with its temperature data. The default is the single series
+        checks in DEFAULT_CHECKS.
+
+    Returns
+    -------
+    CombinedFlags
+        The outputs of every check.
+
+    """
+    Combined = CombinedFlags(rain_data.index)
+    for check in checks:
+        Check = CheckRegistry.get_check(check) if isinstance(check, str) else check
+        Combined.add(Check(rain_data))
+    return Combined
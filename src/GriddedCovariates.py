@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Gridded covariates, such as a national daily maximum temperature product.
+
+A CovariateGrid is a time by y by x cube with regular time steps, memory-mapped
+from a .npy file or given as any array that can be sliced (e.g. a zarr array or
+netCDF4 variable). The grid cells and weights of each station are found once,
+for the nearest cell or bilinear interpolation, and the covariate of every
+station is then sampled with one fancy index of the flattened cube over the
+time steps needed. Time stamps are matched to the grid's time steps by their
+integer offset from its first time step, so no merge or timezone conversion is
+made for each station.
+
+The grids here are of temperature, for SubFreezingRain. Streamflow is measured
+at flow sites rather than gridded, so RelatedFlowEvents takes each site's
+series, and CatchmentRelatedFlowEvents finds each site's peaks once for all its
+rain gauges.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import ArrayChecks
+from TimeBase import analyse
+
+class StationCells(NamedTuple):
+    "The grid cells (positions in the flattened y by x grid) and weights of each station"
+    stations: list
+    cells: np.ndarray
+    weights: np.ndarray
+
+def _axis_positions(centres: np.ndarray, points: np.ndarray) -> np.ndarray:
+    "The fractional positions of points along ascending or descending cell centres, nan over half a cell outside"
+    if len(centres) == 1:
+        return np.zeros(len(points))
+    Descending = centres[0] > centres[-1]
+    Centres = centres[::-1] if Descending else centres
+    Positions = np.interp(points, Centres, np.arange(len(Centres), dtype=float))
+    #Points beyond the outer centres, but within their cells, are given the edge cells
+    HalfCells = np.abs(Centres[1] - Centres[0]) / 2, np.abs(Centres[-1] - Centres[-2]) / 2
+    Positions[(points < Centres[0] - HalfCells[0]) | (points > Centres[-1] + HalfCells[1])] = np.nan
+    return len(Centres) - 1 - Positions if Descending else Positions
+
+class CovariateGrid:
+    """A gridded covariate with regular time steps
+
+    Parameters
+    ----------
+    values : array
+        The time by y by x cube, e.g. ``np.load(path, mmap_mode='r')``, with nan where
+        there is no value.
+    times : pd.DatetimeIndex or array
+        The time stamp of each time step, which must be regular, e.g. the start of each day.
+    x, y : array
+        The coordinates of the centres of the columns and rows of the grid, ascending or
+        descending, in the same (planar) system as the station coordinates.
+    tz : optional
+        The timezone of the time stamps, if times is not a timezone aware index, in
+        which case the time stamps are UTC.
+    block : int, optional
+        The number of time steps read at once from an array that is not a NumPy array
+        (or memmap). The default is 366.
+
+    """
+    def __init__(self, values, times, x, y, tz = None, block: int = 366):
+        self.values = values
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.base = analyse(ArrayChecks.as_times(times), getattr(times, 'tz', None) or tz)
+        self.block = block
+        if values.shape != (self.base.length, len(self.y), len(self.x)):
+            raise ValueError(f"The grid's shape {values.shape} doesn't match its {self.base.length} times, "
+                             f"{len(self.y)} rows and {len(self.x)} columns")
+        if self.base.length > 1 and not self.base.regular:
+            raise ValueError("The grid's time steps must be regular")
+
+    @classmethod
+    def from_npy(cls, path, times, x, y, tz = None) -> 'CovariateGrid':
+        "A grid memory-mapped from a .npy file of the time by y by x cube"
+        return cls(np.load(path, mmap_mode='r'), times, x, y, tz)
+
+    def station_cells(self, coordinates: pd.DataFrame, method: str = 'nearest') -> StationCells:
+        """The grid cells and weights of each station, to be found once and reused
+
+        Parameters
+        ----------
+        coordinates : pd.DataFrame
+            The x and y coordinates of each station, indexed by station with one column per
+            axis, as for ``NetworkChecks.rank_references()``.
+        method : str, optional
+            'nearest' for the value of the station's cell, or 'bilinear' to interpolate between
+            the four nearest cell centres. The default is 'nearest'.
+
+        Returns
+        -------
+        StationCells
+            The stations, and their cells and weights, each with a row per station. A station
+            outside the grid has zero weights.
+
+        """
+        Points = coordinates.to_numpy(dtype=float)
+        Columns, Rows = _axis_positions(self.x, Points[:, 0]), _axis_positions(self.y, Points[:, 1])
+        Outside = np.isnan(Columns) | np.isnan(Rows)
+        Columns, Rows = np.nan_to_num(Columns), np.nan_to_num(Rows)
+        if method == 'nearest':
+            Cells = (np.rint(Rows) * len(self.x) + np.rint(Columns)).astype(np.intp).reshape(-1, 1)
+            Weights = np.ones(Cells.shape)
+        elif method == 'bilinear':
+            Left = np.clip(np.floor(Columns), 0, max(len(self.x) - 2, 0)).astype(np.intp)
+            Top = np.clip(np.floor(Rows), 0, max(len(self.y) - 2, 0)).astype(np.intp)
+            Right, Bottom = np.minimum(Left + 1, len(self.x) - 1), np.minimum(Top + 1, len(self.y) - 1)
+            AlongX, AlongY = np.clip(Columns - Left, 0, 1), np.clip(Rows - Top, 0, 1)
+            Cells = np.stack([Top * len(self.x) + Left, Top * len(self.x) + Right,
+                              Bottom * len(self.x) + Left, Bottom * len(self.x) + Right], axis=1)
+            Weights = np.stack([(1 - AlongY) * (1 - AlongX), (1 - AlongY) * AlongX,
+                                AlongY * (1 - AlongX), AlongY * AlongX], axis=1)
+        else:
+            raise ValueError(f"method must be 'nearest' or 'bilinear', not '{method}'")
+        Weights[Outside] = 0
+        return StationCells(list(coordinates.index), Cells, Weights)
+
+    def positions(self, timestamps, tz = None, whole_step: bool = False) -> np.ndarray:
+        """The grid time step of each time stamp, by its integer offset from the first, and -1 for none
+
+        Time stamps match a time step if they are identical to its time stamp, or with
+        ``whole_step`` if they are anywhere within it (e.g. hourly rain within a day).
+        Timezone aware time stamps (or those with tz given) can only match a grid with a
+        timezone, and naive time stamps a naive grid.
+        """
+        if (getattr(timestamps, 'tz', None) is None and tz is None) != (self.base.tz is None):
+            raise TypeError("Cannot match tz-naive and tz-aware time stamps")
+        Times = ArrayChecks.as_times(timestamps)
+        if not whole_step:
+            return self.base.positions(Times)
+        Positions = (Times - self.base.start) // max(self.base.step, 1)
+        Positions[(Positions < 0) | (Positions >= self.base.length)] = -1
+        return Positions
+
+    def _read(self, cells: np.ndarray, start: int, stop: int) -> np.ndarray:
+        "The values of the cells (flattened) from time step start to stop, reading only those cells of a NumPy array"
+        if isinstance(self.values, np.ndarray):
+            return np.asarray(self.values.reshape(self.base.length, -1)[start:stop, cells], dtype=float)
+        Blocks = [np.asarray(self.values[first:min(first + self.block, stop)], dtype=float).reshape(-1, self.x.size * self.y.size)[:, cells]
+                  for first in range(start, stop, self.block)]
+        return np.concatenate(Blocks) if Blocks else np.zeros((0, len(cells)))
+
+    def sample(self, station_cells: StationCells, start: int = 0, stop: int = None) -> np.ndarray:
+        """The covariate of every station from time step start to stop, as a time by station array
+
+        Each cell is read once however many stations use it. Bilinear weights are
+        renormalised over the cells with a value, and a station without any gets nan.
+        """
+        stop = self.base.length if stop is None else stop
+        Cells, Inverse = np.unique(station_cells.cells, return_inverse=True)
+        Values = self._read(Cells, start, stop)[:, Inverse.reshape(station_cells.cells.shape)]
+        Valid = ~np.isnan(Values)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (np.where(Valid, Values * station_cells.weights, 0).sum(axis=2)
+                    / np.where(Valid, station_cells.weights, 0).sum(axis=2))
+
+    def at(self, station_cells: StationCells, timestamps: dict, whole_step: bool = False) -> dict:
+        """The covariate of each station at its own time stamps, e.g. those of its rain data
+
+        The grid is sampled once for all the stations over the time steps any of them
+        needs, and each station's values are taken by their time step offsets.
+
+        Parameters
+        ----------
+        station_cells : StationCells
+            The cells of the stations, from ``station_cells()``.
+        timestamps : dict
+            Station to time stamps (e.g. its rain data's index). Stations not in
+            station_cells are skipped.
+        whole_step : bool, optional
+            Whether time stamps within a time step match it, rather than only its own time
+            stamp. The default is False.
+
+        Returns
+        -------
+        dict
+            Station to an array of the covariate at each of its time stamps, nan where there
+            is none.
+
+        """
+        Columns = {station: column for column, station in enumerate(station_cells.stations) if station in timestamps}
+        Positions = {station: self.positions(timestamps[station], whole_step=whole_step) for station in Columns}
+        Found = [positions[positions >= 0] for positions in Positions.values()]
+        Start = min((int(found.min()) for found in Found if len(found)), default=0)
+        Stop = max((int(found.max()) + 1 for found in Found if len(found)), default=0)
+        Sampled = self.sample(station_cells, Start, Stop)
+        Covariates = {}
+        for station, positions in Positions.items():
+            Values = np.full(len(positions), np.nan)
+            Values[positions >= 0] = Sampled[positions[positions >= 0] - Start, Columns[station]]
+            Covariates[station] = Values
+        return Covariates
+
+def freezing_rain_sites(rain_data_sites: dict, tmax_grid: CovariateGrid, station_cells: StationCells,
+                        whole_step: bool = False) -> dict:
+    """SubFreezingRain for many rain gauges from a gridded maximum temperature
+
+    Parameters
+    ----------
+    rain_data_sites : dict
+        Rain gauge name to a rainfall time series with a 'Rainfall' column.
+    tmax_grid : CovariateGrid
+        The gridded daily maximum temperature.
+    station_cells : StationCells
+        The gauges' cells of the grid, from ``tmax_grid.station_cells()``.
+    whole_step : bool, optional
+        Whether rain within a grid time step (e.g. hourly rain within a day) uses its
+        temperature. The default is False, which, as ``SubFreezingRain()``, only uses
+        the temperature at identical time stamps.
+
+    Returns
+    -------
+    dict
+        Rain gauge name to its 'FreezingRain' series.
+
+    """
+    TMax = tmax_grid.at(station_cells, {site: data.index for site, data in rain_data_sites.items()}, whole_step)
+    Output = {}
+    for site, tmax in TMax.items():
+        rain_data = rain_data_sites[site]
+        with np.errstate(invalid='ignore'):
+            FreezingRain = (rain_data.Rainfall.to_numpy(dtype=float) > 0) & (tmax < 0)
+        Output[site] = pd.Series(FreezingRain, index=rain_data.index, name='FreezingRain')
+    return Output
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental rainfall checks for telemetry that is appended to a station's record.
+
+A StationState carries just enough of the end of a station's history (the open
+dry and repeated value runs, the last inter-tip time and any open rapid tip
+burst, and the outlier threshold) for update() to flag newly arrived rows
+without re-reading the history. The cost of an update scales with the number
+of new rows.
+
+The DrySpells, RepeatedValues and HighFrequencyTipping results match a full
+recomputation over the whole record. Outlier indices use the threshold carried
+in the state, which is set from the history by init_state(). Re-run init_state()
+to refresh it.
+"""
+
+import json
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from RunLengths import run_length_encode, per_observation
+
+class StationState(NamedTuple):
+    "Everything needed to check new observations for a station. Times are int64 nanoseconds since the epoch."
+    n_obs: int = 0
+    last_time: Optional[int] = None
+    #The open run of dry observations
+    dry_run_start: Optional[int] = None
+    #The open run of repeated values
+    repeat_value: float = float('nan')
+    repeat_length: int = 0
+    repeat_start: Optional[int] = None
+    #The open high frequency tip burst
+    last_inter_tip: float = float('nan')
+    burst_length: int = 0
+    burst_start: Optional[int] = None
+    #Check parameters
+    outlier_threshold: Optional[float] = None
+    inter_tip_threshold: float = 5
+    lambda_threshold: float = 5
+    min_burst_length: int = 1
+
+    def to_json(self) -> str:
+        "Serialises the state to a JSON string"
+        return json.dumps(self._asdict())
+
+    @classmethod
+    def from_json(cls, text: str) -> 'StationState':
+        "Restores a state serialised with to_json"
+        return cls(**json.loads(text))
+
+class IncrementalResult(NamedTuple):
+    "The result of an incremental update"
+    state: StationState
+    flags: pd.DataFrame
+    revisions: pd.DataFrame
+
+def _time_or_none(value) -> Optional[int]:
+    return None if value is None else int(value)
+
+def _same_value(a, b) -> bool:
+    "Equality that treats two nan's as equal, as the run-length encoding does"
+    return a == b or (a != a and b != b)
+
+def init_state(rain_data: pd.DataFrame, inter_tip_threshold: float = 5,
+               lambda_threshold: float = 5, min_burst_length: int = 1) -> StationState:
+    """Creates the state for a station from its history
+
+    Parameters
+    ----------
+    rain_data : pd.DataFrame
+        The station's rainfall time series so far. It may be empty.
+    inter_tip_threshold, lambda_threshold, min_burst_length : optional
+        The HighFrequencyTipping parameters to use for this station.
+
+    Returns
+    -------
+    StationState
+        The state at the end of the history.
+
+    """
+    State = StationState(inter_tip_threshold=inter_tip_threshold, lambda_threshold=lambda_threshold,
+                         min_burst_length=min_burst_length)
+    if len(rain_data.index) > 0:
+        State = update(State, rain_data).state
+
+    #Set the outlier threshold from the whole history, as rain_outliers does
+    if len(rain_data.index) >= 100:
+        NonZeroRainData = rain_data.values[rain_data.values > 0.2]
+        State = State._replace(outlier_threshold=float(np.quantile(NonZeroRainData, 0.99)))
+    return State
+
+def update(state: StationState, new_rows: pd.DataFrame) -> IncrementalResult:
+    """Checks newly appended observations
+
+    Parameters
+    ----------
+    state : StationState
+        The state at the end of the station's history.
+    new_rows : pd.DataFrame
+        The new observations, all later than the history.
+
+    Returns
+    -------
+    IncrementalResult
+        ``state`` is the state after the new rows. ``flags`` holds the 'DrySpellDayLengths',
+        'RepeatedValues', 'HighFrequencyTips' and 'Outlier' values for the new rows.
+        ``revisions`` has a row of 'Check', 'Start', 'End' and 'Value' for each run that
+        continued from the history into the new rows, meaning that every historic
+        observation of that check from Start to End now has the given Value.
+
+    """
+    Values = new_rows.values[:, 0].astype(float)
+    Times = new_rows.index.asi8
+    n = len(Values)
+    if n == 0:
+        return IncrementalResult(state, pd.DataFrame(index=new_rows.index,
+                                 columns=['DrySpellDayLengths', 'RepeatedValues', 'HighFrequencyTips', 'Outlier']),
+                                 pd.DataFrame(columns=['Check', 'Start', 'End', 'Value']))
+    Revisions = []
+
+    #Dry spells. A dry run open at the end of the history continues if the first new value is dry.
+    DryRuns = run_length_encode(Values == 0)
+    DryRunStarts = Times[DryRuns.starts]
+    ContinuesDry = state.dry_run_start is not None and bool(DryRuns.values[0])
+    if ContinuesDry:
+        DryRunStarts[0] = state.dry_run_start
+    DryRunDays = np.floor_divide(Times[DryRuns.ends] - DryRunStarts, 86400 * 10**9)
+    DrySpellDayLengths = per_observation(DryRuns, np.where(DryRuns.values, DryRunDays, 0)).astype(float)
+    if ContinuesDry:
+        OldDays = (state.last_time - state.dry_run_start) // (86400 * 10**9)
+        if DryRunDays[0] != OldDays:
+            Revisions.append(('DrySpellDayLengths', state.dry_run_start, state.last_time, float(DryRunDays[0])))
+    DryRunStart = int(DryRunStarts[-1]) if DryRuns.values[-1] else None
+
+    #Repeated values. The open run continues if the first new value equals the last old one.
+    RepeatRuns = run_length_encode(Values)
+    RepeatLengths = RepeatRuns.lengths.copy()
+    RepeatStarts = Times[RepeatRuns.starts]
+    ContinuesRepeat = state.repeat_length > 0 and _same_value(RepeatRuns.values[0], state.repeat_value)
+    if ContinuesRepeat:
+        RepeatLengths[0] += state.repeat_length
+        RepeatStarts[0] = state.repeat_start
+    with np.errstate(invalid='ignore'):
+        WetRuns = RepeatRuns.values > 0
+    RepeatedValues = per_observation(RepeatRuns, np.where(WetRuns, RepeatLengths, 0)).astype(float)
+    if ContinuesRepeat and WetRuns[0]:
+        Revisions.append(('RepeatedValues', state.repeat_start, state.last_time, float(RepeatLengths[0])))
+
+    #High frequency tipping, carrying on the inter-tip times and any open burst from the history
+    InterTipTimes = np.empty(n)
+    InterTipTimes[0] = np.nan if state.last_time is None else (Times[0] - state.last_time) // 10**9
+    InterTipTimes[1:] = np.floor_divide(np.diff(Times), 10**9)
+    PreviousInterTipTimes = np.concatenate(([state.last_inter_tip], InterTipTimes[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        RapidTipRateChanges = np.abs(np.log(InterTipTimes / PreviousInterTipTimes)) > state.lambda_threshold
+    SubThreshold = InterTipTimes < state.inter_tip_threshold
+    PreviousSubThreshold = np.concatenate(([state.last_inter_tip < state.inter_tip_threshold], SubThreshold[:-1]))
+
+    #Run 0 is the sub-threshold run continuing from the history, the rest start in the new rows
+    RunStarts = SubThreshold & ~PreviousSubThreshold
+    RunIDs = np.cumsum(RunStarts)
+    JumpCounts = np.cumsum(RapidTipRateChanges & SubThreshold)
+    CountsBeforeRun = np.concatenate(([-1 if state.burst_length > 0 else 0],
+                                      (JumpCounts - (RapidTipRateChanges & SubThreshold))[RunStarts]))
+    InBurst = SubThreshold & (JumpCounts > CountsBeforeRun[RunIDs])
+    BurstLengths = np.bincount(RunIDs[InBurst], minlength=len(CountsBeforeRun))
+    BurstLengths[0] += state.burst_length
+    HighFrequencyTips = InBurst & (BurstLengths[RunIDs] >= state.min_burst_length)
+    if 0 < state.burst_length < state.min_burst_length <= BurstLengths[0]:
+        Revisions.append(('HighFrequencyTips', state.burst_start, state.last_time, True))
+
+    if InBurst[-1]:
+        BurstLength = int(BurstLengths[RunIDs[-1]])
+        if RunIDs[-1] == 0 and state.burst_length > 0:
+            BurstStart = state.burst_start
+        else:
+            BurstStart = int(Times[np.argmax(InBurst & (RunIDs == RunIDs[-1]))])
+    else:
+        BurstLength, BurstStart = 0, None
+
+    #Outliers, against the threshold carried in the state
+    if state.outlier_threshold is None:
+        Outlier = np.full(n, np.nan)
+    else:
+        Outlier = np.round(Values / state.outlier_threshold, 1)
+
+    Flags = pd.DataFrame({'DrySpellDayLengths': DrySpellDayLengths, 'RepeatedValues': RepeatedValues,
+                          'HighFrequencyTips': HighFrequencyTips, 'Outlier': Outlier}, index=new_rows.index)
+
+    Revisions = pd.DataFrame(Revisions, columns=['Check', 'Start', 'End', 'Value'])
+    Revisions['Start'] = pd.to_datetime(Revisions['Start'].astype('int64'), utc=new_rows.index.tz is not None)
+    Revisions['End'] = pd.to_datetime(Revisions['End'].astype('int64'), utc=new_rows.index.tz is not None)
+    if new_rows.index.tz is not None:
+        Revisions['Start'] = Revisions['Start'].dt.tz_convert(new_rows.index.tz)
+        Revisions['End'] = Revisions['End'].dt.tz_convert(new_rows.index.tz)
+
+    NewState = state._replace(
+        n_obs = state.n_obs + n,
+        last_time = int(Times[-1]),
+        dry_run_start = _time_or_none(DryRunStart),
+        repeat_value = float(RepeatRuns.values[-1]),
+        repeat_length = int(RepeatLengths[-1]),
+        repeat_start = int(RepeatStarts[-1]),
+        last_inter_tip = float(InterTipTimes[-1]),
+        burst_length = BurstLength,
+        burst_start = _time_or_none(BurstStart))
+
+    return IncrementalResult(NewState, Flags, Revisions)
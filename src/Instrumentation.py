@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the rainfall checks.
+
+Every public check in RainDataChecks is wrapped with ``instrumented``. While
+no sink is enabled the wrapper only tests an empty list before calling the
+check. Once a sink is enabled each call emits an event dict with:
+
+    check         the check's name
+    station       the station set with ``station()``, or None
+    rows          the number of rows of the first input
+    wall_seconds  the elapsed time
+    cpu_seconds   the CPU time of the calling thread (of the process on Python 3.6)
+    peak_bytes    the peak memory allocated, if memory tracing was asked for
+    flags         the count of non-zero, non-nan values in each output column
+    error         the exception's type and message, if the check raised one
+    depth         0 for a top level call, more for a check called by another
+
+Sinks are callables taking an event. ``LoggingSink``, ``JsonLinesSink`` and
+``MemorySink`` are provided, and ``summary()`` ranks the hot spots of a run.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+class _ThreadVariable:
+    "A stand-in for contextvars.ContextVar, which Python 3.6 doesn't have, holding a value for each thread"
+    def __init__(self, name: str, default=None):
+        self.name = name
+        self.default = default
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', self.default)
+
+    def set(self, value):
+        "Sets the value, returning the previous value as the token to reset it with"
+        Token = self.get()
+        self._local.value = value
+        return Token
+
+    def reset(self, token):
+        self._local.value = token
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    ContextVar = _ThreadVariable
+
+#time.thread_time needs Python 3.7, before which the CPU time of the whole process is the closest
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+
+_SINKS = []
+_TRACE_MEMORY = False
+_STATION = ContextVar('station', default=None)
+_DEPTH = ContextVar('depth', default=0)
+
+class LoggingSink:
+    "Writes each event as a log record"
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger('RainCheckPy.profile')
+        self.level = level
+
+    def __call__(self, event: dict):
+        self.logger.log(self.level, "%s station=%s rows=%s wall=%.4fs cpu=%.4fs peak=%s flags=%s%s",
+                        event['check'], event['station'], event['rows'], event['wall_seconds'],
+                        event['cpu_seconds'], event['peak_bytes'], event['flags'],
+                        f" error={event['error']}" if event['error'] else '')
+
+class JsonLinesSink:
+    "Appends each event as a line of JSON to a file"
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, event: dict):
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(event, default=str) + '\n')
+
+class MemorySink:
+    "Keeps the events in a list"
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event: dict):
+        self.events.append(event)
+
+    def summary(self, top: int = 10, by='check') -> pd.DataFrame:
+        return summary(self.events, top=top, by=by)
+
+def enable(sink=None, memory: bool = False):
+    """Starts sending check events to a sink
+
+    Parameters
+    ----------
+    sink : callable, optional
+        Called with each event. The default is a new MemorySink.
+    memory : bool, optional
+        Whether to record the peak memory of each call with tracemalloc. This slows
+        the checks down considerably, and the peak covers every thread. The default
+        is False.
+
+    Returns
+    -------
+    The sink, so a default MemorySink can be read afterwards.
+
+    """
+    global _TRACE_MEMORY
+    sink = MemorySink() if sink is None else sink
+    _SINKS.append(sink)
+    _TRACE_MEMORY = _TRACE_MEMORY or memory
+    return sink
+
+def disable(sink=None):
+    "Stops sending events to a sink, or to every sink if none is given"
+    global _TRACE_MEMORY
+    if sink is None:
+        _SINKS.clear()
+    else:
+        _SINKS.remove(sink)
+    if not _SINKS:
+        _TRACE_MEMORY = False
+
+def enabled() -> bool:
+    "Whether any sink is receiving events"
+    return bool(_SINKS)
+
+def memory_traced() -> bool:
+    "Whether peak memory is being recorded"
+    return _TRACE_MEMORY
+
+@contextlib.contextmanager
+def profiling(sink=None, memory: bool = False):
+    "Sends check events to a sink (by default a new MemorySink) for the duration of a with block"
+    sink = enable(sink, memory=memory)
+    try:
+        yield sink
+    finally:
+        disable(sink)
+
+@contextlib.contextmanager
+def station(name):
+    "Labels the events of the checks run within a with block with a station name"
+    Token = _STATION.set(name)
+    try:
+        yield
+    finally:
+        _STATION.reset(Token)
+
+def emit(event: dict):
+    "Sends an event to every enabled sink"
+    for sink in list(_SINKS):
+        sink(event)
+
+def _rows(args):
+    "The length of a check's first input, or the total length of a dict of inputs"
+    if not args:
+        return None
+    if isinstance(args[0], dict):
+        return sum(len(value) for value in args[0].values())
+    return len(args[0]) if hasattr(args[0], '__len__') else None
+
+def _flag_counts(result) -> dict:
+    "The number of non-zero, non-nan values in each column of a check's output"
+    if isinstance(result, pd.Series):
+        result = result.to_frame(name=result.name)
+    if not isinstance(result, pd.DataFrame):
+        return None
+    Counts = {}
+    for column in result.columns:
+        Values = result[column].to_numpy()
+        if Values.dtype.kind in 'biuf':
+            Counts[str(column)] = int(np.count_nonzero(Values[~np.isnan(Values)] if Values.dtype.kind == 'f' else Values))
+    return Counts
+
+def instrumented(check):
+    "Wraps a check so that, while a sink is enabled, each call emits an event"
+    @functools.wraps(check)
+    def wrapper(*args, **kwargs):
+        if not _SINKS:
+            return check(*args, **kwargs)
+
+        Depth = _DEPTH.get()
+        DepthToken = _DEPTH.set(Depth + 1)
+        TraceMemory = _TRACE_MEMORY and not tracemalloc.is_tracing()
+        if TraceMemory:
+            tracemalloc.start()
+        Result = None
+        Error = None
+        WallStart = time.perf_counter()
+        CpuStart = _cpu_time()
+        try:
+            Result = check(*args, **kwargs)
+            return Result
+        except Exception as error:
+            Error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            CpuSeconds = _cpu_time() - CpuStart
+            WallSeconds = time.perf_counter() - WallStart
+            PeakBytes = None
+            if TraceMemory:
+                PeakBytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            _DEPTH.reset(DepthToken)
+            emit({'check': check.__name__, 'station': _STATION.get(), 'rows': _rows(args),
+                  'wall_seconds': WallSeconds, 'cpu_seconds': CpuSeconds, 'peak_bytes': PeakBytes,
+                  'flags': None if Error else _flag_counts(Result), 'error': Error, 'depth': Depth})
+    return wrapper
+
+def read_events(path: str) -> list:
+    "Reads the events written by a JsonLinesSink"
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def summary(events, top: int = 10, by='check') -> pd.DataFrame:
+    """Ranks the hot spots of a run
+
+    Parameters
+    ----------
+    events : list
+        The events of the run, e.g. ``MemorySink.events`` or ``read_events(path)``.
+    top : int, optional
+        The number of rows to return. The default is 10.
+    by : str or list, optional
+        The event fields to group by, e.g. 'check', 'station' or ['check', 'station'].
+        The default is 'check'.
+
+    Returns
+    -------
+    pd.DataFrame
+        The number of calls, errors, rows, total wall and CPU seconds and the largest
+        peak memory of each group, sorted by total wall seconds. Nested calls are
+        left out, so their time isn't counted twice.
+
+    """
+    Columns = ['calls', 'errors', 'rows', 'wall_seconds', 'cpu_seconds', 'peak_bytes']
+    Events = pd.DataFrame([event for event in events if not event.get('depth')])
+    if Events.empty:
+        return pd.DataFrame(columns=Columns)
+    Events['calls'] = 1
+    Events['errors'] = Events['error'].notna().astype(int)
+    Summary = Events.groupby(by, dropna=False).agg(calls=('calls', 'sum'), errors=('errors', 'sum'),
+                                                   rows=('rows', 'sum'), wall_seconds=('wall_seconds', 'sum'),
+                                                   cpu_seconds=('cpu_seconds', 'sum'), peak_bytes=('peak_bytes', 'max'))
+    return Summary.sort_values('wall_seconds', ascending=False).head(top)
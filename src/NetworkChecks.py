@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Network-wide comparison of rainfall stations, for choosing reference sites.
+
+Every station is aligned once onto a common time grid, keeping which time stamps
+each station has. Wet, dry and present states are packed into bit arrays so the
+affinity of a pair is a few bitwise ANDs and popcounts, and ranks are calculated
+once per station so the Spearman correlation of a pair is a few dot products. A
+KD-tree over the station coordinates limits the comparisons to each station's
+nearest neighbours.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+#Stations packed at a time
+_PACK_BLOCK = 64
+
+_M1, _M2, _M4, _H01 = (np.uint64(mask) for mask in (0x5555555555555555, 0x3333333333333333,
+                                                      0x0f0f0f0f0f0f0f0f, 0x0101010101010101))
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    "The number of set bits in each row of a 2D array of uint64 words"
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    #The SWAR popcount of each word, for NumPy before 2.0
+    words = words - ((words >> np.uint64(1)) & _M1)
+    words = (words & _M2) + ((words >> np.uint64(2)) & _M2)
+    words = (words + (words >> np.uint64(4))) & _M4
+    return ((words * _H01) >> np.uint64(56)).sum(axis=1, dtype=np.int64)
+
+class AlignedNetwork(NamedTuple):
+    "Stations on a common time grid"
+    values: pd.DataFrame
+    present: pd.DataFrame
+
+def align_network(station_data) -> AlignedNetwork:
+    """Aligns many stations onto a common time grid
+
+    Parameters
+    ----------
+    station_data : dict or pd.DataFrame
+        A dict of station name to rainfall time series (a Series or single column
+        DataFrame), or a wide DataFrame with one column per station.
+
+    Returns
+    -------
+    AlignedNetwork
+        ``values`` is a float DataFrame with one column per station on the union of all
+        the time stamps, with nan where a station has no observation, and ``present``
+        a boolean DataFrame of the time stamps each station has, whatever their value.
+        Every station of a wide DataFrame has all its time stamps.
+
+    """
+    if isinstance(station_data, pd.DataFrame):
+        return _as_aligned(station_data)
+    Columns = {station: (series.iloc[:, 0] if isinstance(series, pd.DataFrame) else series)
+               for station, series in station_data.items()}
+    Present = pd.concat({station: pd.Series(True, index=series.index) for station, series in Columns.items()}, axis=1)
+    return AlignedNetwork(pd.concat(Columns, axis=1).astype(float), Present.fillna(False).astype(bool))
+
+def _as_aligned(network) -> AlignedNetwork:
+    "The aligned network, where a wide DataFrame has every time stamp at every station"
+    if isinstance(network, AlignedNetwork):
+        return network
+    return AlignedNetwork(network.astype(float, copy=False), pd.DataFrame(True, index=network.index, columns=network.columns))
+
+def _pack(states: np.ndarray) -> np.ndarray:
+    "Packs (time x station) booleans into bits along the time axis, as a (station x word) array of uint64"
+    Padded = np.zeros((-(-len(states) // 64) * 64, states.shape[1]), dtype=bool)
+    Padded[:len(states)] = states
+    return np.ascontiguousarray(np.packbits(Padded, axis=0).T).view(np.uint64)
+
+def _packed_states(network: AlignedNetwork) -> tuple:
+    """The wet, dry and present states of each station packed into bits
+
+    As in ``affinity()``, a nan at a time stamp a station has is dry. Stations are packed
+    in blocks, so the boolean states of the whole network are never held at once.
+    """
+    Values = network.values.to_numpy(dtype=float)
+    Present = network.present.to_numpy(dtype=bool)
+    Packed = ([], [], [])
+    for block in range(0, Values.shape[1], _PACK_BLOCK):
+        BlockPresent = Present[:, block:block + _PACK_BLOCK]
+        with np.errstate(invalid='ignore'):
+            Wet = BlockPresent & (Values[:, block:block + _PACK_BLOCK] > 0)
+        for packed, states in zip(Packed, (Wet, BlockPresent & ~Wet, BlockPresent)):
+            packed.append(_pack(states))
+    Words = -(-len(Values) // 64)
+    return tuple(np.concatenate(packed) if packed else np.zeros((0, Words), dtype=np.uint64) for packed in Packed)
+
+def _pair_affinity(packed: tuple, station: int, candidates) -> np.ndarray:
+    "The affinity of one station with each of its candidates, by popcounts of the packed states"
+    Wet, Dry, Present = packed
+    BothWet = _popcount(Wet[station] & Wet[candidates])
+    BothDry = _popcount(Dry[station] & Dry[candidates])
+    BothPresent = _popcount(Present[station] & Present[candidates])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((BothWet > 0) & (BothDry > 0), (BothWet + BothDry) / BothPresent, 0)
+
+def _ranks(network: pd.DataFrame) -> np.ndarray:
+    "Average ranks of each station's observations, with nan where there is no observation"
+    return network.rank(method='average').to_numpy(dtype=float)
+
+def affinity_matrix(network) -> pd.DataFrame:
+    """Calculates the affinity of every pair of stations
+
+    This is ``affinity()``, the affinity index of Lewis et al. (2018), for every pair at
+    once: over the time stamps both stations have, taking nan as dry. The wet, dry and
+    present states are packed into bits, and each station is compared with the stations
+    after it by popcounts, so memory grows with the number of stations rather than its
+    square times the record length.
+
+    Parameters
+    ----------
+    network : AlignedNetwork or pd.DataFrame
+        Stations aligned on a common time grid, as returned by ``align_network()``, or
+        a wide DataFrame, whose stations all have every time stamp.
+
+    Returns
+    -------
+    pd.DataFrame
+        A station by station matrix of affinities.
+
+    """
+    network = _as_aligned(network)
+    Packed = _packed_states(network)
+    Stations = len(network.values.columns)
+    Affinity = np.zeros((Stations, Stations))
+    for station in range(Stations):
+        Affinity[station, station:] = _pair_affinity(Packed, station, np.arange(station, Stations))
+        Affinity[station:, station] = Affinity[station, station:]
+    return pd.DataFrame(Affinity, index=network.values.columns, columns=network.values.columns)
+
+def spearman_matrix(network) -> pd.DataFrame:
+    """Calculates the Spearman rank correlation of every pair of stations
+
+    Ranks are calculated once for each station's whole record, and the correlation
+    of a pair is the Pearson correlation of those ranks over the time steps at which
+    both stations have an observation. Where the records fully overlap this is the
+    same as ``spearman()``, otherwise it is a close approximation.
+
+    Parameters
+    ----------
+    network : AlignedNetwork or pd.DataFrame
+        Stations aligned on a common time grid, as returned by ``align_network()``, or
+        a wide DataFrame.
+
+    Returns
+    -------
+    pd.DataFrame
+        A station by station matrix of rank correlations.
+
+    """
+    network = _as_aligned(network).values
+    Ranks = _ranks(network)
+    Observed = (~np.isnan(Ranks)).astype(float)
+    Ranks = np.nan_to_num(Ranks)
+
+    #Sums over the time steps both stations observed, as matrix products
+    Counts = Observed.T @ Observed
+    Sums = Ranks.T @ Observed
+    SquareSums = (Ranks ** 2).T @ Observed
+    CrossSums = Ranks.T @ Ranks
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Covariance = CrossSums - Sums * Sums.T / Counts
+        Variance = SquareSums - Sums ** 2 / Counts
+        Spearman = Covariance / np.sqrt(Variance * Variance.T)
+    return pd.DataFrame(Spearman, index=network.columns, columns=network.columns)
+
+def _pair_spearman(Ranks: np.ndarray, station: int, candidates: np.ndarray) -> np.ndarray:
+    "Rank correlation between one station and each of its candidates"
+    Test = Ranks[:, [station]]
+    References = Ranks[:, candidates]
+    Both = ~np.isnan(Test) & ~np.isnan(References)
+    Counts = Both.sum(axis=0)
+    Test = np.where(Both, Test, 0)
+    References = np.where(Both, References, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        TestDeviations = np.where(Both, Test - Test.sum(axis=0) / Counts, 0)
+        ReferenceDeviations = np.where(Both, References - References.sum(axis=0) / Counts, 0)
+        return (TestDeviations * ReferenceDeviations).sum(axis=0) / np.sqrt(
+            (TestDeviations ** 2).sum(axis=0) * (ReferenceDeviations ** 2).sum(axis=0))
+
+def rank_references(network, coordinates: pd.DataFrame, k: int = 10,
+                    radius: float = np.inf, rank_by: str = 'Spearman') -> pd.DataFrame:
+    """Ranks the nearest candidate reference stations for every station
+
+    Parameters
+    ----------
+    network : AlignedNetwork or pd.DataFrame
+        Stations aligned on a common time grid, as returned by ``align_network()``, or
+        a wide DataFrame.
+    coordinates : pd.DataFrame
+        The planar (e.g. NZTM easting and northing) coordinates of each station, indexed
+        by station with one column per axis. Stations without coordinates are skipped.
+    k : int, optional
+        The number of nearest neighbours to consider for each station. The default is 10.
+    radius : float, optional
+        The maximum distance to a candidate, in the units of the coordinates. The default is no limit.
+    rank_by : str, optional
+        'Spearman' or 'Affinity', the statistic used to rank the candidates. The default is 'Spearman'.
+        The affinity is that of ``affinity()`` and ``affinity_matrix()``.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per station and candidate with the 'Station', 'Reference', 'Distance',
+        'Affinity', 'Spearman' and 'Rank' (1 for the best candidate) of each.
+
+    """
+    if rank_by not in ('Spearman', 'Affinity'):
+        raise ValueError(f"rank_by must be 'Spearman' or 'Affinity', not {rank_by!r}")
+    network = _as_aligned(network)
+    Stations = [station for station in network.values.columns if station in coordinates.index]
+    Network = AlignedNetwork(network.values[Stations], network.present[Stations])
+    Points = coordinates.loc[Stations].to_numpy(dtype=float)
+    Columns = ['Station', 'Reference', 'Distance', 'Affinity', 'Spearman', 'Rank']
+    if len(Stations) < 2:
+        return pd.DataFrame(columns=Columns)
+
+    #Find each station's nearest neighbours. The nearest is normally the station itself.
+    from scipy.spatial import cKDTree
+    Tree = cKDTree(Points)
+    Distances, Neighbours = Tree.query(Points, k=min(k + 1, len(Stations)), distance_upper_bound=radius)
+
+    #Pack the wet, dry and present states into bits along the time axis
+    Packed = _packed_states(Network)
+    Ranks = _ranks(Network.values)
+
+    Tables = []
+    for station in range(len(Stations)):
+        Found = (Neighbours[station] < len(Stations)) & (Neighbours[station] != station)
+        Candidates = Neighbours[station][Found][:k]
+        if len(Candidates) == 0:
+            continue
+        Tables.append(pd.DataFrame({'Station': Stations[station],
+                                    'Reference': [Stations[i] for i in Candidates],
+                                    'Distance': Distances[station][Found][:k],
+                                    'Affinity': _pair_affinity(Packed, station, Candidates),
+                                    'Spearman': _pair_spearman(Ranks, station, Candidates)}))
+    if not Tables:
+        return pd.DataFrame(columns=Columns)
+
+    References = pd.concat(Tables, ignore_index=True)
+    References['Rank'] = References.groupby('Station', sort=False)[rank_by].rank(method='first', ascending=False, na_option='bottom').astype(int)
+    return References.sort_values(['Station', 'Rank'], kind='stable').reset_index(drop=True)[Columns]
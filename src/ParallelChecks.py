@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Run a single-series check over one long record in parallel time segments.
+
+The record is split into segments of about equal length, and each segment is
+extended by the halo of rows its check needs to resolve the runs crossing its
+edges: the whole dry run (DrySpells), repeated wet value run (RepeatedValues) or
+run of rapid tips (HighFrequencyTipping), plus the two tips before the segment
+for HighFrequencyTipping. A segment is only extended where the row at its edge
+is in such a run, so long wet, missing or slow tipping stretches are cut at
+the edge. The halos are found by searching outwards from each edge, so their
+cost depends on the length of the runs at the edges, not of the record. The check is run
+on every extended segment on a thread or process pool, and the rows of each
+segment are taken from its result, giving exactly the serial result.
+
+The rain_outliers threshold depends on the whole record, so it is found once
+before the segments are run. impossibles needs no halo.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import ArrayChecks
+import RainDataChecks
+from BatchChecks import _make_executor
+from RunLengths import run_length_encode
+
+def _run_start(key_of, position: int, window: int = 1024) -> int:
+    "The position the run of equal keys containing a position starts at, searching back in growing windows"
+    while True:
+        Start = max(0, position - window)
+        Runs = run_length_encode(key_of(Start, position + 1))
+        if len(Runs.starts) > 1 or Start == 0:
+            return Start + int(Runs.starts[-1])
+        window *= 4
+
+def _run_end(key_of, position: int, length: int, window: int = 1024) -> int:
+    "The position after the end of the run of equal keys containing a position, searching forward in growing windows"
+    while True:
+        End = min(length, position + window)
+        Runs = run_length_encode(key_of(position, End))
+        if len(Runs.starts) > 1 or End == length:
+            return position + int(Runs.ends[0]) + 1
+        window *= 4
+
+def _run_halo(key_of, in_run, start: int, stop: int, length: int):
+    """The rows needed to resolve the runs crossing the edges of the segment from start to stop
+
+    An edge is only moved out to the end of its run of equal keys if the row at the
+    edge is in a run the check measures, as told by in_run of its key.
+    """
+    First = _run_start(key_of, start) if in_run(key_of(start, start + 1))[0] else start
+    Last = _run_end(key_of, stop - 1, length) if in_run(key_of(stop - 1, stop))[0] else stop
+    return First, Last
+
+def _values_key(rain_data: pd.DataFrame, **params):
+    "Keys by value, for the runs of RepeatedValues, which measures the runs of wet values"
+    Values = rain_data.values[:, 0]
+    def in_run(keys):
+        with np.errstate(invalid='ignore'):
+            return keys > 0
+    return (lambda start, stop: Values[start:stop]), in_run
+
+def _dry_key(rain_data: pd.DataFrame, **params):
+    "Keys by whether dry, for the runs of DrySpells, which measures the dry runs"
+    Values = rain_data.values[:, 0]
+    return (lambda start, stop: Values[start:stop] == 0), (lambda keys: keys)
+
+def _rapid_tip_key(rain_data: pd.DataFrame, inter_tip_threshold: float = 5, **params):
+    "Keys by whether the inter-tip time is below the threshold, for the runs of HighFrequencyTipping"
+    Times = rain_data.index.asi8
+
+    def key_of(start, stop):
+        InterTipTimes = np.full(stop - start, np.nan)
+        First = max(start, 1)
+        InterTipTimes[First - start:] = np.floor_divide(Times[First:stop] - Times[First - 1:stop - 1], 10**9)
+        return InterTipTimes < inter_tip_threshold
+    return key_of, (lambda keys: keys)
+
+#The keys of the runs of each run based check, and which keys are in a run it measures
+RUN_KEYS = {'DrySpells': _dry_key, 'RepeatedValues': _values_key, 'HighFrequencyTipping': _rapid_tip_key}
+
+def _outlier_segment(rain_data: pd.DataFrame, ninety_ninth: float) -> pd.DataFrame:
+    "rain_outliers for a segment, given the threshold of the whole record"
+    return pd.DataFrame(ArrayChecks.outlier_index(rain_data.values, ninety_ninth), columns=['Outlier'], index=rain_data.index)
+
+def _segments(name: str, rain_data: pd.DataFrame, segments: int, params: dict) -> list:
+    "The (first, last) rows of each extended segment, and the (start, stop) rows of the segment itself"
+    n = len(rain_data)
+    KeyOf = RUN_KEYS.get(name)
+    KeyOf = None if KeyOf is None else KeyOf(rain_data, **params)
+    Edges = np.linspace(0, n, max(1, min(segments, n)) + 1).astype(int)
+    Segments = []
+    for start, stop in zip(Edges[:-1], Edges[1:]):
+        First, Last = start, stop
+        if KeyOf is not None and stop > start:
+            First, Last = _run_halo(*KeyOf, start, stop, n)
+            if name == 'HighFrequencyTipping':
+                #The inter-tip time and lambda sub k at the start of the segment depend on the two tips before it
+                First = max(0, First - 2)
+        Segments.append((First, Last, start, stop))
+    return Segments
+
+def _run_segment(check, rain_data: pd.DataFrame, start: int, stop: int, params: dict) -> pd.DataFrame:
+    "Runs a check on an extended segment and returns the rows of the segment itself"
+    return check(rain_data, **params).iloc[start:stop]
+
+def run_segmented(check, rain_data: pd.DataFrame, segments: int = None, executor: str = 'thread',
+                  max_workers: int = None, **params) -> pd.DataFrame:
+    """Runs a single-series check on time segments of one record in parallel
+
+    Parameters
+    ----------
+    check : str or callable
+        One of 'impossibles', 'rain_outliers', 'DrySpells', 'RepeatedValues' or
+        'HighFrequencyTipping', or the function itself.
+    rain_data : pd.DataFrame
+        A time series of rainfall amounts (or of tips for HighFrequencyTipping).
+    segments : int, optional
+        The number of segments. The default is the number of workers.
+    executor : str, optional
+        'thread' for a ThreadPoolExecutor, 'process' for a ProcessPoolExecutor or
+        'serial' to run the segments in turn. The default is 'thread'.
+    max_workers : int, optional
+        The number of workers in the pool. The default is the number of CPUs.
+    **params
+        Any other arguments of the check, e.g. ``minimum_precision`` or ``inter_tip_threshold``.
+
+    Returns
+    -------
+    pd.DataFrame
+        The same result as the check run on the whole record.
+
+    """
+    Name = check if isinstance(check, str) else getattr(check, '__name__', repr(check))
+    if Name not in ('impossibles', 'rain_outliers', 'DrySpells', 'RepeatedValues', 'HighFrequencyTipping'):
+        raise ValueError(f"{Name} can't be run in segments")
+    Check = getattr(RainDataChecks, Name)
+    n = len(rain_data)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if segments is None:
+        segments = max_workers
+
+    #Find the whole record threshold (or that of a sketch) first, so every segment uses the same one
+    if Name == 'rain_outliers':
+        Sketch = params.get('sketch')
+        if n < 100 and Sketch is None:
+            return Check(rain_data)
+        Check = _outlier_segment
+        params = {'ninety_ninth': ArrayChecks._outlier_threshold(rain_data.values) if Sketch is None
+                  else Sketch.quantile(0.99)}
+
+    Tasks = [(rain_data.iloc[First:Last], start - First, stop - First)
+             for First, Last, start, stop in _segments(Name, rain_data, segments, params)]
+
+    if executor == 'serial' or len(Tasks) == 1:
+        Results = [_run_segment(Check, data, start, stop, params) for data, start, stop in Tasks]
+    else:
+        with _make_executor(executor, max_workers) as pool:
+            Futures = [pool.submit(_run_segment, Check, data, start, stop, params) for data, start, stop in Tasks]
+            Results = [future.result() for future in Futures]
+    #Join the segments' values onto the record's own index, rather than concatenating their indices
+    return pd.DataFrame(np.concatenate([result.to_numpy() for result in Results]), columns=Results[0].columns,
+                        index=rain_data.index)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+The Pettitt (1979) non-parametric change point test, for many stations at once.
+
+The input is a stations x years matrix of annual totals, with nan for missing
+years, which are skipped. The U statistic for every candidate change point of
+every station comes from cumulative sums of ranks. p-values are from Pettitt's
+approximation, or optionally from random permutations of each station's ranks,
+which can be spread across a process pool.
+"""
+
+import concurrent.futures
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+class PettittResult(NamedTuple):
+    "The Pettitt test result for each station"
+    U: np.ndarray
+    change_point: np.ndarray
+    p: np.ndarray
+    h: np.ndarray
+
+def _as_matrix(annual_totals) -> np.ndarray:
+    "A float stations x years matrix"
+    Matrix = np.asarray(annual_totals, dtype=float)
+    return Matrix.reshape(1, -1) if Matrix.ndim == 1 else Matrix
+
+def _u_statistics(annual_totals: np.ndarray):
+    """The Pettitt U statistic at every year of every station
+
+    Returns the U matrix, with 0 where a year isn't a candidate change point, and the
+    number of years with data for each station.
+    """
+    Valid = ~np.isnan(annual_totals)
+    Ranks = pd.DataFrame(annual_totals).rank(axis=1).to_numpy()
+    RankSums = np.nancumsum(Ranks, axis=1)
+    Counts = np.cumsum(Valid, axis=1)
+    n = Counts[:, -1:] if Counts.shape[1] > 0 else np.zeros((len(Counts), 1), dtype=int)
+    U = 2 * RankSums - Counts * (n + 1)
+    #A change point is after a year with data, and not after the last one
+    U[~Valid | (Counts >= n)] = 0
+    return U, n[:, 0]
+
+def _permutation_p_values(ranks_and_u, permutations: int, seed_sequences):
+    "Permutation p-values for a list of (ranks, U) pairs, one per station"
+    PValues = []
+    for (ranks, u), seed in zip(ranks_and_u, seed_sequences):
+        n = len(ranks)
+        rng = np.random.default_rng(seed)
+        Permuted = rng.permuted(np.tile(ranks, (permutations, 1)), axis=1)
+        PermutedU = np.abs(2 * np.cumsum(Permuted, axis=1)[:, :-1] - np.arange(1, n) * (n + 1)).max(axis=1)
+        PValues.append(((PermutedU >= u).sum() + 1) / (permutations + 1))
+    return PValues
+
+def pettitt_test(annual_totals, alpha: float = 0.05, permutations: int = 0, seed=None,
+                 max_workers: int = None) -> PettittResult:
+    """Applies the Pettitt change point test to every station
+
+    Parameters
+    ----------
+    annual_totals : array_like
+        A stations x years matrix (or a single series) of annual totals, with nan for
+        missing years.
+    alpha : float, optional
+        The significance level. The default is 0.05.
+    permutations : int, optional
+        The number of random permutations used to find the p-values. The default is 0,
+        which uses Pettitt's approximation instead.
+    seed : int, optional
+        Seeds the permutations, so the p-values are reproducible.
+    max_workers : int, optional
+        The number of processes to spread the permutations over. The default is to use
+        the calling process.
+
+    Returns
+    -------
+    PettittResult
+        For each station, the maximum absolute U statistic, the column index of the
+        last year before the most likely change point (-1 if the station has fewer than
+        two years), the p-value and whether the series is inhomogeneous (p < alpha).
+
+    """
+    AnnualTotals = _as_matrix(annual_totals)
+    U, n = _u_statistics(AnnualTotals)
+    MaxU = np.abs(U).max(axis=1) if U.shape[1] > 0 else np.zeros(len(U))
+    ChangePoint = np.where(n >= 2, np.abs(U).argmax(axis=1) if U.shape[1] > 0 else -1, -1)
+
+    if permutations:
+        Ranks = pd.DataFrame(AnnualTotals).rank(axis=1).to_numpy()
+        Tested = np.flatnonzero(n >= 2)
+        RanksAndU = [(Ranks[station][~np.isnan(Ranks[station])], MaxU[station]) for station in Tested]
+        Seeds = np.random.SeedSequence(seed).spawn(len(Tested))
+        P = np.ones(len(AnnualTotals))
+        if max_workers and max_workers > 1 and len(Tested) > 1:
+            Chunks = np.array_split(np.arange(len(Tested)), max_workers)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+                Futures = [pool.submit(_permutation_p_values, [RanksAndU[i] for i in chunk], permutations,
+                                       [Seeds[i] for i in chunk]) for chunk in Chunks]
+                P[Tested] = np.concatenate([future.result() for future in Futures])
+        elif len(Tested) > 0:
+            P[Tested] = _permutation_p_values(RanksAndU, permutations, Seeds)
+    else:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            P = np.minimum(1, 2 * np.exp(-6 * MaxU ** 2 / (n.astype(float) ** 3 + n.astype(float) ** 2)))
+        P[n < 2] = 1
+
+    return PettittResult(MaxU, ChangePoint, P, P < alpha)
+
+def homogeneous_start(annual_totals, alpha: float = 0.05, min_years: int = 3, permutations: int = 0,
+                      seed=None, max_workers: int = None) -> np.ndarray:
+    """Finds the first year of each station's most recent homogeneous segment
+
+    The Pettitt test is applied to each station's annual totals. While a station is
+    found to be inhomogeneous, the test is repeated on the years after the change point,
+    as long as there are more than ``min_years`` of them. All the stations still being
+    tested are tested together at each step.
+
+    Parameters
+    ----------
+    annual_totals : array_like
+        A stations x years matrix (or a single series) of annual totals, with nan for
+        missing years.
+    alpha : float, optional
+        The significance level. The default is 0.05.
+    min_years : int, optional
+        Only series with more than this many years are tested. The default is 3.
+    permutations, seed, max_workers : optional
+        Passed to ``pettitt_test()``.
+
+    Returns
+    -------
+    np.ndarray
+        The column index of the first year of the most recent homogeneous segment of each
+        station, 0 where the whole series is homogeneous.
+
+    """
+    AnnualTotals = _as_matrix(annual_totals)
+    Start = np.zeros(len(AnnualTotals), dtype=int)
+    Active = (~np.isnan(AnnualTotals)).sum(axis=1) > min_years
+    Step = 0
+    while Active.any():
+        #Test the years from each active station's current start
+        Remaining = AnnualTotals[Active].copy()
+        Remaining[np.arange(Remaining.shape[1]) < Start[Active][:, None]] = np.nan
+        Result = pettitt_test(Remaining, alpha=alpha, permutations=permutations,
+                              seed=None if seed is None else [seed, Step], max_workers=max_workers)
+        Stations = np.flatnonzero(Active)
+        Inhomogeneous = Result.h & (Result.change_point >= 0)
+        Start[Stations[Inhomogeneous]] = Result.change_point[Inhomogeneous] + 1
+        #Keep testing the stations with a change point, if enough years follow it
+        Active[Stations[~Inhomogeneous]] = False
+        Active[Stations[Inhomogeneous]] = (AnnualTotals.shape[1] - Start[Stations[Inhomogeneous]]) > min_years
+        Step += 1
+    return Start
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Mergeable quantile sketches for the outlier and divergence thresholds.
+
+A QuantileSketch is a t-digest: a few hundred weighted centroids that summarise
+a distribution, finest in the tails where the thresholds are. Sketches can be
+built per chunk or per station, merged into a station's whole record or a
+region, and saved as JSON, so a threshold can be kept up to date by adding the
+new data to a saved sketch rather than rescanning the history. A threshold from
+a sketch is approximate: the rank error is at most about
+2π√(q(1-q))/compression, e.g. 0.3 % of the ranks at the 99th percentile with the
+default compression, and is usually much smaller.
+
+The builders below make the sketch of the values each threshold is a
+percentile of, for the checks' ``sketch`` parameters.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+
+import ArrayChecks
+
+class QuantileSketch:
+    """A mergeable and serialisable t-digest of a distribution
+
+    Parameters
+    ----------
+    compression : float, optional
+        The size of the sketch, which keeps at most about compression / 2 centroids.
+        Larger sketches are more accurate. The default is 200.
+
+    """
+    def __init__(self, compression: float = 200):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    @classmethod
+    def from_values(cls, values, compression: float = 200) -> 'QuantileSketch':
+        "A sketch of an array of values, ignoring nan's"
+        return cls(compression).add(values)
+
+    @classmethod
+    def from_counts(cls, values, counts, compression: float = 200) -> 'QuantileSketch':
+        "A sketch of distinct values, each occurring the given number of times"
+        Values = np.asarray(values, dtype=float)
+        Counts = np.asarray(counts, dtype=float)
+        Sketch = cls(compression)
+        Kept = ~np.isnan(Values) & (Counts > 0)
+        if Kept.any():
+            Values, Counts = Values[Kept], Counts[Kept]
+            Sketch.minimum, Sketch.maximum = Values.min(), Values.max()
+            Sketch._compress(Values, Counts)
+        return Sketch
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray, ordered: bool = False):
+        """Merges weighted points into centroids
+
+        The points are sorted (unless already ordered), and those starting in the same unit
+        of the t-digest scale k = compression / 2π * arcsin(2q - 1) of their cumulative
+        weight q are merged. A unit is a small range of q near 0 and 1, so the tails are
+        kept in fine detail.
+        """
+        if not ordered:
+            Order = np.argsort(means, kind='stable')
+            means, weights = means[Order], weights[Order]
+        Before = (np.cumsum(weights) - weights) / weights.sum()
+        Scale = self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * Before - 1, -1, 1))
+        Units = np.floor(Scale - Scale[0]).astype(np.int64)
+        #The units increase along the points, so each new unit starts the next centroid
+        Clusters = np.concatenate(([0], np.cumsum(Units[1:] != Units[:-1])))
+        self.weights = np.bincount(Clusters, weights=weights)
+        self.means = np.bincount(Clusters, weights=means * weights) / self.weights
+
+    def add(self, values) -> 'QuantileSketch':
+        "Adds values, ignoring nan's, and returns the sketch"
+        Values = ArrayChecks.as_values(values, dtype=float).ravel()
+        Values = Values[~np.isnan(Values)]
+        if len(Values) > 0:
+            self.minimum = min(self.minimum, Values.min())
+            self.maximum = max(self.maximum, Values.max())
+            #Sort the new values and slot the (already sorted) centroids in among them
+            Values = np.sort(Values)
+            Positions = np.searchsorted(Values, self.means) + np.arange(len(self.means))
+            Means = np.empty(len(Values) + len(self.means))
+            Weights = np.ones(len(Means))
+            IsValue = np.ones(len(Means), dtype=bool)
+            IsValue[Positions] = False
+            Means[IsValue], Means[Positions], Weights[Positions] = Values, self.means, self.weights
+            self._compress(Means, Weights, ordered=True)
+        return self
+
+    def merge(self, *others: 'QuantileSketch') -> 'QuantileSketch':
+        "A new sketch of this and other sketches' values together, with this sketch's compression"
+        Merged = QuantileSketch(self.compression)
+        Sketches = [sketch for sketch in (self,) + others if sketch.count > 0]
+        if Sketches:
+            Merged.minimum = min(sketch.minimum for sketch in Sketches)
+            Merged.maximum = max(sketch.maximum for sketch in Sketches)
+            Merged._compress(np.concatenate([sketch.means for sketch in Sketches]),
+                             np.concatenate([sketch.weights for sketch in Sketches]))
+        return Merged
+
+    @property
+    def count(self) -> float:
+        "The number of values added"
+        return float(self.weights.sum())
+
+    def quantile(self, q):
+        """The approximate quantile (or array of quantiles) of the values, nan if there are none
+
+        Interpolates linearly between the centroid means, placing each at the middle of its
+        weight, so a sketch of few enough values that every centroid is a single value gives
+        exactly np.quantile.
+        """
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        Centres = np.cumsum(self.weights) - self.weights / 2
+        Ranks = np.concatenate(([0], Centres, [self.count]))
+        Values = np.concatenate(([self.minimum], self.means, [self.maximum]))
+        Quantile = np.interp(np.asarray(q, dtype=float) * (self.count - 1) + 0.5, Ranks, Values)
+        return Quantile if np.ndim(q) else float(Quantile)
+
+    def to_json(self) -> str:
+        "Serialises the sketch to a JSON string"
+        return json.dumps({'compression': self.compression, 'means': self.means.tolist(),
+                           'weights': self.weights.tolist(),
+                           'minimum': None if self.count == 0 else float(self.minimum),
+                           'maximum': None if self.count == 0 else float(self.maximum)})
+
+    @classmethod
+    def from_json(cls, text: str) -> 'QuantileSketch':
+        "Restores a sketch serialised with to_json"
+        State = json.loads(text)
+        Sketch = cls(State['compression'])
+        Sketch.means = np.array(State['means'], dtype=float)
+        Sketch.weights = np.array(State['weights'], dtype=float)
+        if State['minimum'] is not None:
+            Sketch.minimum, Sketch.maximum = State['minimum'], State['maximum']
+        return Sketch
+
+    def __repr__(self):
+        #The digest of the centroids identifies the sketch in ResultCache keys
+        Digest = hashlib.sha1(self.means.tobytes() + self.weights.tobytes()).hexdigest()[:12]
+        return f"QuantileSketch(compression={self.compression}, count={self.count:g}, digest={Digest})"
+
+def outlier_sketch(values, compression: float = 200) -> QuantileSketch:
+    "A sketch of the rainfall above 0.2, whose 99th percentile is the rain_outliers threshold"
+    Values = ArrayChecks.as_values(values, dtype=float).ravel()
+    return QuantileSketch.from_values(Values[Values > 0.2], compression)
+
+def rain_sketch(values, compression: float = 200) -> QuantileSketch:
+    "A sketch of the non-zero rainfall, whose 99th percentile is the RelatedFlowEvents high rain threshold"
+    Values = ArrayChecks.as_values(values, dtype=float).ravel()
+    return QuantileSketch.from_values(Values[Values > 0], compression)
+
+def prominence_sketch(flow, compression: float = 200) -> QuantileSketch:
+    "A sketch of the prominences of the peaks of a daily flow series, whose 95th percentile scales RelatedFlowEvents"
+    return QuantileSketch.from_values(ArrayChecks._peak_prominences(flow)[1], compression)
+
+def divergence_sketches(test_timestamps, test_values, reference_timestamps, reference_values,
+                        compression: float = 200) -> tuple:
+    """Sketches of the negative and of the positive test minus reference differences
+
+    Their 5th and 95th percentiles are the neighborhoodDivergence low and high thresholds.
+    """
+    Differences = ArrayChecks._complete_differences(test_timestamps, test_values, reference_timestamps,
+                                                    reference_values)[1]
+    return (QuantileSketch.from_values(Differences[Differences < 0], compression),
+            QuantileSketch.from_values(Differences[Differences > 0], compression))
+
+def dry_proportion_sketch(test_timestamps, test_values, reference_timestamps, reference_values,
+                          window = '15d', completeness: float = 1.0, compression: float = 200) -> QuantileSketch:
+    "A sketch of the positive dry proportion differences, whose 95th percentile is the DrySpellDivergence threshold"
+    Differences = ArrayChecks._outer_dry_proportion_differences(test_timestamps, test_values, reference_timestamps,
+                                                                reference_values, [window], completeness)[1][window]
+    with np.errstate(invalid='ignore'):
+        return QuantileSketch.from_values(Differences[Differences >= 0], compression)
@@ -8,15 +8,14 @@ Created on Tue Mar 19 14:41:10 2021
 #Load modules
 import numpy as np
 import pandas as pd
-import itertools
-import numbers
-import math
-from scipy.signal import find_peaks
-import pytz
-import random
-import scipy.stats as st
-
-def rain_outliers( rain_data: pd.DataFrame ) -> pd.DataFrame:
+#scipy is imported by the checks that use it, so workers running only the light checks start quickly
+
+import ArrayChecks
+from TimeBase import time_base
+from Instrumentation import instrumented
+
+@instrumented
+def rain_outliers( rain_data: pd.DataFrame, sketch = None ) -> pd.DataFrame:
     """Generates an outlier index time series
     
     Finds the ratio between each value to the ninety-ninth percentile of non-zero values.
@@ -25,6 +24,10 @@ def rain_outliers( rain_data: pd.DataFrame ) -> pd.DataFrame:
     ----------
     rain_data : pd.DataFrame
         A time series of rainfall amounts to be tested.
+    sketch : QuantileSketch, optional
+        A sketch of the rainfall above 0.2 (see ``QuantileSketch.outlier_sketch()``), e.g. of
+        the station's whole history or of a region, whose approximate 99th percentile is used
+        instead of the percentile of rain_data.
 
     Returns
     -------
@@ -33,376 +36,401 @@ def rain_outliers( rain_data: pd.DataFrame ) -> pd.DataFrame:
 
     """
     "Rainfall quality check for outliers"
-    
-    if len(rain_data.index) < 100:
-        Output = pd.DataFrame(np.nan, columns=['Outlier'],index=rain_data.index)
-    else:
-        #Remove all the 0 observations
-        NonZeroRainData = rain_data.values[rain_data.values > 0.2]
-    
-        #Find the ninetyninth percentile of the data
-        NinetyNinth = np.quantile(NonZeroRainData,0.99)
-    
-        #Find the ratio of each observation to the 99th perentile
-        OutlierData = np.round(rain_data.values / NinetyNinth,1)
-        
-        Output = pd.DataFrame(OutlierData, columns=['Outlier'],index=rain_data.index)
-    
-    return Output
+    NinetyNinth = None if sketch is None else sketch.quantile(0.99)
+    return pd.DataFrame(ArrayChecks.outlier_index(rain_data.values, NinetyNinth), columns=['Outlier'],index=rain_data.index)
 
+@instrumented
 def impossibles ( rain_data,minimum_precision=float('nan')):
-    "rainfall quality check for impossible values"
-    
-    #Test for non-numbers, but don't include nan's
-    NotANumber = ~np.array([isinstance(item,numbers.Number) for item in rain_data.values[:,0]])
-    
-    #Test for numeric values less than 0
-    Sub_zeros = rain_data.apply(pd.to_numeric, errors='coerce') < 0
-        
-    #Test for numeric values that are not multiples of the minimum precision
-    if not(math.isnan(minimum_precision)) and (minimum_precision > 0):
-        False_precision = rain_data.apply(pd.to_numeric, errors='coerce') % minimum_precision != 0
-    else: False_precision = NotANumber
-    
-    ImpossibleData = Sub_zeros.Rainfall.to_numpy() | NotANumber | False_precision
-        
-    Output = pd.DataFrame(ImpossibleData, columns=['Impossible'],index=rain_data.index)
-    
-    return Output
+    """Rainfall quality check for impossible values
+
+    Flags values that are not numbers (nan's are not flagged), are negative, or are not
+    a multiple of the minimum precision. Numeric columns skip the type test, and the
+    precision test is done exactly on values scaled to integers (e.g. tenths of a mm).
+
+    Parameters
+    ----------
+    rain_data : pd.DataFrame
+        A time series of rainfall amounts to be tested.
+    minimum_precision : float, optional
+        The resolution of the data, e.g. 0.2 for a 0.2 mm tipping bucket. The default
+        is nan, which doesn't test the precision.
 
+    Returns
+    -------
+    impossibles : pd.DataFrame
+        A boolean time series, True for impossible values.
+
+    """
+    ImpossibleData = ArrayChecks.impossible(rain_data.iloc[:,0].to_numpy(), minimum_precision)
+    return pd.DataFrame(ImpossibleData, columns=['Impossible'],index=rain_data.index)
+
+@instrumented
 def DateTimeIssues (rain_data):
     "rainfall quality check for duplicate date times"
     
-    DateTimeDuplicated = rain_data.index.duplicated(keep = False)
+    #An index keeps whether it is unique, so only look for the duplicates if it isn't
+    if rain_data.index.is_unique:
+        DateTimeDuplicated = np.zeros(len(rain_data.index), dtype=bool)
+    else:
+        DateTimeDuplicated = ArrayChecks.duplicate_times(rain_data.index)
     
     Output = pd.DataFrame(DateTimeDuplicated, columns=['DuplicateDateTimes'],index=rain_data.index)
     
     return Output
 
-def HighFrequencyTipping (rain_data):
-    "rainfall quality check for unlikely rapid tipping"
-    "from Blekinsop et al. (2017) lambda sub k statistic"
-    "This is only appropriate for raw tip-based data"
-    
-    #Create a timeseries of inter-tip times in seconds
-    InterTipTimes = rain_data.index.to_series().diff().astype('timedelta64[s]')
-    
-    #Test data
-    #InterTipTimes = pd.Series([8,7,3,4,2,1,2,3,2,4,1,2,3,8,7,900,2,1,3,2,1,3,2,4,1,2,3,9,7,8])
-    
-    #Pre-allocate an array for the error series
-    HighFrequencyTips = np.zeros(len(InterTipTimes),dtype=bool)
-    
-    #Calculate the lambda sub k statistic time series. This is a measure of the rate of change of inter-tip times
-    LambdaSubK = np.log(InterTipTimes / InterTipTimes.shift(1)).abs()
-    
-    #Identify ocurrences of lambda sub k greater than 5
-    RapidTipRateChanges = LambdaSubK > 5
- 
-    #create boolean series of sub threshold interTipTimes
-    SubThresholdInterTipTimesBoolean = InterTipTimes < 5
-      
-    #For each Lanbdasubk below the threshold, get the indices of the 
-    # immediately-following sequence of sub 5s intertiptimes. If there 
-    # are 10 or more of them, mark the output for those time steps as suspect.
-    RapidTipRateChangeIndices = np.where(RapidTipRateChanges)
-    if len(RapidTipRateChangeIndices[0]) > 0:
-        for index in RapidTipRateChangeIndices:
-            #Find how many of the subsequent inter-tip times are less than 5 s
-            SubThresholdTripTime = SubThresholdInterTipTimesBoolean[index[0]]
-            NoOfSubThresholdTripTimes = 0
-            while SubThresholdTripTime:
-                NoOfSubThresholdTripTimes = NoOfSubThresholdTripTimes + 1
-                SubThresholdTripTime = SubThresholdInterTipTimesBoolean[index[0] + NoOfSubThresholdTripTimes]
-            HighFrequencyTips[index[0]:(index+NoOfSubThresholdTripTimes)[0]]= True 
+@instrumented
+def HighFrequencyTipping (rain_data: pd.DataFrame, inter_tip_threshold: float = 5,
+                          lambda_threshold: float = 5, min_burst_length: int = 1) -> pd.DataFrame:
+    """Rainfall quality check for unlikely rapid tipping
+
+    Uses the lambda sub k statistic from Blenkinsop et al. (2017). Each sudden change
+    in tip rate (lambda sub k above ``lambda_threshold``) that is followed by a sequence of
+    inter-tip times below ``inter_tip_threshold`` seconds marks those tips as suspect.
+    This is only appropriate for raw tip-based data.
+
+    Parameters
+    ----------
+    rain_data : pd.DataFrame
+        A time series of rain tips.
+    inter_tip_threshold : float, optional
+        Inter-tip times (s) below this are considered rapid. The default is 5.
+    lambda_threshold : float, optional
+        Lambda sub k values above this mark a sudden change in tip rate. The default is 5.
+    min_burst_length : int, optional
+        The minimum number of rapid tips needed for a burst to be flagged. The default is 1.
+
+    Returns
+    -------
+    HighFrequencyTipping : pd.DataFrame
+        A boolean time series, True for suspect tips.
+
+    """
+    HighFrequencyTips = ArrayChecks.high_frequency_tips(rain_data.index, inter_tip_threshold = inter_tip_threshold,
+                                                        lambda_threshold = lambda_threshold,
+                                                        min_burst_length = min_burst_length)
 
     Output = pd.DataFrame(HighFrequencyTips, columns=['HighFrequencyTips'],index=rain_data.index)  
     return Output
 
+@instrumented
 def DrySpells (rain_data):
     "rainfall quality check for dry spells"
     "identify the length (in days) of a dry spell that a no-rain observation is within"
     "Alternative method using runlength encoding"
     
-    #Create a one dimensional boolean panda series of dry/not dry
-    DryObservations = pd.DataFrame((rain_data.values == 0),columns=["Dry"],index=rain_data.index)
-    
-    #Create a run-length-encoded version of the data
-    RLE = [(k, sum(1 for i in g)) for k,g in itertools.groupby(DryObservations['Dry'])]
-    
-    
-    RunLengthCodes = [a_tuple[0] for a_tuple in RLE]
-    #Get the end index of each run by cusum the rle totals
-    RunLengths = [a_tuple[1] for a_tuple in RLE]
-    
-    #Get the indices of the start and finish of each run
-    RunLengthEndIndices = np.cumsum(RunLengths)-1
-    RunLengthStartIndices = np.insert(RunLengthEndIndices[0:-1]+1,0,0,axis=0)
-    
-    #Get the subset that is for the dry runs
-    DryRunLengthEndIndices = RunLengthEndIndices[RunLengthCodes]
-    DryRunLengthStartIndices = RunLengthStartIndices[RunLengthCodes]
-    
-    #Get the start dates and end dates of the run lengths
-    DryRunEndDateTimes = DryObservations.index[DryRunLengthEndIndices]
-    DryRunStartDateTimes = DryObservations.index[DryRunLengthStartIndices]
-    
-    DryRunTimeLength = (DryRunEndDateTimes - DryRunStartDateTimes).days
+    DrySpellDayLengths = ArrayChecks.dry_spell_day_lengths(rain_data.index, rain_data.values[:,0])
     
-    #Initialise a nan series ready to be populated with dry run day lengths
-    DryObservations['DrySpellDayLengths'] = np.nan
-    #DryObservations['RunLengthCodes'] = np.nan
-    #breakpoint()
-    #populate the new columns with the dry run day lengths 
-    #Note mix of iloc and column name indexing, needed to avoid setting value of copy of a slice
-    DryObservations.iloc[DryRunLengthEndIndices,DryObservations.columns.get_loc('DrySpellDayLengths')] = DryRunTimeLength
-    #DryObservations['RunLengthCodes'].iloc[RunLengthEndIndices] = RunLengths
-    #fill the gaps with next valid value
-    DryObservations.DrySpellDayLengths.fillna(method='backfill',inplace=True)
-    #DryObservations.RunLengthCodes.fillna(method='backfill',inplace=True)
-    #Make all non-zero rainfalls have run lengths of 0
-    DryObservations.loc[~DryObservations.Dry,'DrySpellDayLengths'] = 0
-    
-    Output = DryObservations[['DrySpellDayLengths']]
+    Output = pd.DataFrame(DrySpellDayLengths, columns=['DrySpellDayLengths'],index=rain_data.index)
     
     return Output
 
 
+@instrumented
 def RepeatedValues (rain_data):
     "rainfall quality check for unlikely repeating values"
     "identify the length (in consecutive time units) that a value is repeated"
     "this check should not be applied to tip data"
     
-    #Create a one dimensional boolean panda series of wet/not wet
-    WetObservations = pd.DataFrame(((rain_data.values > 0) * rain_data.values),columns=["Wet"],index=rain_data.index)
-    
-    #Create a run-length-encoded version of the data
-    RLE = [(k, sum(1 for i in g)) for k,g in itertools.groupby(rain_data.iloc[:,0])]
-    
-    RunLengthCodes = np.array([a_tuple[0] for a_tuple in RLE])
-    #Get the end index of each run by cusum the rle totals
-    RunLengths = np.array([a_tuple[1] for a_tuple in RLE])
-    
-    #Get the indices of the finish of each run
-    RunLengthEndIndices = np.cumsum(RunLengths)-1
-    
-    #Get the subset that is for the wet runs
-    WetRunLengthEndIndices = RunLengthEndIndices[RunLengthCodes>0]
-    WetRunLengths = RunLengths[RunLengthCodes>0]
-    #WetRunLengthStartIndices = RunLengthStartIndices[RunLengthCodes]
+    RepeatedValues = ArrayChecks.repeated_values(rain_data.values[:,0])
     
-    #Initialise a nan series ready to be populated with dry run day lengths
-    WetObservations['RepeatedValues'] = np.nan
-    #DryObservations['RunLengthCodes'] = np.nan
-    
-    #populate the new columns with the wet run lengths 
-    WetObservations.iloc[WetRunLengthEndIndices,WetObservations.columns.get_loc('RepeatedValues')] = WetRunLengths
-    #DryObservations['RunLengthCodes'].iloc[RunLengthEndIndices] = RunLengths
-    #fill the gaps with next valid value
-    WetObservations.RepeatedValues.fillna(method='backfill',inplace=True)
-    #DryObservations.RunLengthCodes.fillna(method='backfill',inplace=True)
-    #Make all non-zero rainfalls have run lengths of 0
-    WetObservations.loc[~(WetObservations.Wet > 0),'RepeatedValues'] = 0
-    
-    Output = WetObservations[['RepeatedValues']]
+    Output = pd.DataFrame(RepeatedValues, columns=['RepeatedValues'],index=rain_data.index)
     
     return Output
 
-def Homogeneity (rain_data):
+@instrumented
+def Homogeneity (rain_data, alpha: float = 0.05, permutations: int = 0, seed = None):
     """Applies the Pettitt non-parameteric test to annual series to determine if there are major inhomogeneities in the data
        If there is, the test is repeated on the most recent side of the inhomogeneity to test if there is another.
        The most recent section that is homogeneous is retained and the remainder flagged.
-       This uses the pyHomogeneity package https://github.com/mmhs013/pyHomogeneity
+       The test itself is in the Pettitt module, which also tests many stations at once.
+       p-values are from Pettitt's approximation, unless a number of random permutations is given.
     """
-    import pyhomogeneity as hg
-
     if len(rain_data.index) < 100:
-        Output = pd.DataFrame(np.nan, columns=['Homogeneous'],index=rain_data.index)
+        return pd.DataFrame(np.nan, columns=['Homogeneous'],index=rain_data.index)
+    #Years are local, so timezone aware time stamps are analysed as local times
+    if rain_data.index.tz is None:
+        Times, Base = rain_data.index.asi8, time_base(rain_data.index)
     else:
-        #Initialise Homogeneous timeseries assuming everything is OK 
-        Homogeneous = pd.DataFrame(True, columns=['Homogeneous','ChangePoint'],index=rain_data.index)
-        
-        #Create an annual series from the data if it exists, using years with at least 96 % of a year (i.e. 11 and a half months)
-        DataStepLengthInHours = (rain_data.index[1] - rain_data.index[0]).total_seconds()//3600
-        AnnualData = rain_data.resample("1y").sum(min_count = int(0.96 * 365 * 24 / DataStepLengthInHours ))
-        #Check for homogeneity if there are more than 3 years of data
-        if AnnualData.count().any() > 3:   
-            #Apply the Pettitt test to the annual totals
-            result = hg.pettitt_test(AnnualData)
-            #While there is inhomogeneity, Keep checking the series after it
-            MoreInhomogeneity = result.h
-            while MoreInhomogeneity:
-                Homogeneous[Homogeneous.index < pd.to_datetime(result.cp)]=False
-                if len(AnnualData[AnnualData.index > pd.to_datetime(result.cp)]) > 3:
-                    result=hg.pettitt_test(AnnualData[AnnualData.index > pd.to_datetime(result.cp)])
-                    MoreInhomogeneity = result.h
-                else: MoreInhomogeneity = False
-    
-        Output = Homogeneous
-    return Output
+        Times, Base = rain_data.index.tz_localize(None).asi8, None
+    Homogeneous = ArrayChecks.homogeneous(Times, rain_data.iloc[:,0].to_numpy(dtype=float), alpha=alpha,
+                                          permutations=permutations, seed=seed, base=Base)
+    return pd.DataFrame({'Homogeneous': Homogeneous, 'ChangePoint': Homogeneous}, index=rain_data.index)
 
+@instrumented
 def SubFreezingRain (rain_data, temperature_data):
     """"rainfall quality check for observations during freezing temperatures
     identify the observations when the maximum temperature was less than zero degrees C
     """
 
-    #merge the rain and temperature data together
-    RainAndTemperature = pd.merge(left = rain_data,right = temperature_data, left_index=True,right_index=True, how = 'left')
-
-    #find when it is raining and the temperature is less than zero
-    RainAndTemperature['FreezingRain'] = (RainAndTemperature.Rainfall > 0) & (RainAndTemperature.TMax < 0)  
-    
-    Output = RainAndTemperature['FreezingRain']
+    #match the temperature to the rain time stamps, and find when it is raining and the temperature is less than zero
+    FreezingRain = ArrayChecks.freezing_rain(rain_data.index, rain_data.Rainfall.to_numpy(dtype=float),
+                                             temperature_data.index, temperature_data.TMax.to_numpy(dtype=float),
+                                             base = time_base(temperature_data.index))
     
-    return Output
+    return pd.Series(FreezingRain, index=rain_data.index, name='FreezingRain')
+
+#NZST, as a nanosecond offset from UTC
+_NZST_OFFSET = 12 * 3600 * 10**9
+
+def _flow_peaks(Daily_streamflow_data, sketch = None) -> pd.Series:
+    """Finds the flow peaks of a flow site and their prominence relative to the 95th percentile
 
-def RelatedFlowEvents (rain_data, Daily_streamflow_data):
+    Peaks are higher than the inter-peak low by at least 10 % of the mean flow. This definition
+    should identify most peaks without getting the tiny variations. The prominence of each peak
+    is the vertical difference between the peak and the lowest point within 'wlen' of the peak,
+    or to the next peak that is higher than the current peak, if that is less than 'wlen'.
+    The peak times are in NZST with the timezone removed, to match the rain data.
+    The 95th percentile is taken from a sketch of the prominences if one is given.
+    """
+    Peaks, RelativeProminence = ArrayChecks.flow_peaks(Daily_streamflow_data['Streamflow'].to_numpy(dtype=float),
+                                                       None if sketch is None else sketch.quantile(0.95))
+    DaysWithPeaks = Daily_streamflow_data.index[Peaks]
+    
+    #Strip timezone from the peak times to make them compatible with the rain and temperature data.
+    #NZST (Etc/GMT-12) is a fixed offset, so the local times are the UTC time stamps plus 12 hours, without a conversion.
+    if DaysWithPeaks.tzinfo is not None:
+        DaysWithPeaks = pd.DatetimeIndex((DaysWithPeaks.asi8 + _NZST_OFFSET).view('datetime64[ns]'), name=DaysWithPeaks.name)
+    
+    return pd.Series(RelativeProminence, index=DaysWithPeaks, name='Peak_prominence')
+
+def _related_flow_events(rain_data, FlowPeaks: pd.Series, event_gap = '12h', sketch = None) -> pd.Series:
+    "RelatedFlowEvents for one rain gauge, given the flow peaks of a flow site"
+    #Time stamps with and without a timezone never match, as in a reindex
+    if (rain_data.index.tz is None) != (FlowPeaks.index.tz is None):
+        FlowPeaks = FlowPeaks.iloc[:0]
+    PeakProminence = ArrayChecks.related_flow_events(rain_data.index, rain_data.iloc[:,0].to_numpy(dtype=float),
+                                                     FlowPeaks.index, FlowPeaks.to_numpy(dtype=float),
+                                                     event_gap = event_gap, base = time_base(rain_data.index),
+                                                     ninety_ninth = None if sketch is None else sketch.quantile(0.99))
+    return pd.Series(PeakProminence, index=rain_data.index, name='Peak_prominence')
+
+@instrumented
+def RelatedFlowEvents (rain_data, Daily_streamflow_data, event_gap = '12h', rain_sketch = None, prominence_sketch = None):
     """"rainfall quality check for observations compared to flow events
     for each time step allocate the relative magnitude of a peak flow event ocurring on the same day or the day after
     but only if rain events are associated with flow events
     used with daily streamflow and hourly rainfall, possibly daily rainfall, but it hasn't been tested yet.'
+    High rain (above the 99th percentile) is split into events on the gaps between high rain time steps
+    rounded to event_gap, and the proportion of events with a flow peak is compared with the proportion of all time steps with one.
+    The high rain and peak prominence percentiles are approximated from QuantileSketch's of the
+    non-zero rain (``rain_sketch``) and of the flow peak prominences (``prominence_sketch``) if given.
     """
-    #For testing, get some rain data and some stream flow data
-    #from LoadDataFunctions import LoadFrom_ClimateDataBase_netCDF
-    #rain_data = LoadFrom_ClimateDataBase_netCDF(AgentNumber = 17610)['Hourly'] #This is Snowdon Raws site near the head of the Selwyn
-    #rain_data = LoadFrom_ClimateDataBase_netCDF(AgentNumber = 41489)['Hourly'] #This is Arthurs Pass
-    #Check the timezone, and if not set, set it to NZST
-    #if rain_data.index.tzinfo is None or rain_data.index.tzinfo.utcoffset(rain_data.index) is None: rain_data.index=  rain_data.index.tz_localize(pytz.timezone("Etc/GMT-12"))
-    
-    #from LoadDataFunctions import LoadFromTethysDownloads_csv
-    #Daily_streamflow_data = LoadFromTethysDownloads_csv()['Daily'] #This is Selwyn at Whitecliffs
-    #Daily_streamflow_data = LoadFromTethysDownloads_csv(RawDataFileName ='../../Data/tethysDownloads/Waimakariri River at Otarama.csv')['Daily']
-    
-    #For testing, restrict to last 3 years
-    #Daily_streamflow_data = Daily_streamflow_data.iloc[-1095:,]
-
-    #Only apply test if there is more than two days of data
-    if  max(rain_data.index)- min(rain_data.index) < pd.Timedelta('2 days'):
-        RainAndFlow = rain_data.copy()
-        RainAndFlow['Peak_prominence'] = np.nan
-    else: 
-        
-        #Find flow peaks, where a peak is higher than the inter-peak low by at least 20 % of the mean flow.
-        #This definition should identify most peaks without getting the tiny variations
-        #the function returns (among other things) the prominence of each peak, which is the 
-        #vertical difference between the peak and the lowest point within 'wlen' of the peak, 
-        #or to the next peak that is higher than the current peak, if that is less than 'wlen'.
-        
-        peaks = find_peaks(Daily_streamflow_data['Streamflow'], height = 0, prominence=Daily_streamflow_data.mean().item() * 0.1,wlen = 3)
-        DaysWithPeaks = Daily_streamflow_data.index[peaks[0]]
-        #Get the 95th percentile of the peak prominences
-        NinetyFifthPP = np.quantile(peaks[1]['prominences'],0.95)
-        
-        #Find the ratio of each peak's prominence to the 95th perentile
-        RelativeProminence = np.round(peaks[1]['prominences'] / NinetyFifthPP,3)
-        
-        #Create a data frame with the same index as the flow data, but with the peak data in it on the days with peaks
-        FlowPeakSeries = pd.DataFrame(index = Daily_streamflow_data.index, columns = ['Peak_prominence'])
-        FlowPeakSeries.loc[DaysWithPeaks,'Peak_prominence'] = RelativeProminence
-        
-        #Strip timezone from FlowPeakSeries to make it compatible with the rain and temperature data
-        if FlowPeakSeries.index.tzinfo is not None: 
-            FlowPeakSeries.index=  FlowPeakSeries.index.tz_convert(pytz.timezone("Etc/GMT-12"))
-            FlowPeakSeries.index=  FlowPeakSeries.index.tz_localize(None)
-        
-        #merge the rain and flow peak data together
-        RainAndFlow = pd.merge(left = rain_data,right = FlowPeakSeries['Peak_prominence'], left_index=True,right_index=True, how = 'left')
-        
-        
-        #fill flow peak so that the whole day has the flow peak relative prominence value, and backfill for 24 hours to associate with possible rain, accounting for time-to-concentration
-        FillLength = int(24 // ((RainAndFlow.index[1] - RainAndFlow.index[0]).total_seconds()//3600))
-        RainAndFlow.loc[:,'Peak_prominence'] = RainAndFlow.loc[:,'Peak_prominence'].fillna(method="pad",limit=FillLength-1).fillna(method='bfill', limit=FillLength).fillna(0)
-        
-        #Determine if high rainfall events are associated with peak flow events
-        #GetRainEvents > 99th percentile
-        #Get peak prominence for those events
-        NonZeroRainData = rain_data.values[rain_data.values > 0]
-    
-        #Find the ninetyninth percentile of the data
-        NinetyNinth = np.quantile(NonZeroRainData,0.99)
-        
-        #Find the rain events that are greater than the 99th
-        HighRainHours = RainAndFlow['Rainfall'] > NinetyNinth
-        
-        #Need to get each rain events maximum hourly rainfall, where events are spearated by at least 12 hours.
-        #Get the time difference between each high rainfall event
-        TimeDifferenceSeriesOnhighRainEvents = HighRainHours[HighRainHours].index.to_series().diff().to_frame()
-        
-        #Round the differences to the nearest 6 hours
-        TimeDifferenceSeriesOnhighRainEvents['RoundedDateTime'] = TimeDifferenceSeriesOnhighRainEvents['DateTime'].dt.round('12H')
-        
-        #Add the rain and the flow peak prominence values back on
-        TimeDifferenceSeriesOnhighRainEvents['Rainfall']        = RainAndFlow.loc[HighRainHours,'Rainfall']
-        TimeDifferenceSeriesOnhighRainEvents['Peak_prominence'] = RainAndFlow.loc[HighRainHours,'Peak_prominence']
-        
-        #Apply magic to group by RoundedTDateTime and get maximum rainfall and flow peak prominence for each event
-        RainEventPeakProminence = TimeDifferenceSeriesOnhighRainEvents.groupby((TimeDifferenceSeriesOnhighRainEvents['RoundedDateTime'] != TimeDifferenceSeriesOnhighRainEvents['RoundedDateTime'].shift()).cumsum(), as_index=False).agg(
-            {'DateTime': 'first', 'Rainfall': 'max', 'Peak_prominence': 'max'})
-            
-        #Get peak prominence for random hours
-        NumberOfSamples = min(len(RainAndFlow.index),10000)
-        RandomPeakProminence = RainAndFlow.loc[RainAndFlow.index[random.sample(range(0,len(RainAndFlow.index)),NumberOfSamples)],'Peak_prominence']
-        
-        #Likelihood of flow peak event from random hours
-        RandomPeakLilelihood = np.count_nonzero(RandomPeakProminence)/NumberOfSamples
-               
-        #Test whether the likelihood of flow events during high rainfall events is different from the likelihood flow events during random hours.
-        #Use a binomial test.
-        #The null hypothesis is that the likelihoods match. So if the result is less than 0.01, this means there is a small likelihood that they are the same, so they can be considered different.
-        #If the result is > 0.01 then they're considered the same, and so flow events are not going to be helpful in confirming high rainfall events.
-        ProbabilityThatFlowEventsDuringHighRainEventsMatchesRandom = st.binom_test(x=np.count_nonzero(RainEventPeakProminence['Peak_prominence']),
-                                                                                   n=RainEventPeakProminence['Peak_prominence'].count(),p=RandomPeakLilelihood)
-        
-        #If the flow peaks are not statistically related to rain events, reset the Peak_provenance to NA
-        if ProbabilityThatFlowEventsDuringHighRainEventsMatchesRandom > 0.01:
-           RainAndFlow['Peak_prominence'] = np.nan
-    
+    return _related_flow_events(rain_data, _flow_peaks(Daily_streamflow_data, prominence_sketch),
+                                event_gap = event_gap, sketch = rain_sketch)
+
+@instrumented
+def CatchmentRelatedFlowEvents (rain_data_sites: dict, streamflow_sites: dict, pairs = None, event_gap = '12h') -> pd.DataFrame:
+    """Applies RelatedFlowEvents to many rain gauge and flow site pairs of a catchment
+
+    The flow peaks of each flow site are found once and reused for every rain gauge.
+
+    Parameters
+    ----------
+    rain_data_sites : dict
+        Rain gauge name to rainfall time series.
+    streamflow_sites : dict
+        Flow site name to daily 'Streamflow' time series.
+    pairs : list, optional
+        The (rain gauge, flow site) pairs to check. The default is every combination.
+    event_gap : str, optional
+        The unit the gaps between high rain time steps are rounded to when splitting them
+        into events. The default is '12h'.
+
+    Returns
+    -------
+    CatchmentRelatedFlowEvents : pd.DataFrame
+        The 'Peak_prominence' series of each pair, with (rain gauge, flow site) columns.
+
+    """
+    if pairs is None:
+        pairs = [(gauge, site) for gauge in rain_data_sites for site in streamflow_sites]
+    FlowPeaks = {site: _flow_peaks(streamflow_sites[site]) for site in {site for _, site in pairs}}
+    return pd.concat({(gauge, site): _related_flow_events(rain_data_sites[gauge], FlowPeaks[site], event_gap = event_gap)
+                      for gauge, site in pairs}, axis=1)
+
 
-    
-    Output = RainAndFlow['Peak_prominence']
-    
-    return Output
 
 
+class _cached_property:
+    "functools.cached_property, which needs Python 3.8: the value is made on first use and kept on the instance"
+    def __init__(self, function):
+        self.function = function
+        self.__doc__ = function.__doc__
 
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        Value = instance.__dict__[self.name] = self.function(instance)
+        return Value
+
+class StationPair:
+    """A test site and a reference site, aligned once for all the pairwise checks
+
+    The aligned data, and the series derived from it (wet/dry masks, ranks,
+    differences and the cumulative dry counts behind the rolling windows), are
+    made when first needed and kept. Running several checks on a pair therefore
+    aligns and derives them once. Each pairwise check is a method, and the
+    module level functions create a pair to run one check.
+
+    Parameters
+    ----------
+    TestData : pd.DataFrame
+        A time series of rainfall amounts for the site being tested.
+    ReferenceData : pd.DataFrame
+        A time series of rainfall amounts for the site to be compared with.
 
+    """
+    def __init__(self, TestData: pd.DataFrame, ReferenceData: pd.DataFrame):
+        self.TestData = TestData
+        self.ReferenceData = ReferenceData
+        self._dry_proportion_differences = {}
+
+    @_cached_property
+    def inner_rows(self):
+        """The positions in the test and the reference data of their common time stamps
+
+        These are found with a binary search when both indices are sorted and unique
+        time stamps in the same timezone, and are None otherwise.
+        """
+        TestIndex, ReferenceIndex = self.TestData.index, self.ReferenceData.index
+        if not (isinstance(TestIndex, pd.DatetimeIndex) and isinstance(ReferenceIndex, pd.DatetimeIndex)
+                and TestIndex.tz == ReferenceIndex.tz and len(ReferenceIndex) > 0
+                and TestIndex.is_monotonic_increasing and TestIndex.is_unique
+                and ReferenceIndex.is_monotonic_increasing and ReferenceIndex.is_unique):
+            return None
+        return ArrayChecks._inner_rows(TestIndex.asi8, ReferenceIndex.asi8)
+
+    @_cached_property
+    def inner(self) -> pd.DataFrame:
+        "The 'Test' and 'Reference' data, discarding periods not common to both"
+        if self.inner_rows is None:
+            Inner = self.TestData.join(self.ReferenceData, how='inner', lsuffix='_Test', rsuffix='_ref')
+            Inner.columns = ['Test', 'Reference']
+            return Inner
+        TestRows, ReferenceRows = self.inner_rows
+        return pd.DataFrame({'Test': self.TestData.iloc[:, 0].to_numpy()[TestRows],
+                             'Reference': self.ReferenceData.iloc[:, 0].to_numpy()[ReferenceRows]},
+                            index=self.TestData.index[TestRows])
+
+    @_cached_property
+    def wet(self) -> tuple:
+        "Boolean arrays of when the test and the reference site are wet, in the common periods"
+        with np.errstate(invalid='ignore'):
+            return self.inner.Test.to_numpy(dtype=float) > 0, self.inner.Reference.to_numpy(dtype=float) > 0
+
+    @_cached_property
+    def complete_mask(self) -> np.ndarray:
+        "A boolean array of the common periods without nan at either site"
+        return self.inner.notna().all(axis=1).to_numpy()
+
+    @_cached_property
+    def complete(self) -> pd.DataFrame:
+        "The common periods without nan at either site"
+        return self.inner[self.complete_mask]
+
+    @_cached_property
+    def ranks(self) -> np.ndarray:
+        "The ranks of the test and reference values (columns) in the complete periods, ties given their average rank"
+        import scipy.stats as st
+        return st.rankdata(self.complete.to_numpy(dtype=float), axis=0)
+
+    @_cached_property
+    def differences(self) -> np.ndarray:
+        "The test minus the reference values in the complete periods"
+        return self.complete.Test.to_numpy(dtype=float) - self.complete.Reference.to_numpy(dtype=float)
+
+    @_cached_property
+    def outer(self) -> pd.DataFrame:
+        "The 'Test' and 'Reference' data over the period both sites have data"
+        Outer = self.TestData.join(self.ReferenceData, how='outer', lsuffix='_Test', rsuffix='_ref')
+        Outer.columns = ['Test', 'Reference']
+        #Get rid of the NaN's at the begining and end
+        first_idx = max(self.TestData.first_valid_index(), self.ReferenceData.first_valid_index())
+        last_idx = min(self.TestData.last_valid_index(), self.ReferenceData.last_valid_index())
+        return Outer.loc[first_idx:last_idx]
+
+    @_cached_property
+    def dry_counts(self) -> np.ndarray:
+        "Cumulative counts of the dry and the observed time steps of both sites, over the outer alignment"
+        return ArrayChecks._dry_counts(self.outer.Test.to_numpy(dtype=float), self.outer.Reference.to_numpy(dtype=float))
+
+    def dry_proportion_differences(self, window: str, completeness: float = 1.0) -> np.ndarray:
+        "The test minus the reference proportion of dry time steps over the trailing window, nan where it is incomplete"
+        if (window, completeness) not in self._dry_proportion_differences:
+            Times = self.outer.index.asi8
+            Base = time_base(self.outer.index)
+            Step = Base.step if Base.regular else None
+            #Each site's own time step sets its observations in a complete window, as the outer steps of offset grids are shorter
+            MinObservations = tuple(ArrayChecks._window_min_observations(window, time_base(data.index).step, completeness)
+                                    for data in (self.TestData, self.ReferenceData))
+            self._dry_proportion_differences[(window, completeness)] = ArrayChecks._dry_proportion_differences(
+                Times, None, None, [window], [MinObservations], counts=self.dry_counts, step=Step)[window]
+        return self._dry_proportion_differences[(window, completeness)]
+
+    def affinity(self) -> float:
+        "The affinity index; see ``affinity()``"
+        return ArrayChecks._affinity(*self.wet)
+
+    def spearman(self) -> float:
+        "The Spearman rank correlation coefficient; see ``spearman()``"
+        return ArrayChecks._spearman(self.ranks)
+
+    def neighborhoodDivergence(self, sketches = None) -> pd.DataFrame:
+        "The high and low divergence of the test from the reference; see ``neighborhoodDivergence()``"
+        Thresholds = (None, None) if sketches is None else (sketches[0].quantile(0.05), sketches[1].quantile(0.95))
+        LowOutlierData, HighOutlierData = ArrayChecks._divergence(self.differences, *Thresholds)
+
+        #Put them on the test data's time stamps, to include all the zero and nan observations
+        Divergence = pd.DataFrame({'LowOutlierData': LowOutlierData, 'HighOutlierData': HighOutlierData},
+                                  index=self.complete.index)
+        if self.inner_rows is None:
+            return pd.merge(Divergence, self.TestData, left_index=True, right_index=True, how='right')[Divergence.columns]
+        Rows = self.inner_rows[0][self.complete_mask]
+        Output = np.full((len(self.TestData), 2), np.nan)
+        Output[Rows] = Divergence.to_numpy()
+        return pd.DataFrame(Output, columns=Divergence.columns, index=self.TestData.index)
+
+    def DrySpellDivergence(self, windows = '15d', completeness: float = 1.0, sketch = None):
+        "The dry proportion outlier index for one or more windows; see ``DrySpellDivergence()``"
+        Sketches = sketch if isinstance(sketch, dict) else {window: sketch for window in
+                                                             ([windows] if isinstance(windows, str) else windows)}
+        def index(window):
+            NinetyFifth = None if Sketches.get(window) is None else Sketches[window].quantile(0.95)
+            return ArrayChecks._dry_proportion_outlier_index(self.dry_proportion_differences(window, completeness),
+                                                             NinetyFifth)
+        if isinstance(windows, str):
+            return pd.Series(index(windows), index=self.outer.index, name='DryProportionOutlierIndex')
+        return pd.DataFrame({f'DryProportionOutlierIndex_{window}': index(window) for window in windows},
+                            index=self.outer.index)
+
+    def TimeStepAllignment(self) -> pd.DataFrame:
+        "The reference data summed to the test observation times; see ``TimeStepAllignment()``"
+        return TimeStepAllignment(self.TestData, self.ReferenceData)
+
+    def all_checks(self) -> dict:
+        "The result of each pairwise check with its default parameters, by check name"
+        return {'affinity': self.affinity(), 'spearman': self.spearman(),
+                'neighborhoodDivergence': self.neighborhoodDivergence(), 'DrySpellDivergence': self.DrySpellDivergence()}
+
+@instrumented
 def affinity( TestData, ReferenceData):
     'Compare the data between two sites to see how similar they are'
     'this uses an "affinity" index from Lewis et al. 2018, supplementary material'
-    
-    #join the two sets of data discarding periods not common to both
-    result = TestData.join(ReferenceData, how='inner',lsuffix='_Test',rsuffix='_ref')
-    result.columns =['Test','Reference']
-    
-    #Find the wet/dry values for each gauge
-    TestWetDry = result.Test > 0
-    ReferenceWetDry = result.Reference > 0
-    
-    #Combine the WetDry series together. Both wet = 2, both dry = 0
-    BothWet = (TestWetDry * 1) + (ReferenceWetDry * 1)
-    
-    #Count the total number of both wets one wet or both drys
-    CombinedTotals = BothWet.groupby(BothWet.values).count()
-    #breakpoint()
-    if ((0 in CombinedTotals) & (2 in CombinedTotals)):
-        Affinity = CombinedTotals[0] / CombinedTotals.sum() + CombinedTotals[2] / CombinedTotals.sum()
-    else:
-        Affinity = 0
-    return Affinity
+    'the proportion of the common time steps that are wet at both sites or dry at both sites'
+    'nan is taken as dry, and the affinity is 0 unless there are both some both-wet and some both-dry time steps'
+    return StationPair(TestData, ReferenceData).affinity()
 
+@instrumented
 def spearman( TestData, ReferenceData):
     "calculate the Spearman rank correlation coefficient between sites"
-    
-    #join the two sets of data discarding periods not common to both
-    result = TestData.join(ReferenceData, how='inner',lsuffix='_Test',rsuffix='_ref')
-    result.columns =['Test','Reference']
-    
-    CorrelationMatrix = result.corr(method="spearman")
-    Spearman = CorrelationMatrix.Test['Reference']
-        
-    return Spearman
+    "over the time steps common to both sites, without nan at either"
+    return StationPair(TestData, ReferenceData).spearman()
  
-def neighborhoodDivergence( TestData: pd.DataFrame, ReferenceData: pd.DataFrame) -> pd.DataFrame:
+@instrumented
+def neighborhoodDivergence( TestData: pd.DataFrame, ReferenceData: pd.DataFrame, sketches = None) -> pd.DataFrame:
     """Compares rainfall amounts to a another site
     
     Finds the ratio between the daily rainfall difference and the ninety-fifth percentile of
@@ -418,6 +446,10 @@ def neighborhoodDivergence( TestData: pd.DataFrame, ReferenceData: pd.DataFrame)
         A time series of rainfall amounts for the site being tested.
     ReferenceData : pd.DataFrame
         A time series of rainfall amounts for the site to be compared with.
+    sketches : tuple, optional
+        QuantileSketch's of the negative and the positive differences (see
+        ``QuantileSketch.divergence_sketches()``), e.g. of the pair's whole history, whose
+        approximate 5th and 95th percentiles are used instead of those of the data.
 
     Returns
     -------
@@ -429,121 +461,158 @@ def neighborhoodDivergence( TestData: pd.DataFrame, ReferenceData: pd.DataFrame)
         i.e. ratio of the min(0,Test - Reference) / 5th(min(0,Test - Reference)
 
     """
-    
-    #Subset the TestData to just those observations of rain
-    #TestDataNoRain = TestData.loc[TestData.Rainfall > 0,]
+    return StationPair(TestData, ReferenceData).neighborhoodDivergence(sketches)
 
-    #join the two sets of data discarding periods not common to both
-    result = TestData.join(ReferenceData, how='inner',lsuffix='_Test',rsuffix='_ref')
-    result.columns =['Test','Reference']
-    
-    #discard any dates with nan in either column
-    result = result.dropna()
-        
-    #Create a series of absolute differences
-    result['Differences'] = result.Test - result.Reference
-
-    #Get the 95th percentile of the differences, but only if there are some positive differences
-    if sum(result.Differences > 0) > 0:
-        PosNinetyFifth = np.quantile(result.Differences[result.Differences > 0],0.95)
-        #Find the ratio of each observation to the positive differences 95th percentile
-        result['HighOutlierData'] = np.round(result.Differences / PosNinetyFifth,1)
-        result.loc[result['HighOutlierData']<=0,'HighOutlierData'] = 0
-    else:
-       result['HighOutlierData'] = 0
-     
-
-    #Get the 5th percentile of differences, but only if there are some negative differences
-    if sum(result.Differences < 0) > 0:
-        NegFifth       = np.quantile(result.Differences[result.Differences < 0],0.05)
-        #Find the ratio of each observation to the negative differences 5th percentile
-        result['LowOutlierData'] = np.round(result.Differences / NegFifth,1)
-        result.loc[result['LowOutlierData']<=0,'LowOutlierData'] = 0
-    else:
-       result['LowOutlierData'] = 0 
-      
-    #Join with the original data to include all the zero and nan observations
-    neighborhoodDivergence = pd.merge(result,TestData,on='DateTime', how='right')[['LowOutlierData','HighOutlierData']]
-    #neighborhoodDivergence = pd.merge(result,TestData,on='DateTime', how='right').fillna(0)[['LowOutlierData','HighOutlierData']]
-    
-       
-    return neighborhoodDivergence
+@instrumented
+def DrySpellDivergence( TestData, ReferenceData, windows = '15d', completeness: float = 1.0, sketch = None):
+    """Compares how dry a site is to a reference site
 
-def DrySpellDivergence( TestData, ReferenceData):
-    "find the ratio between the 15-day dry spell proportion difference and the ninety-fifth percentile of"
-    "the distribution of the 15-day dry-spell proportion differences"
-    
-    #join the two sets of data 
-    result = TestData.join(ReferenceData, how='outer',lsuffix='_Test',rsuffix='_ref')
-    result.columns =['Test','Reference']
-    
-    #Restrict to when there is a time overlap
-        #Get rid of the NaN's at the begining and end
-    first_idx = max(TestData.first_valid_index(),ReferenceData.first_valid_index())
-    last_idx = min(TestData.last_valid_index(),ReferenceData.last_valid_index())
+    Finds the ratio between the difference in the proportion of dry observations over the
+    previous 15 days (test minus reference) and the ninety-fifth percentile of the positive
+    differences. A window is only used if it is complete at both sites, i.e. it has at least
+    ``completeness`` of the observations expected at the series' time step (360 for 15 days
+    of hourly data).
 
-    result = result.loc[first_idx:last_idx]
-    
-        #Add boolean columns for no-rain observations
-    result['TestDry']=result.Test == 0
-    result['ReferenceDry']=result.Reference == 0
-    
-    
-    #Calculate the proportion of dry days in each 15 days for both gauges
-    result['Test15dayDryCounts'] = result.TestDry.rolling(window='15d').sum()
-    result['Reference15dayDryCounts'] = result.ReferenceDry.rolling(window='15d').sum()
-    
-    result['Test15dayObservationCounts'] = result.Test.rolling(window='15d').count()
-    result['Reference15dayObservationCounts'] = result.Reference.rolling(window='15d').count()
-    #Calculate a proportion difference series between the two gauges, but only when all 15 days were observed at both sites
-    result['15DayDryProportionDifference'] = (result.Test15dayDryCounts / result.Test15dayObservationCounts) - (result.Reference15dayDryCounts / result.Reference15dayObservationCounts)
-    
-    #The following was replaced by the following following because it violates the python issue of setting a value on a copy of a slice!
-    #result['15DayDryProportionDifference'][(result['Test15dayObservationCounts'] < 360)|(result['Reference15dayObservationCounts'] < 360)] = np.nan
-    result.loc[(result['Test15dayObservationCounts'] < 360)|(result['Reference15dayObservationCounts'] < 360),'15DayDryProportionDifference'] = np.nan
-    
-    #Find the ninety fifth percentile of dry days portion positive differences (positive because we're only interested when the test is drier than the reference)
-    if sum(result['15DayDryProportionDifference'] >= 0) > 0:
-        DryProportionDiffereneNinetyFifth = np.quantile(result['15DayDryProportionDifference'][result['15DayDryProportionDifference'].notna() & (result['15DayDryProportionDifference'] >= 0)],0.95)
-    else:
-        DryProportionDiffereneNinetyFifth = 1
-    #Calculate the ratio of the dry day proportion difference to the 95th percentile
-    result['DryProportionOutlierIndex'] = np.round(result['15DayDryProportionDifference'] / DryProportionDiffereneNinetyFifth,1)
-    result.loc[result['DryProportionOutlierIndex']<=0,'DryProportionOutlierIndex'] = 0
-    
+    Parameters
+    ----------
+    TestData : pd.DataFrame
+        A time series of rainfall amounts for the site being tested.
+    ReferenceData : pd.DataFrame
+        A time series of rainfall amounts for the site to be compared with.
+    windows : str or list, optional
+        The window length, or a list of window lengths (e.g. ['7d', '15d', '30d']) to
+        calculate in one pass. The default is '15d'.
+    completeness : float, optional
+        The proportion of expected observations needed for a window to be complete.
+        The default is 1.0.
+    sketch : QuantileSketch or dict, optional
+        A sketch of the positive dry proportion differences (see
+        ``QuantileSketch.dry_proportion_sketch()``), or a dict of them by window, whose
+        approximate 95th percentile is used instead of that of the data.
+
+    Returns
+    -------
+    DrySpellDivergence : pd.Series or pd.DataFrame
+        For a single window, a time series of the 'DryProportionOutlierIndex'. For a list
+        of windows, a DataFrame with a 'DryProportionOutlierIndex_<window>' column for each.
+
+    """
+    #Calculate the dry proportion differences over the period both sites have data, but only when each window was complete at both sites.
+    #Find the ratio of the dry day proportion difference to the ninety fifth percentile of positive differences
+    #(positive because we're only interested when the test is drier than the reference).
     #A big difference indicates suspect data
-    DrySpellDivergence = result.DryProportionOutlierIndex
-        
-    return DrySpellDivergence
+    return StationPair(TestData, ReferenceData).DrySpellDivergence(windows, completeness, sketch)
+
+@instrumented
+def neighborhoodConsensus( TestData: pd.DataFrame, ReferenceData, flag_ratio: float = 1.0, sketches = None,
+                           neighbours: bool = False) -> pd.DataFrame:
+    """Compares rainfall amounts to several neighbouring sites at once
+
+    Finds the neighborhoodDivergence of the test site from every reference, and how many of
+    the references agree the test value is divergent. The references are aligned with the
+    test data into one time by reference array, rather than joined one at a time, and the
+    5th and 95th percentiles of every reference's differences are found together.
+
+    Parameters
+    ----------
+    TestData : pd.DataFrame
+        A time series of rainfall amounts for the site being tested.
+    ReferenceData : pd.DataFrame or dict
+        The reference sites' rainfall. Either a DataFrame with one column per reference
+        on a shared index, or a dict of reference name to time series. The time stamps of
+        the test and every reference must be sorted and unique.
+    flag_ratio : float, optional
+        The divergence above which a reference flags a test value. The default is 1.0,
+        i.e. beyond the reference's 5th or 95th percentile difference.
+    sketches : dict, optional
+        The (negative, positive) difference QuantileSketch's of any of the references, by
+        name, as for ``neighborhoodDivergence()``.
+    neighbours : bool, optional
+        Whether to include each reference's 'LowOutlierData_<name>' and
+        'HighOutlierData_<name>' columns. The default is False.
 
+    Returns
+    -------
+    neighborhoodConsensus : pd.DataFrame
+        A time series of the number of references with a value at the time step
+        ('Neighbours'), the median low and high divergence over them
+        ('MedianLowOutlierData' and 'MedianHighOutlierData') and the number of references
+        whose low or high divergence is above the flag ratio ('LowFlagCount' and
+        'HighFlagCount').
+
+    """
+    if isinstance(ReferenceData, pd.DataFrame):
+        Names = list(ReferenceData.columns)
+        References = [(ReferenceData.index, ReferenceData.to_numpy(dtype=float))]
+    else:
+        Names = list(ReferenceData)
+        References = [(series.index, (series.iloc[:, 0] if isinstance(series, pd.DataFrame) else series).to_numpy(dtype=float))
+                      for series in ReferenceData.values()]
+    for index, _ in References:
+        if (getattr(index, 'tz', None) is None) != (getattr(TestData.index, 'tz', None) is None):
+            raise TypeError("Cannot compare tz-naive and tz-aware time stamps")
+
+    Sketches = {} if sketches is None else sketches
+    Fifth = [Sketches[name][0].quantile(0.05) if name in Sketches else np.nan for name in Names]
+    NinetyFifth = [Sketches[name][1].quantile(0.95) if name in Sketches else np.nan for name in Names]
+    Low, High = ArrayChecks.neighborhood_divergences(TestData.index, TestData.iloc[:, 0].to_numpy(dtype=float),
+                                                     References, Fifth, NinetyFifth)
+    Consensus = ArrayChecks.divergence_consensus(Low, High, flag_ratio)
+    if neighbours:
+        for column, name in enumerate(Names):
+            Consensus[f'LowOutlierData_{name}'] = Low[:, column]
+            Consensus[f'HighOutlierData_{name}'] = High[:, column]
+    return pd.DataFrame(Consensus, index=TestData.index)
+
+@instrumented
 def TimeStepAllignment( TestData, ReferenceData):
-    "This resamples the ReferenceData to match the observation times of the TestData"
-    "this helps for comparison to irregularly sampled data (e.g. storage gauges"
-    "or for manually recorded daily gauges that are read at non- 0:00 hours, e.g. at 8 or 9 am"
-    ##For testing
-    #TestData = LoadFromRainfallNZ_csv(RawDataFileName="../Data/PhD_data/Hooker Rd Bridge rainfall.csv")[0]
-    #ReferenceData = LoadFromRainfallNZ_csv(RawDataFileName="../Data/PhD_data/Tasman Terminus Rainfall.csv")[0]
-    
-    #Merge the two timeseries. Add a third column which provides the aggregation index
-    #join the two sets of data discarding periods not common to both
-    result = TestData.join(ReferenceData, how='outer',lsuffix='_Test',rsuffix='_ref')
-    result.columns =['Test','Reference']
-        
-    #Add a third column which provides the aggregation index
-    result['aggregator'] = result.index.strftime('%Y-%m-%dT%H:%M%:%SZ')
-    
-    #replace all the aggregatior's without a Test observation with an nan
-    result.aggregator[result.Test.isna()] = np.nan
-    
-    #interpolate the aggregator nan's with the following time value
-    result['aggregator'] = result['aggregator'].fillna(method='bfill')
-    
-    #Perform a df.groupby of the reference data using the aggregation index
-    g = result.groupby('aggregator')
+    """Resamples reference data to match the observation times of the test data
 
-    #Sum the groups, note the need to use aggregate and lambda instead of sum.
-    #This is because sum(skipna=False) doesn't work.
-    Reference_sums = g[['Reference']].aggregate(lambda x: sum(x))
+    This helps for comparison to irregularly sampled data (e.g. storage gauges) or for
+    manually recorded daily gauges that are read at non- 0:00 hours, e.g. at 8 or 9 am.
+    Each reference value is summed into the first test observation at or after it. A sum
+    is nan if the reference is missing for any time stamp within the interval.
+
+    Parameters
+    ----------
+    TestData : pd.DataFrame
+        The time series whose observation times are to be matched.
+    ReferenceData : pd.DataFrame or dict
+        The reference time series to resample. Either a DataFrame with one column per
+        reference series on a shared index, or a dict of reference name to a Series or
+        single column DataFrame. Every index must be sorted and unique.
+
+    Returns
+    -------
+    TimeStepAllignment : pd.DataFrame
+        The reference sums indexed by the test observation times. A single reference
+        series gives a 'Reference' column, otherwise there is a column per reference.
+
+    """
+    #The test observation times are the time stamps with a test value
+    TestIndex = TestData.index.asi8
+    TestObserved = TestData.iloc[:,0].notna().to_numpy()
+    
+    if isinstance(ReferenceData, pd.DataFrame):
+        References = {None: ReferenceData}
+    else:
+        References = {name: (series.to_frame() if isinstance(series, pd.Series) else series)
+                      for name, series in ReferenceData.items()}
+        for name, reference in References.items():
+            if reference.shape[1] != 1:
+                raise ValueError(f"The '{name}' reference has {reference.shape[1]} columns, it must have one")
+    
+    Columns = []
+    for name, reference in References.items():
+        Sums = ArrayChecks._interval_sums(TestIndex, TestIndex[TestObserved], reference.index.asi8,
+                                          reference.to_numpy(dtype=float))
+        if name is None:
+            Columns.append(pd.DataFrame(Sums, columns=['Reference'] if reference.shape[1] == 1 else reference.columns))
+        else:
+            Columns.append(pd.DataFrame(Sums, columns=[name]))
+    
+    Reference_sums = pd.concat(Columns, axis=1)
+    Reference_sums.index = TestData.index[TestObserved]
     
     #Get rid of the NaN's at the begining and end
     first_idx = Reference_sums.first_valid_index()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk memoization of check results per station-year.
+
+Each input is split into calendar years and each year is hashed on its
+content. A year's result is stored under a key made from the check, its
+parameters and the hashes of the years its result depends on, so on a rerun
+only the years whose inputs changed are recomputed.
+
+How far a check's result for one year depends on other years is given in
+HALO_YEARS. The run based checks (RUN_CHECKS) depend on the whole of the runs
+crossing the ends of the year, however many years they span, so their years are
+found from the data with the run search of ParallelChecks. Checks that are not
+listed, such as those using percentiles of the whole record (rain_outliers,
+DrySpellDivergence) are keyed on the whole record, so a change anywhere in the
+record recomputes every year.
+"""
+
+import hashlib
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import ParallelChecks
+
+#Years either side of a year that its result depends on. Unlisted checks depend on the whole record.
+HALO_YEARS = {
+    'impossibles': 0,
+    'DateTimeIssues': 0,
+    'SubFreezingRain': 0,
+    }
+
+#Checks whose result for a year depends on the runs crossing its ends, which are followed to wherever they end
+RUN_CHECKS = tuple(ParallelChecks.RUN_KEYS)
+
+class ResultCache:
+    """A size limited, least recently used store of check results in a SQLite file
+
+    Parameters
+    ----------
+    path : str
+        The SQLite database file. It is created if it doesn't exist.
+    max_bytes : int, optional
+        The size the stored results are kept under, by evicting the least recently
+        used. The default is 1 GB.
+
+    """
+    def __init__(self, path: str, max_bytes: int = 2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                '(key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)')
+        self.connection.commit()
+
+    def get(self, key: str):
+        "Returns the stored result, or None if there isn't one"
+        Row = self.connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if Row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        return pickle.loads(Row[0])
+
+    def put(self, key: str, value):
+        "Stores a result, then evicts the least recently used results while over the size limit"
+        Value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                (key, Value, len(Value), time.time()))
+        Total = self.size()
+        if Total > self.max_bytes:
+            Rows = self.connection.execute('SELECT key, size FROM results ORDER BY last_used').fetchall()
+            Evict = []
+            for row_key, size in Rows:
+                if Total <= self.max_bytes:
+                    break
+                Evict.append((row_key,))
+                Total -= size
+            self.connection.executemany('DELETE FROM results WHERE key = ?', Evict)
+        self.connection.commit()
+
+    def size(self) -> int:
+        "The total size in bytes of the stored results"
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def stats(self) -> dict:
+        "The hit and miss counts, and the number and size of stored results"
+        Entries = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': Entries, 'bytes': self.size()}
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+def _check_name(check) -> str:
+    "The check's name, including any arguments fixed with functools.partial"
+    if hasattr(check, 'func'):
+        return f"{check.func.__name__}{check.args!r}{sorted(check.keywords.items())!r}"
+    return check.__name__
+
+def _year_hashes(data) -> dict:
+    "A content hash of each calendar year of a time series"
+    Years = data.index.year
+    RowHashes = pd.util.hash_pandas_object(data, index=True).to_numpy()
+    Columns = repr(list(data.columns) if isinstance(data, pd.DataFrame) else [data.name]).encode()
+    Hashes = {}
+    for year in np.unique(Years):
+        Hashes[int(year)] = hashlib.sha256(Columns + RowHashes[Years == year].tobytes()).hexdigest()
+    return Hashes
+
+def _run_contexts(name: str, rain_data, params: dict) -> dict:
+    """The years each year's result depends on, for a run based check of time sorted data
+
+    These are the years of the runs crossing the ends of the year and of the rows
+    ending them, plus the two rows before (for the inter-tip times of
+    HighFrequencyTipping).
+    """
+    Years = rain_data.index.year.to_numpy()
+    KeyOf, InRun = ParallelChecks.RUN_KEYS[name](rain_data, **params)
+    Boundaries = np.flatnonzero(np.diff(Years)) + 1
+    Contexts = {}
+    for start, stop in zip(np.concatenate(([0], Boundaries)), np.concatenate((Boundaries, [len(Years)]))):
+        First, Last = ParallelChecks._run_halo(KeyOf, InRun, start, stop, len(Years))
+        Contexts[int(Years[start])] = np.unique(Years[max(0, First - 2):Last + 1]).tolist()
+    return Contexts
+
+def _year_rows(result, years):
+    "The rows of a result in any of the given years"
+    return result[np.isin(result.index.year, list(years))]
+
+def cached_check(cache: ResultCache, check, rain_data, *other_data, station: str = '', **params):
+    """Runs a check, reusing the stored result of every station-year whose inputs haven't changed
+
+    Parameters
+    ----------
+    cache : ResultCache
+        The result store.
+    check : callable
+        A check returning a time series, e.g. ``RainDataChecks.DrySpells``.
+    rain_data : pd.DataFrame
+        The rainfall time series to check.
+    *other_data : pd.DataFrame
+        Any other time series the check takes, e.g. the reference data of a
+        multi-series check.
+    station : str, optional
+        A name to keep the results of different stations apart. The input hashes
+        already do, unless two stations have identical data.
+    **params
+        Any other arguments of the check.
+
+    Returns
+    -------
+    pd.DataFrame or pd.Series
+        The same result as ``check(rain_data, *other_data, **params)``.
+
+    """
+    Inputs = (rain_data,) + other_data
+    InputHashes = [_year_hashes(data) for data in Inputs]
+    Years = sorted(set().union(*[hashes.keys() for hashes in InputHashes]))
+    Name = _check_name(check)
+    Function = getattr(check, 'func', check).__name__
+    Halo = HALO_YEARS.get(Function)
+    Contexts = None
+    if Function in RUN_CHECKS and len(rain_data) > 0 and rain_data.index.is_monotonic_increasing:
+        Contexts = _run_contexts(Function, rain_data, {**getattr(check, 'keywords', {}), **params})
+
+    def context(year):
+        "The years a year's result depends on"
+        if Contexts is not None:
+            return Contexts[year]
+        if Halo is None:
+            return Years
+        return [other for other in Years if abs(other - year) <= Halo]
+
+    Prefix = f"{station}|{Name}|{sorted(params.items())!r}"
+    Keys = {}
+    for year in Years:
+        Context = [(other, [hashes.get(other, '') for hashes in InputHashes]) for other in context(year)]
+        Keys[year] = hashlib.sha256(f"{Prefix}|{year}|{Context!r}".encode()).hexdigest()
+
+    Results = {year: cache.get(Keys[year]) for year in Years}
+    Missing = [year for year in Years if Results[year] is None]
+
+    #Recompute runs of consecutive missing years, along with the years their results depend on
+    Groups = []
+    for year in Missing:
+        if Groups and year - Groups[-1][-1] <= 1:
+            Groups[-1].append(year)
+        else:
+            Groups.append([year])
+    if Halo is None and Contexts is None and Missing:
+        Groups = [Missing]
+    for group in Groups:
+        Span = sorted(set().union(*[context(year) for year in group]))
+        SpanInputs = [_year_rows(data, Span) for data in Inputs]
+        Result = check(*SpanInputs, **params)
+        for year in group:
+            Results[year] = _year_rows(Result, [year])
+            cache.put(Keys[year], Results[year])
+
+    return pd.concat([Results[year] for year in Years])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Run-length encoding shared by the run based rainfall checks.
+
+Runs are found from the boundaries between unequal neighbours, so the work is
+done in a handful of array passes rather than a Python loop over observations.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+class Runs(NamedTuple):
+    "The run-length encoding of a one dimensional array"
+    starts: np.ndarray
+    ends: np.ndarray
+    lengths: np.ndarray
+    values: np.ndarray
+
+def run_length_encode(values) -> Runs:
+    """Run-length encodes a one dimensional array
+
+    Consecutive nan's are treated as a single run.
+
+    Parameters
+    ----------
+    values : array_like
+        The values to encode.
+
+    Returns
+    -------
+    Runs
+        The start and (inclusive) end index, length and value of each run.
+
+    """
+    values = np.asarray(values)
+    if values.ndim != 1:
+        values = values.reshape(-1)
+    n = len(values)
+    if n == 0:
+        Empty = np.zeros(0, dtype=np.int64)
+        return Runs(Empty, Empty, Empty, values[:0])
+
+    #A new run starts wherever a value differs from the one before it, but not between two nan's
+    Different = values[1:] != values[:-1]
+    if values.dtype.kind in 'fc':
+        Different &= ~(np.isnan(values[1:]) & np.isnan(values[:-1]))
+    elif values.dtype.kind == 'O':
+        IsNaN = np.array([item != item for item in values], dtype=bool)
+        Different &= ~(IsNaN[1:] & IsNaN[:-1])
+
+    Boundaries = np.flatnonzero(Different) + 1
+    RunStarts = np.concatenate(([0], Boundaries))
+    RunEnds = np.concatenate((Boundaries - 1, [n - 1]))
+    return Runs(RunStarts, RunEnds, RunEnds - RunStarts + 1, values[RunStarts])
+
+def per_observation(runs: Runs, run_values) -> np.ndarray:
+    "Broadcasts one value per run back onto every observation within the run"
+    return np.repeat(np.asarray(run_values), runs.lengths)
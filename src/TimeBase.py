@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+A one-time analysis of the time stamps of a series.
+
+Most hourly and daily data is on a perfectly regular grid, where the position of
+any time is simple integer arithmetic. ``time_base()`` describes an index's
+start, step, gaps and timezone once, and keeps the description for as long as
+the index exists. Indexes are immutable, so the description can't go stale.
+Checks use it to replace DatetimeIndex operations with integer offsets on
+regular data, falling back to the index operations for irregular (e.g. raw tip)
+data.
+"""
+
+import weakref
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+class TimeBase(NamedTuple):
+    "The time base of a series"
+    start: int
+    step: int
+    length: int
+    regular: bool
+    gaps: np.ndarray
+    tz: object
+
+    def positions(self, times: np.ndarray) -> np.ndarray:
+        "The positions of int64 time stamps on a regular grid, and -1 for those not on it"
+        Offsets = np.asarray(times, dtype=np.int64) - self.start
+        Positions = Offsets // self.step
+        Positions[(Offsets % self.step != 0) | (Positions < 0) | (Positions >= self.length)] = -1
+        return Positions
+
+    def first_positions_at_or_after(self, times: np.ndarray) -> np.ndarray:
+        "The position of the first time stamp at or after each int64 time on a regular grid, from 0 to the length"
+        Offsets = np.asarray(times, dtype=np.int64) - self.start
+        return np.clip(-(-Offsets // self.step), 0, self.length)
+
+#The time base of each index still in use, by id. An entry is removed when its index is garbage collected.
+_TIME_BASES = {}
+
+def analyse(times: np.ndarray, tz = None) -> TimeBase:
+    "Describes an array of int64 time stamps, which are UTC if a timezone is given"
+    Times = np.asarray(times, dtype=np.int64)
+    Steps = np.diff(Times)
+    if len(Steps) == 0:
+        return TimeBase(int(Times[0]) if len(Times) else 0, 0, len(Times), False, np.empty(0, dtype=np.int64), tz)
+    #Test the common case of a regular grid first, before finding the median step
+    Step = int(Steps[0])
+    Regular = Step > 0 and bool((Steps == Step).all())
+    if not Regular:
+        Step = int(np.median(Steps))
+    Gaps = np.empty(0, dtype=np.int64) if Regular else np.flatnonzero(Steps != Step)
+    return TimeBase(int(Times[0]), Step, len(Times), Regular, Gaps, tz)
+
+def time_base(index: pd.DatetimeIndex) -> TimeBase:
+    """The time base of a series' index, analysed on first use and then kept with the index
+
+    Returns
+    -------
+    TimeBase
+        The first time stamp (int64 ns since the epoch), the step (the median step in ns),
+        the number of time stamps, whether every step equals the step, the positions
+        after which the step differs (the gaps) and the timezone. A series with fewer
+        than two time stamps is not regular.
+
+    """
+    Key = id(index)
+    Cached = _TIME_BASES.get(Key)
+    if Cached is not None and Cached[0]() is index:
+        return Cached[1]
+    Base = analyse(index.asi8, index.tz)
+    _TIME_BASES[Key] = (weakref.ref(index, lambda _, key=Key: _TIME_BASES.pop(key, None)), Base)
+    return Base
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+The checks are top level modules in src, as they are imported in use.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
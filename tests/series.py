@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded rainfall series for the tests, with nan's, gaps, timezones and short records.
+"""
+
+import numpy as np
+import pandas as pd
+
+#Keyword arguments of rain_series() for each case the checks are compared on
+CASES = {
+    'hourly': dict(),
+    'hourly gaps': dict(gaps=True),
+    'daily': dict(freq='D', n=3000),
+    'daily NZST': dict(freq='D', n=3000, tz='Etc/GMT-12', gaps=True),
+    'hourly Auckland': dict(tz='Pacific/Auckland'),
+    '15 minute gaps': dict(freq='15min', n=6000, gaps=True),
+    'short': dict(n=50),
+    }
+
+def rain_series(seed: int, n: int = 2000, freq: str = 'h', gaps: bool = False, tz = None,
+                nan_fraction: float = 0.03, dry_spells: bool = True, resolution: float = 0.2,
+                start: str = '1995-03-01') -> pd.DataFrame:
+    """A 'Rainfall' series indexed by 'DateTime'
+
+    About 30 % of the time steps are wet, rounded to the resolution, with runs of repeated
+    values, dry spells of up to a fifth of the record, and nan's. Gaps drop a tenth of
+    the time stamps.
+    """
+    rng = np.random.default_rng(seed)
+    Index = pd.date_range(start, periods=n, freq=freq, name='DateTime', tz=tz)
+    if gaps:
+        Index = Index.delete(np.sort(rng.choice(n, n // 10, replace=False)))
+    m = len(Index)
+    Values = np.where(rng.random(m) < 0.7, 0, np.round(rng.gamma(0.6, 3, m) / resolution) * resolution)
+    for repeat in rng.choice(m, max(1, m // 500)):
+        Values[repeat:repeat + int(rng.integers(2, 8))] = Values[repeat] or resolution
+    if dry_spells:
+        for spell in rng.choice(m, 2):
+            Values[spell:spell + int(rng.integers(1, max(2, m // 5)))] = 0
+    Values[rng.random(m) < nan_fraction] = np.nan
+    return pd.DataFrame({'Rainfall': Values}, index=Index)
+
+def tip_series(seed: int, n: int = 3000, bursts: int = 3) -> pd.DataFrame:
+    "Raw tips of 0.2 mm, ten to twenty minutes apart, with bursts of rapid tips"
+    rng = np.random.default_rng(seed)
+    Gaps = rng.choice([600., 900, 1200], n)
+    for burst in rng.choice(n - 20, bursts, replace=False):
+        Gaps[burst:burst + int(rng.integers(2, 20))] = rng.uniform(0.5, 4)
+    Times = pd.DatetimeIndex((np.cumsum(Gaps) * 1e9).astype(np.int64) + 10**18, name='DateTime')
+    return pd.DataFrame({'Rainfall': 0.2}, index=Times)
+
+def storm_series(seed: int, days: int = 300, storms: int = 30, storm_hours: int = 6, unrelated_peaks: int = 10) -> tuple:
+    """Hourly 'Rainfall' with storms of up to storm_hours, and a daily 'Streamflow' peaking with them
+
+    Each storm is followed by a flow peak on the same day or the next, and there are flow
+    peaks without a storm.
+    """
+    rng = np.random.default_rng(seed)
+    Index = pd.date_range('2001-05-01', periods=days * 24, freq='h', name='DateTime')
+    Rain = np.where(rng.random(len(Index)) < 0.3, np.round(rng.gamma(0.8, 1, len(Index)) / 0.2) * 0.2, 0)
+    Flow = 10 + rng.normal(0, 0.2, days)
+    for day in np.sort(rng.choice(np.arange(1, days - 2), storms, replace=False)):
+        Start = day * 24 + int(rng.integers(0, 18))
+        Hours = int(rng.integers(1, storm_hours + 1))
+        Rain[Start:Start + Hours] = np.round(rng.uniform(15, 40, Hours) / 0.2) * 0.2
+        Flow[day + int(rng.integers(0, 2))] += rng.uniform(20, 60)
+    for day in rng.choice(np.arange(1, days - 1), unrelated_peaks, replace=False):
+        Flow[day] += rng.uniform(5, 20)
+    return (pd.DataFrame({'Rainfall': Rain}, index=Index),
+            pd.DataFrame({'Streamflow': Flow}, index=pd.date_range('2001-05-01', periods=days, freq='D', name='DateTime')))
+
+def assert_same(result, expected):
+    "Asserts that two results hold the same values, with nan's equal"
+    #Arrays of the core and single column DataFrames of the wrappers are compared as columns
+    Result, Expected = [np.atleast_1d(np.asarray(values, dtype=float)) for values in (result, expected)]
+    Result, Expected = Result.reshape(len(Result), -1), Expected.reshape(len(Expected), -1)
+    assert Result.shape == Expected.shape
+    np.testing.assert_allclose(Result, Expected, rtol=1e-12, atol=1e-12, equal_nan=True)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Running checks over many stations with BatchChecks.run_batch.
+"""
+
+import functools
+
+import pandas as pd
+import pytest
+
+import BatchChecks
+import RainDataChecks
+from series import rain_series, assert_same
+
+CHECKS = ['impossibles', 'DrySpells', 'RepeatedValues']
+
+def _network(stations: int = 5) -> pd.DataFrame:
+    "A wide frame of one column per station, indexed by 'time'"
+    Network = pd.concat([rain_series(seed, n=500).Rainfall.rename(f"S{seed}") for seed in range(stations)], axis=1)
+    return Network.rename_axis('time')
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'process'])
+def test_run_batch_matches_each_station(executor):
+    Network = _network()
+    Result = BatchChecks.run_batch(Network, CHECKS, executor=executor, max_workers=2, chunk_size=2)
+    assert Result.failures.empty
+    assert list(Result.flags.columns.get_level_values(0).unique()) == list(Network.columns)
+    for station in Network.columns:
+        rain_data = Network[[station]].rename(columns={station: 'Rainfall'})
+        assert_same(Result.flags[(station, 'DrySpellDayLengths')], RainDataChecks.DrySpells(rain_data))
+        assert_same(Result.flags[(station, 'RepeatedValues')], RainDataChecks.RepeatedValues(rain_data))
+
+def test_run_batch_leaves_the_input_unchanged():
+    Network = _network()
+    Copy = Network.copy(deep=True)
+    Stations = {station: Network[station] for station in Network.columns}
+    BatchChecks.run_batch(Network, CHECKS, executor='serial')
+    BatchChecks.run_batch(Stations, CHECKS, executor='serial')
+    pd.testing.assert_frame_equal(Network, Copy)
+    assert all(series.index.name == 'time' for series in Stations.values())
+
+def _fails_on_s3(rain_data):
+    if rain_data.Rainfall.sum() == _network()['S3'].sum():
+        raise ValueError("bad station")
+    return RainDataChecks.DrySpells(rain_data)
+
+def test_run_batch_records_a_failing_check():
+    Result = BatchChecks.run_batch(_network(), ['impossibles', _fails_on_s3], executor='serial')
+    assert Result.failures.values.tolist() == [['S3', '_fails_on_s3', 'ValueError: bad station']]
+    assert ('S3', 'Impossible') in Result.flags.columns
+    assert ('S4', 'DrySpellDayLengths') in Result.flags.columns
+
+def test_run_batch_isolates_a_failing_chunk(monkeypatch):
+    "A task that fails as a whole reports every check of its stations, and the other chunks carry on"
+    RunChunk = BatchChecks._run_chunk
+    def run_chunk(chunk, checks):
+        if any(station == 'S2' for station, _ in chunk):
+            raise RuntimeError("worker died")
+        return RunChunk(chunk, checks)
+    monkeypatch.setattr(BatchChecks, '_run_chunk', run_chunk)
+    Checks = CHECKS + [functools.partial(RainDataChecks.rain_outliers)]
+    Result = BatchChecks.run_batch(_network(), Checks, executor='thread', max_workers=2, chunk_size=2)
+    assert sorted(set(Result.failures.Station)) == ['S2', 'S3']
+    assert len(Result.failures) == 2 * len(Checks)
+    assert (Result.failures.Error == 'RuntimeError: worker died').all()
+    assert list(Result.flags.columns.get_level_values(0).unique()) == ['S0', 'S1', 'S4']
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+The check registry, running subsets of checks, and the cold start imports.
+"""
+
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import CheckRegistry
+import RainDataChecks
+from series import rain_series, assert_same
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+def test_registered_checks():
+    for name, spec in CheckRegistry.REGISTRY.items():
+        assert callable(CheckRegistry.get_check(name))
+        assert CheckRegistry.get_check(name).__module__ == spec.module
+    for subset in CheckRegistry.SUBSETS.values():
+        assert set(subset) <= set(CheckRegistry.REGISTRY)
+    with pytest.raises(KeyError):
+        CheckRegistry.get_check('DrySpell')
+
+def test_check_names():
+    assert CheckRegistry.check_names('tips') == ['impossibles', 'DateTimeIssues', 'HighFrequencyTipping']
+    assert CheckRegistry.check_names(['DrySpells', 'light']) == ['DrySpells', 'impossibles', 'DateTimeIssues', 'RepeatedValues']
+
+def test_run_checks():
+    rain_data = rain_series(0)
+    Results = CheckRegistry.run_checks('single', params={'Homogeneity': {'alpha': 0.01}}, rain_data=rain_data)
+    assert list(Results) == list(CheckRegistry.SUBSETS['single'])
+    assert_same(Results['DrySpells'], RainDataChecks.DrySpells(rain_data))
+    assert_same(Results['Homogeneity'], RainDataChecks.Homogeneity(rain_data, alpha=0.01))
+
+def test_run_checks_of_a_short_record():
+    "The checks needing a long record give nan for a short one, rather than the registry rejecting it"
+    rain_data = rain_series(0, n=50)
+    Results = CheckRegistry.run_checks('single', rain_data=rain_data)
+    assert Results['Homogeneity'].isna().all().all()
+    assert_same(Results['rain_outliers'], RainDataChecks.rain_outliers(rain_data))
+
+def test_run_checks_with_missing_inputs():
+    rain_data = rain_series(0, n=200)
+    Temperature = pd.DataFrame({'TMin': 0.0}, index=rain_data.index)
+    with pytest.raises(ValueError, match="affinity needs reference_data"):
+        CheckRegistry.run_checks(['DrySpells', 'affinity'], rain_data=rain_data)
+    with pytest.raises(ValueError, match="temperature_data needs a 'TMax' column"):
+        CheckRegistry.run_checks(['SubFreezingRain'], rain_data=rain_data, temperature_data=Temperature)
+    Results = CheckRegistry.run_checks(['DrySpells', 'affinity', 'SubFreezingRain'], errors='skip',
+                                       rain_data=rain_data, temperature_data=Temperature)
+    assert list(Results) == ['DrySpells']
+    with pytest.raises(ValueError):
+        CheckRegistry.run_checks('light', errors='ignore', rain_data=rain_data)
+
+def _imported(statement: str) -> list:
+    "The heavy modules imported by a statement in a fresh interpreter"
+    Script = (f"import sys; sys.path.insert(0, {SOURCE!r}); {statement}; "
+              "print([name for name in ('scipy', 'matplotlib') if name in sys.modules])")
+    return eval(subprocess.run([sys.executable, '-c', Script], capture_output=True, text=True, check=True).stdout)
+
+def test_cold_start_imports():
+    assert _imported('import RainDataChecks') == []
+    assert _imported('import CheckRegistry, pandas; '
+                     "CheckRegistry.run_checks('light', rain_data=pandas.DataFrame({'Rainfall': [0.0, 0.2]}, "
+                     "index=pandas.date_range('2000', periods=2, freq='h')))") == []
+    pytest.importorskip('scipy')
+    #The checks that need scipy import it when they run
+    assert _imported('import RainDataChecks, pandas; '
+                     "rain_data = pandas.DataFrame({'Rainfall': [0.0, 0.2, 0.4]}, index=pandas.date_range('2000', periods=3)); "
+                     'RainDataChecks.spearman(rain_data, rain_data)') == ['scipy']
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Combining the outputs of many checks into one bitmask and compact arrays.
+"""
+
+import functools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import CombinedFlags
+import RainDataChecks
+from series import rain_series, assert_same
+
+def _checks(rain_data) -> list:
+    "The outputs of the checks run by run_combined, with a temperature check"
+    Temperature = pd.DataFrame({'TMax': np.random.default_rng(0).normal(2, 5, len(rain_data))}, index=rain_data.index)
+    return [RainDataChecks.impossibles(rain_data), RainDataChecks.DateTimeIssues(rain_data),
+            RainDataChecks.rain_outliers(rain_data), RainDataChecks.DrySpells(rain_data),
+            RainDataChecks.RepeatedValues(rain_data), RainDataChecks.SubFreezingRain(rain_data, Temperature)]
+
+def test_round_trip():
+    "Every output decodes back to the values of the check"
+    rain_data = rain_series(0, n=5000)
+    rain_data.iloc[::97] = -0.2
+    Outputs = _checks(rain_data)
+    Combined = CombinedFlags.CombinedFlags(rain_data.index)
+    for output in Outputs:
+        Combined.add(output)
+    assert Combined.mask.dtype == np.uint16
+    Frame = Combined.to_frame()
+    assert Frame.index.equals(rain_data.index)
+    for output in Outputs:
+        output = output.to_frame() if isinstance(output, pd.Series) else output
+        for name in output.columns:
+            Values = output[name].to_numpy()
+            if Values.dtype == bool:
+                np.testing.assert_array_equal(Combined.flag(name), Values)
+                np.testing.assert_array_equal(Combined.decode([name])[name], Values)
+            else:
+                assert_same(Frame[name], np.float32(Values) if name == 'Outlier' else Values)
+    assert Combined.values['DrySpellDayLengths'].dtype == np.uint32
+    assert Combined.flag('Impossible').sum() == len(rain_data.iloc[::97])
+
+def test_select():
+    rain_data = rain_series(1, n=3000)
+    rain_data.iloc[::50] = -0.2
+    Combined = CombinedFlags.run_combined(rain_data)
+    Impossible = RainDataChecks.impossibles(rain_data).Impossible.to_numpy()
+    Suspect = np.zeros(len(rain_data), dtype=bool)
+    Suspect[::7] = True
+    Combined.add(pd.DataFrame({'Suspect': Suspect}, index=rain_data.index))
+    np.testing.assert_array_equal(Combined.select(all_of=['Impossible', 'Suspect']), Impossible & Suspect)
+    np.testing.assert_array_equal(Combined.select(any_of=['Impossible', 'Suspect']), Impossible | Suspect)
+    np.testing.assert_array_equal(Combined.select(any_of='Suspect', none_of='Impossible'), Suspect & ~Impossible)
+    Rows = Combined.select(all_of='Impossible')
+    assert Combined.to_frame(Rows).index.equals(rain_data.index[Impossible])
+
+def test_homogeneity_is_stored_as_problems():
+    "Every bit marks a problem, so the good 'Homogeneous' rows are kept as the 'Inhomogeneous' bit's inverse"
+    rain_data = rain_series(1, n=20 * 365, freq='D', nan_fraction=0.01, dry_spells=False)
+    rain_data.iloc[:len(rain_data) // 2] *= 3
+    Homogeneity = RainDataChecks.Homogeneity(rain_data)
+    Combined = CombinedFlags.CombinedFlags(rain_data.index).add(Homogeneity)
+    assert 'Homogeneous' not in Combined.bits and 'ChangePoint' not in Combined.bits
+    np.testing.assert_array_equal(Combined.flag('Inhomogeneous'), ~Homogeneity.Homogeneous.to_numpy(dtype=bool))
+    np.testing.assert_array_equal(Combined.flag('BeforeChangePoint'), ~Homogeneity.ChangePoint.to_numpy(dtype=bool))
+    assert Combined.flag('Inhomogeneous').any()
+    assert 'InhomogeneousNotTested' not in Combined.bits
+
+def test_homogeneity_not_tested():
+    rain_data = rain_series(0, n=50)
+    Combined = CombinedFlags.CombinedFlags(rain_data.index).add(RainDataChecks.Homogeneity(rain_data))
+    assert not Combined.flag('Inhomogeneous').any()
+    assert Combined.flag('InhomogeneousNotTested').all()
+
+def test_long_runs_are_not_clipped():
+    "A gauge stuck for more than 65535 one minute steps"
+    rain_data = pd.DataFrame({'Rainfall': 0.2}, index=pd.date_range('2000', periods=70000, freq='min', name='DateTime'))
+    Combined = CombinedFlags.run_combined(rain_data, ['RepeatedValues'])
+    assert Combined.values['RepeatedValues'].max() == 70000
+
+def test_counts_widen_rather_than_clip():
+    Index = pd.date_range('2000', periods=4, freq='h')
+    Combined = CombinedFlags.CombinedFlags(Index)
+    Combined.add(pd.DataFrame({'Neighbours': [1, 70000, np.nan, 2], 'LowFlagCount': [0, 1, 2, 3]}, index=Index))
+    assert Combined.values['Neighbours'].dtype == np.uint32
+    assert Combined.values['Neighbours'].tolist() == [1, 70000, 0, 2]
+    assert Combined.values['LowFlagCount'].dtype == np.uint16
+    assert Combined.flag('NeighboursMissing').tolist() == [False, False, True, False]
+    assert 'LowFlagCountMissing' not in Combined.bits
+
+def test_mask_widens():
+    Index = pd.date_range('2000', periods=3, freq='h')
+    Combined = CombinedFlags.CombinedFlags(Index)
+    for flag in range(24):
+        Combined.add(pd.DataFrame({f'Flag{flag}': [flag % 2 == 0, True, False]}, index=Index))
+    assert Combined.mask.dtype == np.uint32
+    assert Combined.flag('Flag22').tolist() == [True, True, False]
+    assert Combined.flag('Flag23').tolist() == [False, True, False]
+    with pytest.raises(ValueError):
+        for flag in range(24, 40):
+            Combined.add(pd.DataFrame({f'Flag{flag}': True}, index=Index))
+
+def test_run_combined():
+    rain_data = rain_series(2, n=2000)
+    Temperature = pd.DataFrame({'TMax': -1.0}, index=rain_data.index)
+    Combined = CombinedFlags.run_combined(rain_data, ['DrySpells', functools.partial(RainDataChecks.SubFreezingRain,
+                                                                                       temperature_data=Temperature)])
+    np.testing.assert_array_equal(Combined.flag('FreezingRain'), rain_data.Rainfall.to_numpy() > 0)
+    assert_same(Combined.values['DrySpellDayLengths'], RainDataChecks.DrySpells(rain_data))
+    assert Combined.nbytes == 2 * len(rain_data) + 4 * len(rain_data)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+The segmented, chunked, incremental and cached runs of the checks against the
+checks run once over the whole record.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ChunkedChecks
+import IncrementalChecks
+import ParallelChecks
+import RainDataChecks
+import ResultCache
+from series import rain_series, tip_series, assert_same
+
+RECORDS = {
+    'hourly': lambda: rain_series(0, n=20000),
+    'hourly gaps': lambda: rain_series(1, n=20000, gaps=True),
+    'daily NZST': lambda: rain_series(2, n=4000, freq='D', tz='Etc/GMT-12'),
+    'no nan': lambda: rain_series(3, n=5000, nan_fraction=0),
+    }
+
+@pytest.fixture(params=list(RECORDS), ids=list(RECORDS))
+def rain_data(request):
+    return RECORDS[request.param]()
+
+@pytest.mark.parametrize('segments', [2, 7])
+@pytest.mark.parametrize('check', ['impossibles', 'rain_outliers', 'DrySpells', 'RepeatedValues'])
+def test_run_segmented(rain_data, check, segments):
+    Expected = getattr(RainDataChecks, check)(rain_data)
+    Result = ParallelChecks.run_segmented(check, rain_data, segments=segments, executor='serial')
+    assert Result.index.equals(Expected.index)
+    assert_same(Result, Expected)
+
+@pytest.mark.parametrize('executor', ['serial', 'thread'])
+@pytest.mark.parametrize('seed', range(3))
+def test_run_segmented_tips(seed, executor):
+    rain_data = tip_series(seed, n=20000, bursts=40)
+    Expected = RainDataChecks.HighFrequencyTipping(rain_data, min_burst_length=2)
+    Result = ParallelChecks.run_segmented('HighFrequencyTipping', rain_data, segments=5, executor=executor,
+                                          max_workers=2, min_burst_length=2)
+    assert_same(Result, Expected)
+
+@pytest.mark.parametrize('block_size', [997, 20000])
+def test_chunked_single_checks(rain_data, block_size):
+    Result = ChunkedChecks.chunked_single_checks(rain_data, block_size=block_size)
+    assert_same(Result.DrySpellDayLengths, RainDataChecks.DrySpells(rain_data))
+    assert_same(Result.RepeatedValues, RainDataChecks.RepeatedValues(rain_data))
+    assert_same(Result.HighFrequencyTips, RainDataChecks.HighFrequencyTipping(rain_data))
+    assert_same(Result.Outlier, RainDataChecks.rain_outliers(rain_data))
+
+def test_chunked_tips():
+    #rain_outliers needs some values above 0.2
+    rain_data = tip_series(0, n=20000, bursts=40).assign(Rainfall=0.5)
+    Result = ChunkedChecks.chunked_single_checks(rain_data, block_size=1001, min_burst_length=2)
+    assert_same(Result.HighFrequencyTips, RainDataChecks.HighFrequencyTipping(rain_data, min_burst_length=2))
+
+def test_chunked_runs_across_many_blocks(monkeypatch):
+    "A run over many blocks is revised in each block it covers once, with its final value"
+    rain_data = rain_series(7, n=6000)
+    rain_data.iloc[1000:4500] = 0
+    rain_data.iloc[4600:5900] = 0.4
+    Applied = []
+    ApplyRevisions = ChunkedChecks._apply_revisions
+    def apply_revisions(flags, revisions):
+        Applied.append(len(revisions))
+        return ApplyRevisions(flags, revisions)
+    monkeypatch.setattr(ChunkedChecks, '_apply_revisions', apply_revisions)
+    Result = ChunkedChecks.chunked_single_checks(rain_data, block_size=50)
+    assert_same(Result.DrySpellDayLengths, RainDataChecks.DrySpells(rain_data))
+    assert_same(Result.RepeatedValues, RainDataChecks.RepeatedValues(rain_data))
+    assert len(Applied) == 120 and max(Applied) <= 3
+
+@pytest.mark.parametrize('completeness', [1.0, 0.8])
+def test_chunked_dry_spell_divergence(completeness):
+    Aligned = pd.concat([rain_series(4, n=20000, gaps=True).Rainfall.rename('Test'),
+                         rain_series(5, n=20000, gaps=True).Rainfall.rename('Reference')], axis=1)
+    Expected = RainDataChecks.DrySpellDivergence(Aligned[['Test']], Aligned[['Reference']], completeness=completeness)
+    Result = ChunkedChecks.chunked_dry_spell_divergence(Aligned, block_size=1500, completeness=completeness)
+    assert Result.index.equals(Expected.index)
+    assert_same(Result, Expected)
+
+def test_chunked_percentiles_fall_back_to_a_sketch():
+    Values = np.random.default_rng(0).gamma(0.5, 3, 200000)
+    Counts = ChunkedChecks._ValueCounts(max_values=1000)
+    for block in np.array_split(Values, 10):
+        Counts.add(block)
+    assert Counts.sketch is not None and Counts.total() == len(Values)
+    for q in (0.5, 0.95, 0.99):
+        #Within the sketch's rank error bound
+        assert abs(np.mean(Values < Counts.quantile(q)) - q) < 2 * np.pi * np.sqrt(q * (1 - q)) / 200
+
+def _apply_revisions(flags: pd.DataFrame, revisions: pd.DataFrame):
+    "Sets the revised values of earlier flags, as a user of update() would"
+    for check, start, end, value in revisions.itertuples(index=False, name=None):
+        flags.loc[(flags.index >= start) & (flags.index <= end), check] = value
+
+@pytest.mark.parametrize('batches', [2, 13])
+def test_incremental_updates(rain_data, batches):
+    History = len(rain_data) // 3
+    State = IncrementalChecks.init_state(rain_data.iloc[:History])
+    Flags = [IncrementalChecks.update(IncrementalChecks.StationState(), rain_data.iloc[:History]).flags]
+    for new_rows in np.array_split(np.arange(History, len(rain_data)), batches):
+        Result = IncrementalChecks.update(IncrementalChecks.StationState.from_json(State.to_json()),
+                                          rain_data.iloc[new_rows])
+        Flags.append(Result.flags)
+        Flags = [pd.concat(Flags)]
+        _apply_revisions(Flags[0], Result.revisions)
+        State = Result.state
+    assert_same(Flags[0].DrySpellDayLengths, RainDataChecks.DrySpells(rain_data))
+    assert_same(Flags[0].RepeatedValues, RainDataChecks.RepeatedValues(rain_data))
+
+def test_incremental_tips():
+    rain_data = tip_series(1, n=6000, bursts=30).assign(Rainfall=0.5)
+    State = IncrementalChecks.init_state(rain_data.iloc[:100], min_burst_length=2)
+    Flags = IncrementalChecks.update(IncrementalChecks.StationState(min_burst_length=2), rain_data.iloc[:100]).flags
+    for new_rows in np.array_split(np.arange(100, len(rain_data)), 37):
+        Result = IncrementalChecks.update(State, rain_data.iloc[new_rows])
+        Flags = pd.concat([Flags, Result.flags])
+        _apply_revisions(Flags, Result.revisions)
+        State = Result.state
+    assert_same(Flags.HighFrequencyTips, RainDataChecks.HighFrequencyTipping(rain_data, min_burst_length=2))
+
+@pytest.mark.parametrize('check', ['impossibles', 'DrySpells', 'RepeatedValues', 'rain_outliers', 'Homogeneity'])
+def test_result_cache(tmp_path, check):
+    rain_data = rain_series(6, n=3000, freq='D', gaps=True)
+    #A dry spell over several years, which every year it crosses depends on
+    rain_data.iloc[900:2200] = 0
+    Check = getattr(RainDataChecks, check)
+    Cache = ResultCache.ResultCache(str(tmp_path / 'results.sqlite'))
+    assert_same(ResultCache.cached_check(Cache, Check, rain_data), Check(rain_data))
+    assert_same(ResultCache.cached_check(Cache, Check, rain_data), Check(rain_data))
+    assert Cache.hits == Cache.misses
+
+    #Ending the dry spell early changes the result of every year it crossed
+    Edited = rain_data.copy()
+    Edited.iloc[2100] = 1.0
+    assert_same(ResultCache.cached_check(Cache, Check, Edited), Check(Edited))
+    Cache.close()
+
+def test_result_cache_tips(tmp_path):
+    rain_data = tip_series(2, n=20000, bursts=60)
+    Cache = ResultCache.ResultCache(str(tmp_path / 'results.sqlite'))
+    Expected = RainDataChecks.HighFrequencyTipping(rain_data)
+    assert_same(ResultCache.cached_check(Cache, RainDataChecks.HighFrequencyTipping, rain_data), Expected)
+    Edited = rain_data.drop(rain_data.index[len(rain_data) // 2])
+    assert_same(ResultCache.cached_check(Cache, RainDataChecks.HighFrequencyTipping, Edited),
+                RainDataChecks.HighFrequencyTipping(Edited))
+    Cache.close()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Sampling a gridded covariate at many stations, and SubFreezingRain from a
+gridded maximum temperature.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import GriddedCovariates
+import RainDataChecks
+from series import rain_series, assert_same
+
+X = np.arange(5) * 1000. + 500
+#Rows are usually north to south
+Y = np.arange(4)[::-1] * 1000. + 500
+
+def _grid(days: int = 400, tz = None, seed: int = 0) -> GriddedCovariates.CovariateGrid:
+    "A daily maximum temperature grid, around freezing, with a missing cell"
+    Values = np.random.default_rng(seed).normal(2, 5, (days, len(Y), len(X)))
+    Values[:, 1, 2] = np.nan
+    return GriddedCovariates.CovariateGrid(Values, pd.date_range('1995-01-01', periods=days, freq='D', tz=tz), X, Y)
+
+def _coordinates() -> pd.DataFrame:
+    "Stations in cells, on a cell edge, beyond the outer centres, and outside the grid"
+    return pd.DataFrame({'x': [600., 2100, 4900, 0, 5100, 2400], 'y': [3400., 1000, 100, 2600, 200, 2400]},
+                        index=['A', 'B', 'C', 'D', 'Outside', 'Missing'])
+
+def test_nearest_cells():
+    Cells = _grid().station_cells(_coordinates())
+    Points = _coordinates().to_numpy()
+    Centres = np.array([(x, y) for y in Y for x in X])
+    Nearest = [np.abs(Centres - point).max(axis=1).argmin() for point in Points]
+    assert Cells.stations == list(_coordinates().index)
+    assert Cells.cells[:4, 0].tolist() == Nearest[:4]
+    assert Cells.weights[:, 0].tolist() == [1, 1, 1, 1, 0, 1]
+
+def test_bilinear_interpolation_of_a_plane():
+    "Bilinear interpolation of a linear field is exact"
+    Grid = GriddedCovariates.CovariateGrid((3 + 0.002 * X[None, :] - 0.001 * Y[:, None])[None],
+                                           pd.DatetimeIndex(['2000-01-01']), X, Y)
+    Coordinates = pd.DataFrame({'x': [600., 2100, 3333, 4500], 'y': [3400., 1000, 2222, 500]})
+    Sampled = Grid.sample(Grid.station_cells(Coordinates, method='bilinear'))
+    np.testing.assert_allclose(Sampled[0], 3 + 0.002 * Coordinates.x - 0.001 * Coordinates.y)
+
+def test_sample():
+    Grid = _grid()
+    Nearest = Grid.sample(Grid.station_cells(_coordinates()), 10, 20)
+    Values = Grid.values.reshape(len(Grid.values), -1)[10:20]
+    Cells = Grid.station_cells(_coordinates()).cells[:, 0]
+    np.testing.assert_array_equal(Nearest[:, :4], Values[:, Cells[:4]])
+    #Outside the grid, and only a missing cell
+    assert np.isnan(Nearest[:, 4:]).all()
+    #A bilinear station next to the missing cell uses the cells it has
+    Bilinear = Grid.station_cells(_coordinates(), method='bilinear')
+    Weights, Cells = Bilinear.weights[5], Bilinear.cells[5]
+    assert Weights[Cells == 7].sum() > 0
+    Valid = Cells != 7
+    np.testing.assert_allclose(Grid.sample(Bilinear, 10, 20)[:, 5],
+                               Values[:, Cells[Valid]] @ Weights[Valid] / Weights[Valid].sum())
+
+class _Sliced:
+    "An array that can only be sliced along time, like a zarr array"
+    def __init__(self, values):
+        self.values = values
+        self.shape = values.shape
+
+    def __getitem__(self, key):
+        assert isinstance(key, slice)
+        return self.values[key]
+
+def test_sliced_and_memory_mapped_grids(tmp_path):
+    Grid = _grid()
+    Cells = Grid.station_cells(_coordinates(), method='bilinear')
+    Path = tmp_path / 'tmax.npy'
+    np.save(Path, Grid.values)
+    Times = pd.date_range('1995-01-01', periods=len(Grid.values), freq='D')
+    for other in (GriddedCovariates.CovariateGrid(_Sliced(Grid.values), Times, X, Y, block=7),
+                  GriddedCovariates.CovariateGrid.from_npy(Path, Times, X, Y)):
+        np.testing.assert_array_equal(other.sample(Cells, 5, 100), Grid.sample(Cells, 5, 100))
+
+def test_at():
+    Grid = _grid(tz='Etc/GMT-12')
+    Cells = Grid.station_cells(_coordinates())
+    Timestamps = {'A': pd.date_range('1994-12-20', periods=30, freq='D', tz='Etc/GMT-12'),
+                  'B': pd.date_range('1995-06-01', periods=48, freq='h', tz='Etc/GMT-12'),
+                  'Unknown': pd.date_range('1995-01-01', periods=3, freq='D', tz='Etc/GMT-12')}
+    Covariates = Grid.at(Cells, Timestamps)
+    assert list(Covariates) == ['A', 'B']
+    Series = pd.Series(Grid.values[:, 0, 0], index=pd.date_range('1995-01-01', periods=400, freq='D', tz='Etc/GMT-12'))
+    np.testing.assert_array_equal(Covariates['A'], Series.reindex(Timestamps['A']))
+    #Only the hourly time stamps at the start of a day match, unless any time within the day does
+    assert np.isnan(Covariates['B']).sum() == 46
+    Daily = Grid.values[[151, 152], 2, 2]
+    np.testing.assert_array_equal(Grid.at(Cells, Timestamps, whole_step=True)['B'], np.repeat(Daily, 24))
+    with pytest.raises(TypeError):
+        Grid.at(Cells, {'A': Timestamps['A'].tz_localize(None)})
+
+def test_freezing_rain_sites():
+    Grid = _grid()
+    Cells = Grid.station_cells(_coordinates())
+    Sites = {station: rain_series(seed, n=300, freq='D', start='1995-02-01', gaps=True)
+             for seed, station in enumerate(_coordinates().index)}
+    Output = GriddedCovariates.freezing_rain_sites(Sites, Grid, Cells)
+    Temperature = Grid.sample(Cells)
+    Times = pd.date_range('1995-01-01', periods=len(Temperature), freq='D', name='DateTime')
+    for column, (station, rain_data) in enumerate(Sites.items()):
+        TMax = pd.DataFrame({'TMax': Temperature[:, column]}, index=Times)
+        assert_same(Output[station], RainDataChecks.SubFreezingRain(rain_data, TMax))
+    assert Output['A'].any() and not Output['Outside'].any()
+
+def test_invalid_grids():
+    Values = np.zeros((3, len(Y), len(X)))
+    with pytest.raises(ValueError, match="doesn't match"):
+        GriddedCovariates.CovariateGrid(Values, pd.date_range('2000', periods=4, freq='D'), X, Y)
+    with pytest.raises(ValueError, match="regular"):
+        GriddedCovariates.CovariateGrid(Values, pd.DatetimeIndex(['2000-01-01', '2000-01-02', '2000-01-04']), X, Y)
+    with pytest.raises(ValueError, match="method"):
+        _grid(days=2).station_cells(_coordinates(), method='cubic')
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling the checks with Instrumentation.
+"""
+
+import importlib
+import time
+
+import numpy as np
+import pytest
+
+import BatchChecks
+import Instrumentation
+import RainDataChecks
+from series import rain_series
+
+@pytest.fixture(autouse=True)
+def no_sinks():
+    "Every test starts and ends with profiling off"
+    Instrumentation.disable()
+    yield
+    Instrumentation.disable()
+
+@Instrumentation.instrumented
+def _outer(rain_data):
+    return RainDataChecks.DrySpells(rain_data)
+
+@Instrumentation.instrumented
+def _failing(rain_data):
+    raise ValueError("no rain")
+
+def test_no_events_while_disabled():
+    rain_data = rain_series(0, n=300)
+    Sink = Instrumentation.enable()
+    Expected = RainDataChecks.RepeatedValues(rain_data)
+    Instrumentation.disable(Sink)
+    assert not Instrumentation.enabled()
+    assert RainDataChecks.RepeatedValues(rain_data).equals(Expected)
+    assert len(Sink.events) == 1
+
+def test_events():
+    rain_data = rain_series(0, n=300)
+    with Instrumentation.profiling() as sink, Instrumentation.station('Gauge'):
+        Result = RainDataChecks.RepeatedValues(rain_data)
+    Event, = sink.events
+    assert Event['check'] == 'RepeatedValues'
+    assert Event['station'] == 'Gauge'
+    assert Event['rows'] == len(rain_data)
+    assert Event['wall_seconds'] >= 0 and Event['cpu_seconds'] >= 0
+    assert Event['peak_bytes'] is None and Event['error'] is None and Event['depth'] == 0
+    assert Event['flags'] == {'RepeatedValues': int(np.count_nonzero(Result.RepeatedValues))}
+    assert not Instrumentation.enabled()
+
+def test_memory_and_nested_events():
+    rain_data = rain_series(0, n=300)
+    with Instrumentation.profiling(memory=True) as sink:
+        _outer(rain_data)
+    Inner, Outer = sink.events
+    assert (Inner['check'], Inner['depth']) == ('DrySpells', 1)
+    assert (Outer['check'], Outer['depth']) == ('_outer', 0)
+    assert Outer['peak_bytes'] > 0
+    #Nested calls aren't counted twice
+    assert Instrumentation.summary(sink.events).index.tolist() == ['_outer']
+
+def test_errors_are_recorded_and_raised():
+    with Instrumentation.profiling() as sink:
+        with pytest.raises(ValueError):
+            _failing(rain_series(0, n=10))
+    assert sink.events[0]['error'] == 'ValueError: no rain'
+    assert sink.events[0]['flags'] is None
+
+def test_json_lines_sink_and_summary(tmp_path):
+    Path = str(tmp_path / 'events.jsonl')
+    with Instrumentation.profiling(Instrumentation.JsonLinesSink(Path)):
+        for station in ('A', 'B'):
+            with Instrumentation.station(station):
+                RainDataChecks.DrySpells(rain_series(0, n=2000))
+                RainDataChecks.impossibles(rain_series(1, n=100))
+    Events = Instrumentation.read_events(Path)
+    assert [(event['station'], event['check']) for event in Events] == \
+        [('A', 'DrySpells'), ('A', 'impossibles'), ('B', 'DrySpells'), ('B', 'impossibles')]
+    Summary = Instrumentation.summary(Events, by=['check', 'station'])
+    assert len(Summary) == 4 and (Summary.calls == 1).all()
+    assert Summary.wall_seconds.is_monotonic_decreasing
+    assert Instrumentation.summary(Events, top=1).index.tolist() in (['DrySpells'], ['impossibles'])
+
+def test_batch_worker_events_are_emitted_once():
+    Stations = {f"S{seed}": rain_series(seed, n=300).Rainfall for seed in range(3)}
+    with Instrumentation.profiling() as sink:
+        BatchChecks.run_batch(Stations, ['DrySpells'], executor='process', max_workers=2, chunk_size=1)
+    assert sorted((event['station'], event['check']) for event in sink.events) == \
+        [('S0', 'DrySpells'), ('S1', 'DrySpells'), ('S2', 'DrySpells')]
+
+def test_cpu_time_without_thread_time(monkeypatch):
+    "Python 3.6 has no time.thread_time, so the process CPU time is used"
+    monkeypatch.delattr(time, 'thread_time')
+    try:
+        importlib.reload(Instrumentation)
+        assert Instrumentation._cpu_time is time.process_time
+        with Instrumentation.profiling() as sink:
+            RainDataChecks.DrySpells(rain_series(0, n=300))
+        assert sink.events[0]['cpu_seconds'] >= 0
+    finally:
+        monkeypatch.undo()
+        importlib.reload(Instrumentation)
+    assert Instrumentation._cpu_time is time.thread_time
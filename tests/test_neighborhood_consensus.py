@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+The consensus of the divergences from several neighbouring sites against the
+pairwise neighborhoodDivergence.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ArrayChecks
+import RainDataChecks
+from QuantileSketch import divergence_sketches
+from series import rain_series, assert_same
+
+def _references(tz = None) -> dict:
+    "References with gaps, nan's, and records starting before and after the test"
+    return {f"R{seed}": rain_series(seed, n=1500 + 100 * seed, gaps=seed % 2 == 0, tz=tz,
+                                    start=str(pd.Timestamp("1995-02-25") + pd.Timedelta(days=2 * seed)))
+            for seed in range(1, 6)}
+
+def _expected(TestData, References: dict, flag_ratio: float = 1.0) -> pd.DataFrame:
+    "The consensus from neighborhoodDivergence against each reference in turn"
+    Pairs = {name: RainDataChecks.neighborhoodDivergence(TestData, reference) for name, reference in References.items()}
+    Low = pd.concat({name: pair.LowOutlierData for name, pair in Pairs.items()}, axis=1)
+    High = pd.concat({name: pair.HighOutlierData for name, pair in Pairs.items()}, axis=1)
+    return pd.DataFrame({'Neighbours': High.notna().sum(axis=1),
+                         'MedianLowOutlierData': Low.median(axis=1), 'MedianHighOutlierData': High.median(axis=1),
+                         'LowFlagCount': (Low > flag_ratio).sum(axis=1), 'HighFlagCount': (High > flag_ratio).sum(axis=1)})
+
+@pytest.mark.parametrize('tz', [None, 'Pacific/Auckland'])
+@pytest.mark.parametrize('flag_ratio', [1.0, 2.5])
+def test_against_pairwise_divergence(tz, flag_ratio):
+    TestData = rain_series(0, n=2000, tz=tz)
+    References = _references(tz)
+    Consensus = RainDataChecks.neighborhoodConsensus(TestData, References, flag_ratio=flag_ratio, neighbours=True)
+    assert_same(Consensus[['Neighbours', 'MedianLowOutlierData', 'MedianHighOutlierData', 'LowFlagCount',
+                           'HighFlagCount']], _expected(TestData, References, flag_ratio))
+    for name, reference in References.items():
+        Pair = RainDataChecks.neighborhoodDivergence(TestData, reference)
+        assert_same(Consensus[f'LowOutlierData_{name}'].rename('LowOutlierData'), Pair.LowOutlierData)
+        assert_same(Consensus[f'HighOutlierData_{name}'].rename('HighOutlierData'), Pair.HighOutlierData)
+
+def test_references_on_a_shared_index():
+    TestData = rain_series(0, n=1000)
+    References = {f"R{seed}": rain_series(seed, n=1200, start='1995-02-25') for seed in range(1, 4)}
+    Wide = pd.concat({name: reference.Rainfall for name, reference in References.items()}, axis=1)
+    assert_same(RainDataChecks.neighborhoodConsensus(TestData, Wide, neighbours=True),
+                RainDataChecks.neighborhoodConsensus(TestData, References, neighbours=True))
+
+def test_sketches():
+    "A reference's sketches of its own differences give its exact thresholds"
+    TestData = rain_series(0, n=300)
+    References = {f"R{seed}": rain_series(seed, n=300) for seed in range(1, 4)}
+    Sketches = {'R2': divergence_sketches(TestData.index.asi8, TestData.Rainfall.to_numpy(),
+                                          References['R2'].index.asi8, References['R2'].Rainfall.to_numpy())}
+    assert_same(RainDataChecks.neighborhoodConsensus(TestData, References, sketches=Sketches),
+                RainDataChecks.neighborhoodConsensus(TestData, References))
+
+def test_mixed_timezones():
+    with pytest.raises(TypeError):
+        RainDataChecks.neighborhoodConsensus(rain_series(0, n=100), _references('Pacific/Auckland'))
+
+def test_divergence_consensus():
+    Low = np.array([[0, 0.5, 2], [np.nan, np.nan, np.nan], [1.5, np.nan, 3]])
+    High = np.array([[1.2, 0, 0], [np.nan, np.nan, np.nan], [0, np.nan, 1.1]])
+    Consensus = ArrayChecks.divergence_consensus(Low, High)
+    assert Consensus['Neighbours'].tolist() == [3, 0, 2]
+    np.testing.assert_array_equal(Consensus['MedianLowOutlierData'], [0.5, np.nan, 2.25])
+    np.testing.assert_array_equal(Consensus['MedianHighOutlierData'], [0, np.nan, 0.55])
+    assert Consensus['LowFlagCount'].tolist() == [1, 0, 2]
+    assert Consensus['HighFlagCount'].tolist() == [1, 0, 1]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+The network-wide affinity, rank correlation and reference ranking against the
+pairwise checks.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import NetworkChecks
+import RainDataChecks
+from series import rain_series
+
+def _stations() -> dict:
+    "Stations with nan, gaps, and records that start and end at different times"
+    Stations = {f"S{seed}": rain_series(seed, n=1500 + 7 * seed, gaps=seed % 2 == 1,
+                                        start=f"1995-03-{1 + seed:02d}", nan_fraction=0.05)
+                for seed in range(6)}
+    Stations['Dry'] = Stations['S0'].iloc[:900] * 0
+    return Stations
+
+def test_align_network():
+    Stations = _stations()
+    Network = NetworkChecks.align_network(Stations)
+    for station, rain_data in Stations.items():
+        assert Network.present[station].sum() == len(rain_data)
+        assert Network.present.index[Network.present[station]].equals(rain_data.index)
+        np.testing.assert_array_equal(Network.values.loc[rain_data.index, station], rain_data.Rainfall)
+
+def test_affinity_matrix():
+    "nan at a time stamp a station has is dry, as in affinity()"
+    Stations = _stations()
+    Matrix = NetworkChecks.affinity_matrix(NetworkChecks.align_network(Stations))
+    assert list(Matrix.index) == list(Stations) and list(Matrix.columns) == list(Stations)
+    for test, reference in itertools.product(Stations, repeat=2):
+        assert Matrix.loc[test, reference] == pytest.approx(RainDataChecks.affinity(Stations[test], Stations[reference]),
+                                                           abs=1e-12), (test, reference)
+
+def test_affinity_matrix_of_a_wide_frame():
+    "Every station of a wide DataFrame has every time stamp"
+    Network = pd.concat({station: data.Rainfall for station, data in _stations().items()}, axis=1)
+    Matrix = NetworkChecks.affinity_matrix(Network)
+    for test, reference in itertools.combinations(Network.columns, 2):
+        assert Matrix.loc[test, reference] == pytest.approx(
+            RainDataChecks.affinity(Network[[test]], Network[[reference]]), abs=1e-12)
+
+def test_spearman_matrix_of_complete_records():
+    "With no nan and the same time stamps the ranks of the whole record are those of the pair"
+    Stations = {f"S{seed}": rain_series(seed, n=1001, nan_fraction=0) for seed in range(4)}
+    Matrix = NetworkChecks.spearman_matrix(NetworkChecks.align_network(Stations))
+    for test, reference in itertools.combinations(Stations, 2):
+        assert Matrix.loc[test, reference] == pytest.approx(RainDataChecks.spearman(Stations[test], Stations[reference]))
+
+def test_rank_references():
+    Stations = _stations()
+    Network = NetworkChecks.align_network(Stations)
+    Coordinates = pd.DataFrame({'Easting': np.arange(len(Stations)) * 1000., 'Northing': 0.}, index=list(Stations))
+    References = NetworkChecks.rank_references(Network, Coordinates.drop('S5'), k=2, radius=1500, rank_by='Affinity')
+    #Each station's nearest two within the radius, without the station without coordinates
+    Expected = {'S0': {'S1'}, 'S1': {'S0', 'S2'}, 'S2': {'S1', 'S3'}, 'S3': {'S2', 'S4'}, 'S4': {'S3'}, 'Dry': set()}
+    for station, references in Expected.items():
+        assert set(References.Reference[References.Station == station]) == references
+    for row in References.itertuples():
+        assert row.Affinity == pytest.approx(RainDataChecks.affinity(Stations[row.Station], Stations[row.Reference]))
+        assert row.Distance == abs(Coordinates.Easting[row.Station] - Coordinates.Easting[row.Reference])
+    for _, references in References.groupby('Station'):
+        assert references.Rank.tolist() == list(range(1, len(references) + 1))
+        assert references.Affinity.is_monotonic_decreasing
+
+def test_rank_references_checks_rank_by():
+    Network = NetworkChecks.align_network(_stations())
+    Coordinates = pd.DataFrame({'Easting': 0., 'Northing': 0.}, index=Network.values.columns)
+    with pytest.raises(ValueError):
+        NetworkChecks.rank_references(Network, Coordinates, rank_by='affinity')
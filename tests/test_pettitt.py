@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+The batched Pettitt change point test.
+"""
+
+import numpy as np
+import pytest
+
+import Pettitt
+
+def _pettitt(values: np.ndarray) -> tuple:
+    "The maximum absolute U statistic, and the last position before it, from the sums of signs"
+    n = len(values)
+    U = [np.sign(values[:t + 1, None] - values[None, t + 1:]).sum() for t in range(n - 1)]
+    return np.abs(U).max(), int(np.abs(U).argmax())
+
+def _annual_totals(seed: int, years: int = 30, shift_at: int = 12, shift: float = 1000) -> np.ndarray:
+    "Annual totals with a step up in the mean after shift_at years, by default clear of the noise"
+    Totals = np.random.default_rng(seed).normal(1000, 100, years)
+    Totals[shift_at:] += shift
+    return Totals
+
+@pytest.mark.parametrize('seed', range(5))
+def test_u_statistic(seed):
+    Totals = np.round(_annual_totals(seed, shift=150), -2)
+    Result = Pettitt.pettitt_test(Totals)
+    U, ChangePoint = _pettitt(Totals)
+    assert Result.U[0] == U and Result.change_point[0] == ChangePoint
+    n = len(Totals)
+    assert Result.p[0] == pytest.approx(min(1, 2 * np.exp(-6 * U ** 2 / (n ** 3 + n ** 2))))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_against_pyhomogeneity(seed):
+    hg = pytest.importorskip('pyhomogeneity')
+    Totals = _annual_totals(seed, shift=100 * seed)
+    Expected = hg.pettitt_test(Totals, sim=None)
+    Result = Pettitt.pettitt_test(Totals)
+    assert Result.U[0] == Expected.U
+    assert Result.p[0] == pytest.approx(min(1, Expected.p))
+    assert Result.h[0] == Expected.h
+    #pyhomogeneity gives the position of the first year after the change point
+    assert Result.change_point[0] + 1 == Expected.cp
+
+def test_a_known_change_point():
+    "A step midway is found exactly, as |U| can't exceed the product of the two segments' lengths"
+    Result = Pettitt.pettitt_test(_annual_totals(0, shift_at=15))
+    assert Result.change_point[0] == 14 and Result.U[0] == 15 * 15 and Result.h[0]
+    Result = Pettitt.pettitt_test(_annual_totals(0, shift=0))
+    assert not Result.h[0]
+
+def test_missing_years_are_skipped():
+    Totals = _annual_totals(1)
+    Missing = Totals.copy()
+    Missing[[3, 20, 21]] = np.nan
+    Result = Pettitt.pettitt_test(Missing)
+    Expected = Pettitt.pettitt_test(np.delete(Totals, [3, 20, 21]))
+    assert Result.U[0] == Expected.U[0] and Result.p[0] == Expected.p[0]
+    #The change point is a column of the matrix with the missing years
+    assert Result.change_point[0] == 11 and Expected.change_point[0] == 10
+
+def test_many_stations_at_once():
+    Stations = np.array([_annual_totals(seed, shift=50 * seed, shift_at=5 + seed) for seed in range(8)])
+    Stations[2, :10] = np.nan
+    Stations[5] = np.nan
+    Stations[6, 1:] = np.nan
+    Result = Pettitt.pettitt_test(Stations)
+    for station, totals in enumerate(Stations):
+        Single = Pettitt.pettitt_test(totals)
+        for field in Result._fields:
+            assert getattr(Result, field)[station] == getattr(Single, field)[0], (station, field)
+    #Stations with fewer than two years aren't tested
+    assert Result.change_point[[5, 6]].tolist() == [-1, -1] and Result.p[[5, 6]].tolist() == [1, 1]
+
+def test_permutations():
+    Stations = np.array([_annual_totals(seed, shift=100 * seed) for seed in range(4)])
+    Result = Pettitt.pettitt_test(Stations, permutations=2000, seed=1)
+    Again = Pettitt.pettitt_test(Stations, permutations=2000, seed=1, max_workers=2)
+    np.testing.assert_array_equal(Result.p, Again.p)
+    #Pettitt's approximation is conservative, but both find the same stations inhomogeneous
+    assert Result.h.tolist() == Pettitt.pettitt_test(Stations).h.tolist() == [False, False, True, True]
+    assert Result.p.min() >= 1 / 2001
+
+@pytest.mark.parametrize('shifts, expected', [
+    ({}, 0),
+    ({16: 1000}, 16),
+    ({8: 1000, 20: -1500}, 20),
+    ])
+def test_homogeneous_start(shifts, expected):
+    Totals = np.random.default_rng(3).normal(1000, 50, 32)
+    for year, shift in shifts.items():
+        Totals[year:] += shift
+    assert Pettitt.homogeneous_start(Totals)[0] == expected
+
+def test_homogeneous_start_of_many_stations():
+    "Each station steps up midway through its record, and the noise repeats so no chance change point follows"
+    Noise = np.resize([40, -30, 10, -50, 20, -10], 24)
+    Stations = np.full((7, 24), np.nan)
+    for station, shift_at in enumerate(range(8, 13)):
+        Stations[station, :2 * shift_at] = 1000 + Noise[:2 * shift_at]
+        Stations[station, shift_at:2 * shift_at] += 1000
+    Stations[5, :20] = 1000 + Noise[:20]
+    Starts = Pettitt.homogeneous_start(Stations)
+    assert Starts.tolist() == [8, 9, 10, 11, 12, 0, 0]
+    assert Starts.tolist() == [Pettitt.homogeneous_start(totals)[0] for totals in Stations]
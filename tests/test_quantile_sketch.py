@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+The mergeable quantile sketches and the thresholds taken from them.
+"""
+
+import numpy as np
+import pytest
+
+import RainDataChecks
+from QuantileSketch import QuantileSketch, outlier_sketch, divergence_sketches
+from series import rain_series, assert_same
+
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 0.999]
+
+def _rank_error(values: np.ndarray, sketch: QuantileSketch) -> np.ndarray:
+    "The distance, as a fraction of the values, between each quantile's rank and the rank of its estimate"
+    Sorted = np.sort(values)
+    Estimates = sketch.quantile(QUANTILES)
+    Ranks = (np.searchsorted(Sorted, Estimates, 'left') + np.searchsorted(Sorted, Estimates, 'right')) / 2
+    return np.abs(Ranks / len(values) - QUANTILES)
+
+def test_few_values_are_exact():
+    Values = np.random.default_rng(0).gamma(0.6, 3, 60)
+    Sketch = QuantileSketch.from_values(np.append(Values, np.nan))
+    assert Sketch.count == 60 and len(Sketch.means) == 60
+    np.testing.assert_allclose(Sketch.quantile(QUANTILES), np.quantile(Values, QUANTILES))
+    assert Sketch.quantile(0) == Values.min() and Sketch.quantile(1) == Values.max()
+
+def test_rank_error_bound():
+    Values = np.random.default_rng(1).gamma(0.6, 3, 200000)
+    Sketch = QuantileSketch.from_values(Values)
+    assert len(Sketch.means) <= Sketch.compression
+    Bound = 2 * np.pi * np.sqrt(np.multiply(QUANTILES, np.subtract(1, QUANTILES))) / Sketch.compression
+    assert (_rank_error(Values, Sketch) <= Bound).all()
+
+def test_merged_chunks():
+    "Sketches of chunks, added to or merged, are about the sketch of the whole"
+    Values = np.random.default_rng(2).lognormal(0, 1, 100000)
+    Chunks = np.array_split(Values, 7)
+    Merged = QuantileSketch.from_values(Chunks[0]).merge(*[QuantileSketch.from_values(chunk) for chunk in Chunks[1:]])
+    Added = QuantileSketch()
+    for chunk in Chunks:
+        Added.add(chunk)
+    for sketch in (Merged, Added):
+        assert sketch.count == len(Values)
+        assert sketch.minimum == Values.min() and sketch.maximum == Values.max()
+        assert (_rank_error(Values, sketch) < 0.005).all()
+
+def test_from_counts():
+    "As when _ValueCounts has too many distinct values to keep, each occurring a few times"
+    rng = np.random.default_rng(4)
+    Values, Counts = rng.normal(size=50000), rng.integers(0, 4, 50000)
+    Sketch = QuantileSketch.from_counts(np.append(Values, np.nan), np.append(Counts, 3))
+    Repeated = np.repeat(Values, Counts)
+    assert Sketch.count == len(Repeated) and Sketch.maximum == Repeated.max()
+    assert (_rank_error(Repeated, Sketch) < 0.005).all()
+
+def test_empty():
+    Sketch = QuantileSketch.from_values([np.nan])
+    assert Sketch.count == 0 and np.isnan(Sketch.quantile(0.5))
+    assert np.isnan(Sketch.quantile([0.5, 0.9])).all()
+    Merged = Sketch.merge(QuantileSketch.from_values([1.0, 2.0]))
+    assert Merged.quantile(0.5) == 1.5
+    assert QuantileSketch.from_json(Sketch.to_json()).count == 0
+
+def test_json_round_trip():
+    Sketch = QuantileSketch.from_values(np.random.default_rng(3).normal(size=5000), compression=50)
+    Restored = QuantileSketch.from_json(Sketch.to_json())
+    assert repr(Restored) == repr(Sketch) and Restored.compression == 50
+    np.testing.assert_array_equal(Restored.quantile(QUANTILES), Sketch.quantile(QUANTILES))
+    assert repr(QuantileSketch.from_values([1.0, 2.0])) != repr(QuantileSketch.from_values([1.0, 3.0]))
+
+def test_rain_outliers_with_a_sketch():
+    "A sketch of the record's own rain gives the check's exact threshold while it keeps every value"
+    rain_data = rain_series(0, n=400, freq='D')
+    assert_same(RainDataChecks.rain_outliers(rain_data, sketch=outlier_sketch(rain_data)),
+                RainDataChecks.rain_outliers(rain_data))
+
+def test_divergence_sketches():
+    Test, Reference = rain_series(4, n=300), rain_series(5, n=300)
+    Low, High = divergence_sketches(Test.index.asi8, Test.Rainfall.to_numpy(), Reference.index.asi8,
+                                    Reference.Rainfall.to_numpy())
+    Differences = (Test.Rainfall - Reference.Rainfall).dropna()
+    assert Low.count == (Differences < 0).sum() and High.count == (Differences > 0).sum()
+    assert Low.maximum < 0 < High.minimum
+    assert_same(RainDataChecks.neighborhoodDivergence(Test, Reference, sketches=(Low, High)),
+                RainDataChecks.neighborhoodDivergence(Test, Reference))
+
+@pytest.mark.parametrize('compression', [20, 100])
+def test_compression_limits_the_centroids(compression):
+    Sketch = QuantileSketch.from_values(np.arange(10000.), compression)
+    assert len(Sketch.means) <= compression / 2 + 1
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+The RainDataChecks wrappers over the array-level core, against the pandas
+implementations they replaced.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ArrayChecks
+import RainDataChecks
+import baseline_checks
+from series import CASES, rain_series, tip_series, assert_same
+
+@pytest.fixture(autouse=True)
+def quiet_baseline():
+    "The baseline uses pandas features that are now deprecated"
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+@pytest.fixture(params=list(CASES), ids=list(CASES))
+def case(request):
+    "A test and a reference series, which are offset and overlap for most of their records"
+    Seed = list(CASES).index(request.param)
+    Test = rain_series(Seed, **CASES[request.param])
+    Reference = rain_series(Seed + 100, **CASES[request.param])
+    return Test, Reference.iloc[len(Reference) // 10:]
+
+@pytest.mark.parametrize('check', ['rain_outliers', 'impossibles', 'DateTimeIssues', 'DrySpells', 'RepeatedValues'])
+def test_single_series(case, check):
+    rain_data, _ = case
+    assert_same(getattr(RainDataChecks, check)(rain_data), getattr(baseline_checks, check)(rain_data))
+
+def test_impossibles_of_objects(case):
+    rain_data, _ = case
+    Objects = rain_data.astype(object)
+    Objects.iloc[::13, 0] = 'missing'
+    Objects.iloc[::29, 0] = -0.4
+    assert_same(RainDataChecks.impossibles(Objects), baseline_checks.impossibles(Objects))
+
+def test_impossibles_precision():
+    Values = np.array([0.2, 0.4, 0.6, 0.3, 1e3, -0.2, np.nan, np.inf, 2.2000001], dtype=object)
+    Values = np.append(Values, ['1.2', 'x', None])
+    Expected = [False, False, False, True, False, True, False, True, True, False, True, False]
+    assert ArrayChecks.impossible(Values, 0.2).tolist() == Expected
+    assert ArrayChecks.impossible(Values[:9].astype(float), 0.2).tolist() == Expected[:9]
+
+def test_duplicate_date_times(case):
+    rain_data, _ = case
+    Shuffled = rain_data.iloc[np.random.default_rng(0).integers(0, len(rain_data), len(rain_data))]
+    assert_same(RainDataChecks.DateTimeIssues(Shuffled), baseline_checks.DateTimeIssues(Shuffled))
+
+@pytest.mark.parametrize('seed', range(4))
+def test_high_frequency_tipping(seed):
+    #The baseline only marks the first burst
+    rain_data = tip_series(seed, bursts=1)
+    assert_same(RainDataChecks.HighFrequencyTipping(rain_data), baseline_checks.HighFrequencyTipping(rain_data))
+
+def test_homogeneity_of_short_records():
+    #The baseline imports pyhomogeneity before looking at the record
+    pytest.importorskip('pyhomogeneity')
+    rain_data = rain_series(0, n=99, freq='D')
+    assert_same(RainDataChecks.Homogeneity(rain_data), baseline_checks.Homogeneity(rain_data))
+
+def test_homogeneity_finds_a_change():
+    rain_data = rain_series(1, n=20 * 365, freq='D', nan_fraction=0.01, dry_spells=False)
+    rain_data.iloc[:len(rain_data) // 2] *= 3
+    Homogeneous = RainDataChecks.Homogeneity(rain_data).Homogeneous.to_numpy()
+    assert not Homogeneous[:len(rain_data) // 2 - 366].any()
+    assert Homogeneous[len(rain_data) // 2 + 366:].all()
+
+def test_sub_freezing_rain(case):
+    rain_data, reference = case
+    Temperature = pd.DataFrame({'TMax': np.random.default_rng(0).normal(2, 5, len(reference))}, index=reference.index)
+    assert_same(RainDataChecks.SubFreezingRain(rain_data, Temperature),
+                baseline_checks.SubFreezingRain(rain_data, Temperature))
+    Regular = pd.DataFrame({'TMax': np.random.default_rng(1).normal(2, 5, len(rain_data))},
+                           index=pd.date_range(rain_data.index[0], periods=len(rain_data), freq=rain_data.index[1] - rain_data.index[0]))
+    assert_same(RainDataChecks.SubFreezingRain(rain_data, Regular), baseline_checks.SubFreezingRain(rain_data, Regular))
+
+def _hourly(rain_data) -> bool:
+    "Whether the baseline's fixed 360 observations make a complete 15 day window"
+    return rain_data.index[1] - rain_data.index[0] == pd.Timedelta('1h')
+
+@pytest.mark.parametrize('check', ['affinity', 'spearman', 'neighborhoodDivergence', 'DrySpellDivergence'])
+def test_pairwise(case, check):
+    rain_data, reference = case
+    if check == 'DrySpellDivergence' and not _hourly(rain_data):
+        pytest.skip("The baseline's complete window is of hourly data")
+    assert_same(getattr(RainDataChecks, check)(rain_data, reference), getattr(baseline_checks, check)(rain_data, reference))
+
+def test_dry_spell_divergence_of_offset_grids():
+    "Sites on the hour and on the half hour each need their own 360 observations in a window"
+    rain_data = rain_series(0, nan_fraction=0)
+    reference = rain_series(1, nan_fraction=0, start='1995-03-01 00:30')
+    Divergence = RainDataChecks.DrySpellDivergence(rain_data, reference)
+    assert Divergence.notna().any()
+    assert_same(Divergence, baseline_checks.DrySpellDivergence(rain_data, reference))
+
+def test_station_pair(case):
+    "Running every pairwise check on one StationPair gives the same as running each alone"
+    rain_data, reference = case
+    Results = RainDataChecks.StationPair(rain_data, reference).all_checks()
+    for check, result in Results.items():
+        if check != 'DrySpellDivergence' or _hourly(rain_data):
+            assert_same(result, getattr(baseline_checks, check)(rain_data, reference))
+
+def test_time_step_alignment(case):
+    rain_data, reference = case
+    Observations = rain_data.iloc[::3]
+    #The baseline index is a string of each time stamp
+    assert_same(RainDataChecks.TimeStepAllignment(Observations, reference),
+                baseline_checks.TimeStepAllignment(Observations, reference).to_numpy())
+
+def test_time_step_alignment_rejects_repeated_time_stamps():
+    rain_data = rain_series(0, n=10)
+    with pytest.raises(ValueError):
+        RainDataChecks.TimeStepAllignment(rain_data, rain_data.iloc[[0, 0, 1]])
+    with pytest.raises(ValueError):
+        RainDataChecks.TimeStepAllignment(rain_data, {'both': pd.concat([rain_data, rain_data], axis=1)})
+
+def test_array_inputs(case):
+    "The core takes NumPy arrays of int64 time stamps and values, and gives the same as the wrappers"
+    rain_data, reference = case
+    Times, Values = rain_data.index.asi8, rain_data.Rainfall.to_numpy()
+    assert_same(ArrayChecks.dry_spell_day_lengths(Times, Values), RainDataChecks.DrySpells(rain_data))
+    assert_same(ArrayChecks.repeated_values(Values), RainDataChecks.RepeatedValues(rain_data))
+    assert ArrayChecks.affinity(Times, Values, reference.index.asi8, reference.Rainfall.to_numpy()) == \
+        RainDataChecks.affinity(rain_data, reference)
+
+def test_arrow_inputs(case):
+    pa = pytest.importorskip('pyarrow')
+    rain_data, _ = case
+    Values = pa.array(rain_data.Rainfall.to_numpy(), from_pandas=True)
+    assert_same(ArrayChecks.impossible(Values), RainDataChecks.impossibles(rain_data))
+    assert_same(ArrayChecks.repeated_values(Values), RainDataChecks.RepeatedValues(rain_data))
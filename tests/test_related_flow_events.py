@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+RelatedFlowEvents, its event grouping, and CatchmentRelatedFlowEvents.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ArrayChecks
+import RainDataChecks
+import baseline_checks
+from series import storm_series, assert_same
+
+@pytest.fixture(autouse=True)
+def quiet_baseline():
+    "The baseline uses pandas and scipy features that are now deprecated"
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+def _hours(*hours) -> np.ndarray:
+    return (np.array(hours, dtype=np.int64) * 3600 * 10**9)
+
+@pytest.mark.parametrize('hours, starts', [
+    #The first hour of each storm after a long gap is an event, and the rest of the storm another
+    ((0, 1, 2, 3, 50, 51, 52), [0, 1, 4, 5]),
+    #Isolated hours are each an event, unless their rounded gaps repeat
+    ((0, 30, 100, 160), [0, 1, 2, 3]),
+    ((0, 24, 48, 72), [0, 1]),
+    #Gaps of a half of event_gap round to the even multiple, 6 hours to 0 and 18 hours to 24
+    ((0, 6, 12, 30, 48), [0, 1, 3]),
+    ((5,), [0]),
+    ((), []),
+    ])
+def test_rain_events(hours, starts):
+    assert ArrayChecks._rain_events(_hours(*hours)).tolist() == starts
+
+def test_rain_events_match_the_baseline_grouping():
+    "The baseline groups on runs of equal time differences rounded to 12 hours"
+    Times = np.sort(np.random.default_rng(0).choice(2000, 300, replace=False))
+    HighRain = pd.Series(Times, index=pd.DatetimeIndex(_hours(*Times), name='DateTime'))
+    Rounded = HighRain.index.to_series().diff().dt.round('12H')
+    Groups = (Rounded != Rounded.shift()).cumsum().to_numpy()
+    Expected = np.flatnonzero(np.diff(Groups, prepend=0))
+    assert ArrayChecks._rain_events(_hours(*Times)).tolist() == Expected.tolist()
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('storm_hours', [1, 6])
+def test_related_flow_events(seed, storm_hours):
+    "The baseline's random sample of up to 10,000 hours is every hour of a shorter record, so it is exact"
+    rain_data, flow = storm_series(seed, storm_hours=storm_hours)
+    Result = RainDataChecks.RelatedFlowEvents(rain_data, flow)
+    assert Result.notna().all()
+    assert_same(Result, baseline_checks.RelatedFlowEvents(rain_data, flow))
+
+@pytest.mark.parametrize('storms, seed', [(3, 3), (4, 3), (5, 0), (6, 2)])
+def test_related_flow_events_of_few_storms(storms, seed):
+    "With few storms of several hours, counting each as one event would leave the test short of significance"
+    rain_data, flow = storm_series(seed, days=120, storms=storms)
+    Result = RainDataChecks.RelatedFlowEvents(rain_data, flow)
+    assert Result.notna().all()
+    assert_same(Result, baseline_checks.RelatedFlowEvents(rain_data, flow))
+
+def test_unrelated_flow_events():
+    rain_data, _ = storm_series(0)
+    _, flow = storm_series(1)
+    Result = RainDataChecks.RelatedFlowEvents(rain_data, flow)
+    assert Result.isna().all()
+    assert_same(Result, baseline_checks.RelatedFlowEvents(rain_data, flow))
+
+def test_related_flow_events_are_reproducible():
+    rain_data, flow = storm_series(2, days=600, storms=40)
+    First = RainDataChecks.RelatedFlowEvents(rain_data, flow)
+    assert First.notna().all()
+    pd.testing.assert_series_equal(First, RainDataChecks.RelatedFlowEvents(rain_data, flow))
+
+def test_related_flow_events_of_an_irregular_grid():
+    "Peaks fill a day at the typical time step, not at that of the first two time stamps"
+    rain_data, flow = storm_series(3)
+    Irregular = pd.concat([rain_data, pd.DataFrame({'Rainfall': [np.nan]}, index=rain_data.index[:1] + pd.Timedelta('10min'))])
+    Irregular = Irregular.sort_index().rename_axis('DateTime')
+    Result = RainDataChecks.RelatedFlowEvents(Irregular, flow)
+    assert_same(Result.drop(Irregular.index[1]), RainDataChecks.RelatedFlowEvents(rain_data, flow))
+
+def test_catchment_related_flow_events(monkeypatch):
+    Gauges, Sites = {}, {}
+    for seed in range(3):
+        Gauges[f"G{seed}"], Sites[f"F{seed}"] = storm_series(seed)
+    FlowPeaks = RainDataChecks._flow_peaks
+    Calls = []
+    def flow_peaks(data, *args, **kwargs):
+        Calls.append(data)
+        return FlowPeaks(data, *args, **kwargs)
+    monkeypatch.setattr(RainDataChecks, '_flow_peaks', flow_peaks)
+
+    Result = RainDataChecks.CatchmentRelatedFlowEvents(Gauges, Sites)
+    #Each flow site's peaks are found once for all the gauges
+    assert len(Calls) == len(Sites)
+    assert list(Result.columns) == [(gauge, site) for gauge in Gauges for site in Sites]
+    for gauge, site in Result.columns:
+        assert_same(Result[(gauge, site)], RainDataChecks.RelatedFlowEvents(Gauges[gauge], Sites[site]))
+
+    Pairs = [('G0', 'F0'), ('G2', 'F0'), ('G1', 'F1')]
+    Result = RainDataChecks.CatchmentRelatedFlowEvents(Gauges, Sites, pairs=Pairs)
+    assert list(Result.columns) == Pairs
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+The run-length encoding shared by the run based checks.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from RunLengths import run_length_encode, per_observation
+
+def _runs(values) -> list:
+    "The (start, end, length, value) of each run, by itertools.groupby with nan's equal"
+    Runs, Start = [], 0
+    for _, group in itertools.groupby(values, key=lambda value: 'nan' if value != value else value):
+        Length = len(list(group))
+        Runs.append((Start, Start + Length - 1, Length, values[Start]))
+        Start += Length
+    return Runs
+
+@pytest.mark.parametrize('values', [
+    [0.0, 0, 0.2, 0.2, np.nan, np.nan, 0, np.nan, 1, 1, 1],
+    [np.nan],
+    [3, 3, 1, 2, 2, 2],
+    [True, True, False, True],
+    np.array([0.2, None, None, 'x', 'x', 0.2, np.nan, np.nan], dtype=object),
+    ])
+def test_run_length_encode(values):
+    Runs = run_length_encode(values)
+    Expected = _runs(list(values))
+    assert Runs.starts.tolist() == [run[0] for run in Expected]
+    assert Runs.ends.tolist() == [run[1] for run in Expected]
+    assert Runs.lengths.tolist() == [run[2] for run in Expected]
+    for value, run in zip(Runs.values, Expected):
+        assert value == run[3] or (value != value and run[3] != run[3])
+
+def test_random_runs():
+    Values = np.random.default_rng(0).choice([0, 0.2, 0.4, np.nan], 5000, p=[0.6, 0.2, 0.1, 0.1])
+    Runs = run_length_encode(Values)
+    assert Runs.lengths.sum() == len(Values)
+    np.testing.assert_array_equal(per_observation(Runs, Runs.values), Values)
+    np.testing.assert_array_equal(per_observation(Runs, Runs.lengths), np.repeat(Runs.lengths, Runs.lengths))
+
+def test_empty_and_2d():
+    Runs = run_length_encode(np.zeros(0))
+    assert len(Runs.starts) == len(Runs.values) == 0
+    assert run_length_encode(np.array([[1.0], [1.0], [2.0]])).lengths.tolist() == [2, 1]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+The cached description of an index's time stamps.
+"""
+
+import gc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import TimeBase
+from series import rain_series, tip_series
+
+HOUR = 3600 * 10**9
+
+def test_regular_grid():
+    Index = rain_series(0, tz='Pacific/Auckland').index
+    Base = TimeBase.analyse(Index.asi8, Index.tz)
+    assert Base.regular and Base.step == HOUR and Base.length == len(Index)
+    assert Base.start == Index.asi8[0] and len(Base.gaps) == 0 and Base.tz == Index.tz
+
+def test_gaps():
+    Index = rain_series(0, gaps=True).index
+    Base = TimeBase.analyse(Index.asi8)
+    assert not Base.regular and Base.step == HOUR
+    np.testing.assert_array_equal(Base.gaps, np.flatnonzero(np.diff(Index.asi8) != HOUR))
+
+def test_irregular_tips():
+    Times = tip_series(0).index.asi8
+    Base = TimeBase.analyse(Times)
+    assert not Base.regular and Base.step == int(np.median(np.diff(Times)))
+
+@pytest.mark.parametrize('times', [[], [10**18], [10**18, 10**18]])
+def test_short_and_repeated_time_stamps_are_not_regular(times):
+    Base = TimeBase.analyse(np.array(times, dtype=np.int64))
+    assert not Base.regular and Base.length == len(times)
+
+def test_positions():
+    Index = pd.date_range('2000', periods=48, freq='h')
+    Base = TimeBase.analyse(Index.asi8)
+    Times = np.concatenate([Index.asi8[[0, 5, 47]], Index.asi8[[0, 47]] + [-HOUR, HOUR], Index.asi8[[3]] + 1])
+    assert Base.positions(Times).tolist() == [0, 5, 47, -1, -1, -1]
+
+def test_first_positions_at_or_after():
+    Index = pd.date_range('2000', periods=48, freq='h')
+    Base = TimeBase.analyse(Index.asi8)
+    Times = np.concatenate([Index.asi8, Index.asi8 + 1, Index.asi8 - 1, Index.asi8[[0]] - 10 * HOUR,
+                            Index.asi8[[-1]] + 10 * HOUR])
+    np.testing.assert_array_equal(Base.first_positions_at_or_after(Times), Index.asi8.searchsorted(Times))
+
+def test_time_base_is_kept_with_the_index():
+    Index = rain_series(1).index
+    Base = TimeBase.time_base(Index)
+    assert TimeBase.time_base(Index) is Base
+    #A copy is a different index, with its own entry
+    Copy = Index.copy()
+    assert TimeBase.time_base(Copy) is not Base and TimeBase.time_base(Copy)[:4] == Base[:4]
+    Key = id(Index)
+    del Index, Copy
+    gc.collect()
+    assert Key not in TimeBase._TIME_BASES
+
+def test_time_base_of_a_reused_id():
+    "An entry for an index that has gone isn't returned for a new index with the same id"
+    Index = pd.date_range('2000', periods=10, freq='h')
+    Base = TimeBase.time_base(Index)
+    Other = pd.date_range('2000', periods=10, freq='D')
+    TimeBase._TIME_BASES[id(Other)] = TimeBase._TIME_BASES[id(Index)]
+    assert TimeBase.time_base(Other).step == 24 * HOUR
+    assert TimeBase.time_base(Index) is Base